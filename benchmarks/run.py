@@ -0,0 +1,380 @@
+"""
+Runs the ``stk`` benchmarks and writes the results to a JSON file.
+
+Usage
+-----
+
+.. code-block:: bash
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py --quick -o new.json --compare results.json
+
+No network access, licenses or external programs are needed.
+
+Each benchmark is run :data:`REPEATS` times and the fastest time is
+kept. It is then run once more with :mod:`tracemalloc` enabled, to
+find the peak memory allocated by Python during the benchmark. Memory
+allocated by ``rdkit`` and by worker processes is not included.
+
+"""
+
+import argparse
+import copy
+import gc
+import inspect
+import json
+import os
+import platform
+import subprocess as sp
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import stk
+from stk.molecular.topologies.cage import (two_plus_three,
+                                           two_plus_four,
+                                           three_plus_three,
+                                           three_plus_four)
+
+
+REPEATS = 3
+
+
+def building_blocks():
+    """
+    Returns the building blocks used by the benchmarks.
+
+    Returns
+    -------
+    :class:`dict`
+        Maps a name to each building block.
+
+    """
+
+    return {
+        'amine2': stk.StructUnit2.smiles_init('NCCCN', 'amine'),
+        'amine3': stk.StructUnit3.smiles_init('NCC(CN)CN', 'amine'),
+        'amine4': stk.StructUnit3.smiles_init('NCC(CN)(CN)CN', 'amine'),
+        'aldehyde2': stk.StructUnit2.smiles_init('O=CCC=O', 'aldehyde'),
+        'aldehyde3': stk.StructUnit3.smiles_init('O=CC(C=O)C=O',
+                                                 'aldehyde'),
+        'aldehyde4': stk.StructUnit3.smiles_init('O=CC(C=O)(C=O)C=O',
+                                                 'aldehyde'),
+        'aldehyde6': stk.StructUnit3.smiles_init(
+                                'O=CC(C=O)(C=O)C(C=O)(C=O)C=O',
+                                'aldehyde')
+    }
+
+
+def import_benchmarks():
+    """
+    Yields a benchmark for importing ``stk`` in a new interpreter.
+
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+
+    def import_stk():
+        sp.run([sys.executable, '-c', 'import stk'], env=env, check=True)
+
+    yield 'import.stk', import_stk
+
+
+def cage_benchmarks(bbs):
+    """
+    Yields a benchmark for building each cage topology.
+
+    """
+
+    # The building blocks used with the topologies in each module.
+    modules = {
+        two_plus_three: ('amine2', 'aldehyde3'),
+        two_plus_four: ('aldehyde2', 'amine4'),
+        three_plus_three: ('aldehyde3', 'amine3'),
+        three_plus_four: ('aldehyde3', 'amine4')
+    }
+    for module, names in modules.items():
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            cage_bbs = [bbs[bb] for bb in names]
+            yield (f'build.cage.{name}',
+                   lambda cls=cls, cage_bbs=cage_bbs:
+                   stk.Cage(cage_bbs, cls()))
+
+
+def cof_benchmarks(bbs):
+    """
+    Yields a benchmark for building each COF lattice.
+
+    """
+
+    lattices = {
+        'Honeycomb': ('amine2', 'aldehyde3'),
+        'Hexagonal': ('amine2', 'aldehyde6'),
+        'Square': ('amine2', 'aldehyde4'),
+        'Kagome': ('amine2', 'aldehyde4')
+    }
+    for name, names in lattices.items():
+        cof_bbs = [bbs[bb] for bb in names]
+        cls = getattr(stk, name)
+        yield (f'build.cof.{name}',
+               lambda cls=cls, cof_bbs=cof_bbs:
+               stk.Periodic(cof_bbs, cls()))
+
+
+def polymer_benchmarks(bbs, lengths):
+    """
+    Yields a benchmark for building linear polymers of each length.
+
+    """
+
+    for n in lengths:
+        yield (f'build.linear.{n}',
+               lambda n=n: stk.Polymer([bbs['amine2'], bbs['aldehyde2']],
+                                       stk.Linear('AB', [0, 0], n)))
+
+
+def geometry_benchmarks(bbs):
+    """
+    Yields a benchmark for each geometry descriptor of a cage.
+
+    """
+
+    cage = stk.Cage([bbs['amine2'], bbs['aldehyde3']],
+                    stk.FourPlusSix())
+    yield 'geometry.cavity_size', cage.cavity_size
+    yield 'geometry.max_diameter', cage.max_diameter
+    yield 'geometry.windows', cage.windows
+
+
+def population_benchmarks(bbs, sizes, tmp_dir):
+    """
+    Yields benchmarks of :class:`.Population` operations.
+
+    """
+
+    base = [bbs['amine2'], bbs['aldehyde2'], bbs['aldehyde3']]
+    for size in sizes:
+        # Copies share their rdkit molecules, so large populations
+        # can be made quickly.
+        members = [copy.copy(base[i % len(base)]) for i in range(size)]
+        pop = stk.Population(*members)
+        # Check membership of molecules spread throughout the
+        # population.
+        queries = members[::max(size // 100, 1)]
+        path = os.path.join(tmp_dir, f'population_{size}.json')
+
+        def remove_duplicates(members=members):
+            stk.Population(*members).remove_duplicates(
+                                            key=lambda mol: mol.key)
+
+        def remove_structural_duplicates(members=members):
+            stk.Population(*members).remove_duplicates(key='structure')
+
+        def dump(pop=pop, path=path):
+            pop.dump(path)
+
+        def load(path=path):
+            stk.Population.load(path, stk.Molecule.from_dict)
+
+        jsonl_path = os.path.join(tmp_dir, f'population_{size}.jsonl')
+
+        def dump_jsonl(pop=pop, path=jsonl_path):
+            pop.dump_jsonl(path)
+
+        def load_jsonl(path=jsonl_path):
+            stk.Population.load_jsonl(path, stk.Molecule.from_dict)
+
+        yield f'population.{size}.remove_duplicates', remove_duplicates
+        yield (f'population.{size}.remove_duplicates_structure',
+               remove_structural_duplicates)
+        yield (f'population.{size}.contains',
+               lambda pop=pop, queries=queries:
+               [mol in pop for mol in queries])
+        archive_path = os.path.join(tmp_dir, f'archive_{size}')
+
+        def dump_archive(pop=pop, path=archive_path):
+            pop.dump_archive(path)
+
+        def iter_archive(path=archive_path):
+            for _ in stk.Population.iter_archive(path,
+                                                 stk.Molecule.from_dict):
+                pass
+
+        yield f'population.{size}.dump', dump
+        pop.dump(path)
+        yield f'population.{size}.load', load
+        yield f'population.{size}.dump_jsonl', dump_jsonl
+        pop.dump_jsonl(jsonl_path)
+        yield f'population.{size}.load_jsonl', load_jsonl
+        yield f'population.{size}.dump_archive', dump_archive
+        pop.dump_archive(archive_path)
+        yield f'population.{size}.iter_archive', iter_archive
+
+
+def optimize_benchmarks(bbs, sizes, processes):
+    """
+    Yields benchmarks of parallel optimization with a fake optimizer.
+
+    """
+
+    func_data = stk.FunctionData('do_not_optimize')
+    for size in sizes:
+        members = [copy.copy(bbs['amine2']) for _ in range(size)]
+
+        def optimize(members=members):
+            for mol in members:
+                mol.optimized = False
+            stk.Population(*members).optimize(func_data,
+                                              processes=processes)
+
+        yield f'optimize.{size}', optimize
+
+
+def measure(func):
+    """
+    Measures the time and peak memory taken by `func`.
+
+    Parameters
+    ----------
+    func : :class:`callable`
+        The benchmark.
+
+    Returns
+    -------
+    :class:`dict`
+        The fastest time in ``'seconds'``, the number of
+        ``'repeats'`` and the ``'peak_memory'`` in bytes.
+
+    """
+
+    times = []
+    for _ in range(REPEATS):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'repeats': REPEATS, 'peak_memory': peak}
+
+
+def commit():
+    """
+    Returns the git commit of ``stk`` being benchmarked.
+
+    """
+
+    try:
+        return sp.run(['git', 'rev-parse', 'HEAD'],
+                      cwd=os.path.dirname(os.path.abspath(__file__)),
+                      stdout=sp.PIPE,
+                      stderr=sp.DEVNULL,
+                      universal_newlines=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, path):
+    """
+    Prints how the times in `results` compare to those in `path`.
+
+    """
+
+    with open(path, 'r') as f:
+        old = json.load(f)['benchmarks']
+
+    print(f'\n{"benchmark":<45} {"old (s)":>10} {"new (s)":>10} '
+          f'{"ratio":>7}')
+    for name, result in results.items():
+        if 'seconds' not in result or 'seconds' not in old.get(name, {}):
+            continue
+        old_time = old[name]['seconds']
+        ratio = result['seconds'] / old_time if old_time else float('nan')
+        print(f'{name:<45} {old_time:>10.4f} '
+              f'{result["seconds"]:>10.4f} {ratio:>7.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-o', '--output', default='benchmarks.json',
+                        help='The JSON file the results are written to.')
+    parser.add_argument('--quick', action='store_true',
+                        help='Use small populations and polymers.')
+    parser.add_argument('--filter', default='',
+                        help='Only run benchmarks whose names contain '
+                             'this string.')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='The number of processes used by the '
+                             'optimize benchmarks.')
+    parser.add_argument('--compare',
+                        help='A previous results file to compare to.')
+    args = parser.parse_args()
+
+    # Every build should be timed, not looked up in the cache.
+    stk.OPTIONS['cache'] = False
+
+    if args.quick:
+        lengths = [1, 5]
+        population_sizes = [100, 1000]
+        optimize_sizes = [10]
+    else:
+        lengths = [1, 5, 10, 20]
+        population_sizes = [1000, 10000, 100000]
+        optimize_sizes = [100, 1000]
+
+    bbs = building_blocks()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmarks = [
+            import_benchmarks(),
+            cage_benchmarks(bbs),
+            cof_benchmarks(bbs),
+            polymer_benchmarks(bbs, lengths),
+            geometry_benchmarks(bbs),
+            population_benchmarks(bbs, population_sizes, tmp_dir),
+            optimize_benchmarks(bbs, optimize_sizes, args.processes)
+        ]
+        for suite in benchmarks:
+            for name, func in suite:
+                if args.filter not in name:
+                    continue
+                try:
+                    results[name] = measure(func)
+                except Exception as ex:
+                    # A missing optional dependency should not stop
+                    # the other benchmarks from running.
+                    results[name] = {'error': f'{type(ex).__name__}: {ex}'}
+                    print(f'{name:<45} failed: {results[name]["error"]}',
+                          flush=True)
+                    continue
+                print(f'{name:<45} {results[name]["seconds"]:>10.4f} s '
+                      f'{results[name]["peak_memory"]/1e6:>10.2f} MB',
+                      flush=True)
+
+    report = {
+        'commit': commit(),
+        'date': datetime.now().isoformat(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'benchmarks': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,9 +14,7 @@ setup(name='stk',
       install_requires=['networkx',
                         'scipy',
                         'matplotlib',
-                        'scikit-learn',
-                        'psutil',
                         'pywindowx==0.0.1',
                         'pandas',
                         'seaborn'],
-      python_requires='>=3.6')
+      python_requires='>=3.7')
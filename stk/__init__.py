@@ -2,3 +2,5 @@ from .utilities import *
 from .molecular import *
 from .optimization import *
 from .population import *
+from .descriptors import *
+from .archive import *
@@ -0,0 +1,461 @@
+"""
+Defines :class:`PopulationArchive`.
+
+A population dumped with :meth:`.Population.dump` or
+:meth:`.Population.dump_jsonl` holds a mol block for every member,
+and loading it makes every member at once. For screening runs with
+hundreds of thousands of members, neither the file nor the loaded
+population fits comfortably in memory. A :class:`PopulationArchive`
+keeps the members on disk in a directory and makes each member only
+when it is used
+
+.. code-block:: python
+
+    pop.dump_archive('screen')
+
+    archive = stk.PopulationArchive('screen')
+    len(archive)
+    coords = archive.coordinates(1000)
+    mol = archive[1000]
+    members = stk.Population.iter_archive('screen',
+                                          stk.Molecule.from_dict)
+    for location, mol in members:
+        ...
+
+The directory holds
+
+``coordinates.f32``
+    The coordinates of every atom of every conformer of every member,
+    as 32-bit floats, one conformer after another and one member after
+    another. It is memory-mapped when read, so
+    :meth:`PopulationArchive.coordinates` returns a view of the file
+    rather than a copy.
+
+``index.npy``
+    For each member, the row of its first atom in
+    ``coordinates.f32``, its number of atoms, the id of its
+    connectivity, the byte offset of its metadata and its number of
+    conformers.
+
+``connectivity.json``
+    The mol block template, see :meth:`.Molecule.mdl_mol_block_template`,
+    of each unique connectivity. Members with the same atoms and bonds
+    share a template, so it is stored only once.
+
+``metadata.jsonl``
+    The location of each member, the ids of its conformers and its
+    JSON representation, without the mol block.
+
+``building_blocks.jsonl``
+    The JSON representation of each building block of the members,
+    stored once, as in :meth:`.Population.dump_jsonl`.
+
+``populations.json``
+    The locations of the subpopulations.
+
+"""
+
+import json
+import os
+
+import numpy as np
+import rdkit.Chem.AllChem as rdkit
+from rdkit.Geometry import Point3D
+
+from .molecular import Molecule, MacroMolecule
+from .utilities import canonical_key
+
+
+class PopulationArchive:
+    """
+    Holds the members of a population in a directory.
+
+    An archive is opened either for reading, when members are made
+    only as they are accessed, or for writing, when members are added
+    one at a time.
+
+    Attributes
+    ----------
+    path : :class:`str`
+        The path of the directory holding the archive.
+
+    mode : :class:`str`
+        ``'r'`` if the archive is open for reading and ``'w'`` if it
+        is open for writing.
+
+    member_init : :class:`function`
+        Makes a member from its JSON representation, for example
+        :meth:`.Molecule.from_dict`.
+
+    index : :class:`numpy.ndarray`
+        For each member, the row of its first atom in the coordinates,
+        its number of atoms, the id of its connectivity, the byte
+        offset of its metadata and its number of conformers.
+
+    populations : :class:`list` of :class:`tuple` of :class:`int`
+        The locations of the subpopulations in the archive.
+
+    """
+
+    def __init__(self, path, mode='r', member_init=Molecule.from_dict):
+        """
+        Initializes a :class:`PopulationArchive`.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the directory holding the archive.
+
+        mode : :class:`str`, optional
+            ``'r'`` to read an existing archive or ``'w'`` to write a
+            new one. Writing replaces the files of any archive
+            already in `path`.
+
+        member_init : :class:`function`, optional
+            Makes a member from its JSON representation.
+
+        Raises
+        ------
+        :class:`ValueError`
+            If `mode` is not ``'r'`` or ``'w'``.
+
+        """
+
+        if mode not in {'r', 'w'}:
+            raise ValueError(f'Mode must be "r" or "w", not "{mode}".')
+
+        self.path = path
+        self.mode = mode
+        self.member_init = member_init
+
+        if mode == 'w':
+            os.makedirs(path, exist_ok=True)
+            # The keys of the building blocks written so far.
+            self._building_blocks = set()
+            self.index = []
+            self.populations = []
+            # Maps each connectivity template to its id.
+            self._connectivity_ids = {}
+            self._num_atoms = 0
+            self._coordinates_file = open(
+                                self._file('coordinates.f32'), 'wb')
+            self._metadata_file = open(self._file('metadata.jsonl'), 'wb')
+            self._building_blocks_file = open(
+                        self._file('building_blocks.jsonl'), 'w')
+            return
+
+        self.index = np.load(self._file('index.npy'))
+        with open(self._file('connectivity.json'), 'r') as f:
+            self._connectivities = json.load(f)
+        with open(self._file('populations.json'), 'r') as f:
+            self.populations = [tuple(loc) for loc in json.load(f)]
+
+        # A memory map of an empty file cannot be made.
+        if os.path.getsize(self._file('coordinates.f32')):
+            self._coordinates = np.memmap(self._file('coordinates.f32'),
+                                          dtype='<f4',
+                                          mode='r').reshape(-1, 3)
+        else:
+            self._coordinates = np.zeros((0, 3), dtype='<f4')
+        self._metadata_file = open(self._file('metadata.jsonl'), 'rb')
+        # Building blocks are only made when a member needs them.
+        # Maps the key of each building block to its JSON
+        # representation, once read, and to the building block, once
+        # made.
+        self._building_block_json = None
+        self._building_blocks = {}
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def add_member(self, mol, location=()):
+        """
+        Adds a molecule to an archive open for writing.
+
+        Every conformer of the molecule is stored.
+
+        Parameters
+        ----------
+        mol : :class:`.Molecule`
+            The molecule to add.
+
+        location : :class:`tuple` of :class:`int`, optional
+            The location of the population the molecule belongs to,
+            given as indices into :attr:`.Population.populations`.
+            For example, ``(1, 0)`` is
+            ``pop.populations[1].populations[0]``. The population must
+            have been added with :meth:`add_population`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if isinstance(mol, MacroMolecule):
+            member = mol.json(building_blocks=False)
+            for bb in mol.bb_counter:
+                key = canonical_key(bb.key)
+                if key not in self._building_blocks:
+                    self._building_blocks.add(key)
+                    record = {'building_block': key, 'json': bb.json()}
+                    self._building_blocks_file.write(
+                                            json.dumps(record) + '\n')
+        else:
+            member = mol.json()
+        del member['mol_block']
+
+        template = mol.mdl_mol_block_template()
+        connectivity = self._connectivity_ids.setdefault(
+                                template, len(self._connectivity_ids))
+
+        # The default conformer, used by the mol block, comes first.
+        confs = list(mol.mol.GetConformers())
+        num_atoms = mol.mol.GetNumAtoms()
+        for conf in confs:
+            self._coordinates_file.write(
+                        conf.GetPositions().astype('<f4').tobytes())
+
+        self.index.append((self._num_atoms,
+                           num_atoms,
+                           connectivity,
+                           self._metadata_file.tell(),
+                           len(confs)))
+        self._num_atoms += num_atoms*len(confs)
+
+        record = {
+            'location': list(location),
+            'conformers': [conf.GetId() for conf in confs],
+            'member': member
+        }
+        self._metadata_file.write((json.dumps(record)+'\n').encode())
+
+    def add_population(self, location):
+        """
+        Adds an empty subpopulation to an archive open for writing.
+
+        Parameters
+        ----------
+        location : :class:`tuple` of :class:`int`
+            The location of the subpopulation. Its parent population
+            must already have been added.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.populations.append(tuple(location))
+
+    def close(self):
+        """
+        Closes the archive.
+
+        An archive open for writing can only be read once it is
+        closed.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self._metadata_file.close()
+        if self.mode == 'r':
+            return
+
+        self._coordinates_file.close()
+        self._building_blocks_file.close()
+        np.save(self._file('index.npy'),
+                np.array(self.index, dtype=np.int64).reshape(-1, 5))
+        with open(self._file('connectivity.json'), 'w') as f:
+            json.dump(list(self._connectivity_ids), f)
+        with open(self._file('populations.json'), 'w') as f:
+            json.dump([list(loc) for loc in self.populations], f)
+
+    def coordinates(self, index, conformer=0):
+        """
+        Returns the coordinates of a conformer of a member.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the member.
+
+        conformer : :class:`int`, optional
+            The position of the conformer among the conformers of the
+            member, see :meth:`conformer_ids`. ``0`` is the default
+            conformer.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The coordinates of each atom of the conformer, as an array
+            of shape ``[n, 3]``. The array is a read-only view of the
+            archive.
+
+        Raises
+        ------
+        :class:`IndexError`
+            If the member does not have `conformer`.
+
+        """
+
+        start, num_atoms, _, _, num_conformers = self.index[index]
+        if not 0 <= conformer < num_conformers:
+            raise IndexError(f'Member {index} has {num_conformers} '
+                             f'conformers, not {conformer+1}.')
+        start += conformer*num_atoms
+        return self._coordinates[start:start+num_atoms]
+
+    def conformer_ids(self, index):
+        """
+        Returns the ids of the conformers of a member.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the member.
+
+        Returns
+        -------
+        :class:`list` of :class:`int`
+            The id of each conformer of the member, in the order used
+            by :meth:`coordinates`.
+
+        """
+
+        return self._record(index)['conformers']
+
+    def metadata(self, index):
+        """
+        Returns the JSON representation of a member, without its mol block.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the member.
+
+        Returns
+        -------
+        :class:`dict`
+            The JSON representation of the member, without the
+            ``'mol_block'``. The building blocks of a
+            :class:`.MacroMolecule` are given by key, see
+            :meth:`.MacroMolecule.json`.
+
+        """
+
+        return self._record(index)['member']
+
+    def location(self, index):
+        """
+        Returns the location of the population holding a member.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the member.
+
+        Returns
+        -------
+        :class:`tuple` of :class:`int`
+            The location of the population holding the member.
+
+        """
+
+        return tuple(self._record(index)['location'])
+
+    def _record(self, index):
+        """
+        Reads the metadata record of a member.
+
+        """
+
+        self._metadata_file.seek(int(self.index[index][3]))
+        return json.loads(self._metadata_file.readline())
+
+    def _building_block(self, key):
+        """
+        Returns a building block, making it the first time it is used.
+
+        """
+
+        if self._building_block_json is None:
+            self._building_block_json = {}
+            with open(self._file('building_blocks.jsonl'), 'r') as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._building_block_json[
+                        record['building_block']] = record['json']
+
+        if key not in self._building_blocks:
+            self._building_blocks[key] = self.member_init(
+                                    self._building_block_json[key])
+        return self._building_blocks[key]
+
+    def __getitem__(self, index):
+        """
+        Makes a member of the archive.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the member.
+
+        Returns
+        -------
+        :class:`.Molecule`
+            The member, with all of its conformers. A new molecule is
+            made on every call, unless :attr:`member_init` returns a
+            cached one, which is returned as it is. Members share
+            their building blocks.
+
+        """
+
+        record = self._record(index)
+        member = record['member']
+        _, _, connectivity, _, num_conformers = self.index[index]
+        template = self._connectivities[connectivity]
+        coords = self.coordinates(index).ravel().tolist()
+        member['mol_block'] = template.format(*coords)
+
+        if 'bb_counter' in member:
+            member['bb_counter'] = [
+                (self._building_block(key) if isinstance(key, str) else
+                 key, count) for key, count in member['bb_counter']
+            ]
+        mol = self.member_init(member)
+
+        # Only a newly made member has the single conformer of its mol
+        # block.
+        if num_conformers > 1 and mol.mol.GetNumConformers() == 1:
+            ids = record['conformers']
+            mol.mol.GetConformer().SetId(ids[0])
+            for i, conf_id in enumerate(ids[1:], 1):
+                conf = rdkit.Conformer(mol.mol.GetNumAtoms())
+                for atom_id, (x, y, z) in enumerate(
+                                        self.coordinates(index, i)):
+                    conf.SetAtomPosition(
+                        atom_id, Point3D(float(x), float(y), float(z)))
+                conf.SetId(conf_id)
+                mol.mol.AddConformer(conf)
+        return mol
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return (f'PopulationArchive({self.path!r}, mode={self.mode!r}, '
+                f'members={len(self)})')
@@ -0,0 +1,451 @@
+"""
+Defines :class:`DescriptorTable`.
+
+Analysis of a population often asks for the same property of every
+member many times, for example
+
+.. code-block:: python
+
+    pop.max(lambda mol: mol.cavity_size())
+    pop.mean(lambda mol: mol.cavity_size())
+
+which calculates the cavity size of every member twice. A
+:class:`DescriptorTable` calculates each descriptor of each member
+once and keeps the values in :mod:`numpy` arrays, so that later
+questions are answered straight from the arrays
+
+.. code-block:: python
+
+    table = DescriptorTable(pop, processes=4)
+    table.add('cavity_size', cavity_size)
+    table.add('window_difference', window_difference)
+
+    table.max('cavity_size')
+    table.mean('cavity_size')
+    table.quantile('window_difference', 0.9)
+    best = table.sort('window_difference')[:10]
+
+Values are only calculated for members which have been added to the
+population or optimized since they were last calculated.
+
+"""
+
+import numpy as np
+
+from .utilities import WorkerPool
+
+
+def _calculate(func, mol):
+    """
+    Calculates a descriptor, using ``nan`` for a missing value.
+
+    """
+
+    value = func(mol)
+    return np.nan if value is None else value
+
+
+class DescriptorTable:
+    """
+    Holds descriptors of the members of a population.
+
+    Each descriptor is held in a column, a :class:`numpy.ndarray`
+    whose rows are in the same order as the members in
+    :meth:`.Population.all_members`. Descriptors which are ``None``
+    for a member are held as ``nan`` and ignored by :meth:`max`,
+    :meth:`mean`, :meth:`min` and :meth:`quantile`.
+
+    Before a column is used, the table is compared with the
+    population. Values are calculated for members which are new to
+    the population and for members whose
+    :attr:`.Molecule.structure_version` has changed since their value
+    was calculated, for example because they were optimized again.
+
+    Attributes
+    ----------
+    population : :class:`.Population`
+        The population whose members are described.
+
+    descriptors : :class:`dict`
+        Maps the name of each descriptor to the function which
+        calculates it. Each function takes a :class:`.Molecule` and
+        returns a number, a :class:`list` of numbers or ``None``.
+        Every value of a descriptor which is not ``None`` must have
+        the same shape.
+
+    processes : :class:`int`
+        The number of parallel processes used to calculate
+        descriptors. If more than ``1``, the descriptor functions
+        must be picklable, so they cannot be ``lambda`` functions.
+
+    pool : :class:`.WorkerPool`
+        A running pool of processes used to calculate descriptors
+        instead of making a new one. If ``None``, a pool is made
+        whenever values are calculated with more than ``1`` process.
+
+    members : :class:`list` of :class:`.Molecule`
+        The members of the population, in the order of the rows,
+        when the table was last compared with it.
+
+    """
+
+    def __init__(self, population, processes=1, pool=None):
+        """
+        Initializes a :class:`DescriptorTable`.
+
+        Parameters
+        ----------
+        population : :class:`.Population`
+            The population whose members are described.
+
+        processes : :class:`int`, optional
+            The number of parallel processes used to calculate
+            descriptors.
+
+        pool : :class:`.WorkerPool`, optional
+            A running pool of processes used to calculate
+            descriptors.
+
+        """
+
+        self.population = population
+        self.descriptors = {}
+        self.processes = processes
+        self.pool = pool
+        self.members = []
+        # The structure version of each member.
+        self._versions = np.zeros(0, dtype=int)
+        # Maps the name of each descriptor to its values. ``None``
+        # until the first value which is not missing is calculated.
+        self._columns = {}
+        # Maps the name of each descriptor to the structure version
+        # of each member when its value was calculated. ``-1`` if
+        # it was never calculated.
+        self._column_versions = {}
+
+    def add(self, name, func):
+        """
+        Adds a descriptor to the table.
+
+        Values are calculated when the descriptor is first used.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor. If a descriptor with this name
+            exists, it is replaced.
+
+        func : :class:`callable`
+            Takes a :class:`.Molecule` and returns the descriptor of
+            it.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.descriptors[name] = func
+        self._columns[name] = None
+        self._column_versions[name] = np.full(len(self.members), -1)
+
+    def column(self, name):
+        """
+        Returns the values of a descriptor, calculating any missing.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The value of the descriptor for each member, in the order
+            of :meth:`.Population.all_members`. The array should not
+            be modified.
+
+        Raises
+        ------
+        :class:`KeyError`
+            If there is no descriptor called `name`.
+
+        """
+
+        self.update([name])
+        column = self._columns[name]
+        # Every value is missing, or the population is empty.
+        if column is None:
+            column = np.full(len(self.members), np.nan)
+        return column
+
+    def update(self, names=None):
+        """
+        Calculates every missing or out of date value.
+
+        Values of all the descriptors are calculated together, so
+        that a single pool of processes is used.
+
+        Parameters
+        ----------
+        names : :class:`list` of :class:`str`, optional
+            The names of the descriptors to update. If ``None``, all
+            descriptors are updated.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        Raises
+        ------
+        :class:`KeyError`
+            If a descriptor in `names` does not exist.
+
+        :class:`ValueError`
+            If a value is not a number or a regular array of numbers,
+            or if its shape differs from that of the other values of
+            its descriptor.
+
+        """
+
+        if names is None:
+            names = list(self.descriptors)
+        for name in names:
+            if name not in self.descriptors:
+                raise KeyError(f'No descriptor called "{name}".')
+
+        self._update_rows()
+
+        jobs = []
+        for name in names:
+            stale = np.flatnonzero(
+                self._column_versions[name] != self._versions)
+            jobs.extend((name, row) for row in stale)
+
+        if not jobs:
+            return
+
+        args = [(self.descriptors[name], self.members[row]) for
+                name, row in jobs]
+        if self.pool is not None:
+            values = self.pool.starmap(_calculate, args)
+        elif self.processes > 1 and len(args) > 1:
+            with WorkerPool(self.processes) as pool:
+                values = pool.starmap(_calculate, args)
+        else:
+            values = [_calculate(*arg) for arg in args]
+
+        for (name, row), value in zip(jobs, values):
+            self._set_value(name, row, value)
+            self._column_versions[name][row] = self._versions[row]
+
+    def _set_value(self, name, row, value):
+        """
+        Puts a value into a column.
+
+        The shape of the values of a descriptor is fixed by its first
+        value which is not missing. Until then, the column is
+        ``None``.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        row : :class:`int`
+            The row of the member the value belongs to.
+
+        value : :class:`object`
+            The value, ``nan`` if it is missing.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        Raises
+        ------
+        :class:`ValueError`
+            If `value` is not a number or a regular array of numbers,
+            or if its shape differs from that of the other values of
+            the descriptor.
+
+        """
+
+        mol = self.members[row]
+        try:
+            value = np.asarray(value, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f'Descriptor "{name}" of "{mol.name}" is not a number '
+                'or a regular array of numbers.') from None
+
+        # A missing value fits a column of any shape.
+        missing = value.ndim == 0 and np.isnan(value)
+        column = self._columns[name]
+        if column is None:
+            if missing:
+                return
+            column = np.full((len(self.members), *value.shape), np.nan)
+            self._columns[name] = column
+
+        elif not missing and value.shape != column.shape[1:]:
+            raise ValueError(
+                f'Descriptor "{name}" of "{mol.name}" has shape '
+                f'{value.shape} but other values of it have shape '
+                f'{column.shape[1:]}.')
+
+        column[row] = value
+
+    def _update_rows(self):
+        """
+        Matches the rows of the table to the members of the population.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        members = list(self.population)
+        same = (len(members) == len(self.members) and
+                all(a is b for a, b in zip(members, self.members)))
+
+        if not same:
+            # Find the old row of each member, -1 if it is new.
+            old_rows = {id(mol): row for row, mol in
+                        enumerate(self.members)}
+            rows = np.array([old_rows.get(id(mol), -1) for
+                             mol in members], dtype=int)
+            found = np.flatnonzero(rows != -1)
+
+            for name, column in self._columns.items():
+                versions = np.full(len(members), -1)
+                versions[found] = self._column_versions[name][rows[found]]
+                self._column_versions[name] = versions
+                if column is not None:
+                    new_column = np.full((len(members), *column.shape[1:]),
+                                         np.nan)
+                    new_column[found] = column[rows[found]]
+                    self._columns[name] = new_column
+
+            self.members = members
+
+        self._versions = np.array([mol.structure_version for
+                                   mol in members], dtype=int)
+
+    def max(self, name):
+        """
+        Returns the maximum value of a descriptor.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        Returns
+        -------
+        :class:`float`
+            The maximum. If the descriptor holds :class:`list`
+            values, the maximum of each element is returned.
+
+        """
+
+        return np.nanmax(self.column(name), axis=0)
+
+    def mean(self, name):
+        """
+        Returns the mean value of a descriptor.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        Returns
+        -------
+        :class:`float`
+            The mean. If the descriptor holds :class:`list` values,
+            the mean of each element is returned.
+
+        """
+
+        return np.nanmean(self.column(name), axis=0)
+
+    def min(self, name):
+        """
+        Returns the minimum value of a descriptor.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        Returns
+        -------
+        :class:`float`
+            The minimum. If the descriptor holds :class:`list`
+            values, the minimum of each element is returned.
+
+        """
+
+        return np.nanmin(self.column(name), axis=0)
+
+    def quantile(self, name, q):
+        """
+        Returns quantiles of a descriptor.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor.
+
+        q : :class:`float` or :class:`list` of :class:`float`
+            The quantiles to find, between ``0`` and ``1``.
+
+        Returns
+        -------
+        :class:`float` or :class:`numpy.ndarray`
+            The quantiles.
+
+        """
+
+        return np.nanquantile(self.column(name), q, axis=0)
+
+    def sort(self, name, reverse=False):
+        """
+        Returns the members sorted by a descriptor.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the descriptor. Its values must be numbers.
+
+        reverse : :class:`bool`, optional
+            If ``True``, the member with the largest value comes
+            first.
+
+        Returns
+        -------
+        :class:`list` of :class:`.Molecule`
+            The members sorted by the descriptor. Members whose value
+            is ``nan`` come last. Members with equal values are kept
+            in the order of :meth:`.Population.all_members`.
+
+        Raises
+        ------
+        :class:`ValueError`
+            If the values of the descriptor are not numbers.
+
+        """
+
+        column = self.column(name)
+        if column.ndim != 1:
+            raise ValueError(f'Descriptor "{name}" is not a number.')
+
+        order = np.argsort(-column if reverse else column,
+                           kind='stable')
+        return [self.members[row] for row in order]
+
+    def __repr__(self):
+        return (f'DescriptorTable(descriptors={list(self.descriptors)}, '
+                f'members={len(self.members)})')
@@ -1,4 +1,6 @@
 from .topologies import *
 from .energy import *
 from .functional_groups import *
+from .fingerprints import *
 from .molecules import *
+from .library import *
@@ -191,16 +191,18 @@ Notes.
 
 import os
 import rdkit.Chem.AllChem as rdkit
-import subprocess as sp
-import psutil
 import copy
 from uuid import uuid4
 from types import MethodType
-from functools import wraps
+from functools import wraps, partial
 from inspect import signature as sig
 import logging
 
-from ..utilities import FunctionData
+from ..utilities import (FunctionData,
+                         EXECUTOR,
+                         run_coroutine,
+                         INSTRUMENTATION,
+                         TELEMETRY)
 from ..optimization.mopac import mopac_opt
 
 
@@ -342,7 +344,9 @@ def e_logger(func, obj):
     def inner(self, *args, **kwargs):
 
         # First get the result of the energy calculation.
-        result = func(self, *args, **kwargs)
+        with INSTRUMENTATION.timer(f'Energy.{func.__name__}'), \
+             TELEMETRY.track(self.molecule, 'energy', func.__name__):
+            result = func(self, *args, **kwargs)
 
         # Next create FunctionData object to store the values of the
         # parameters used to run that calculation.
@@ -387,7 +391,7 @@ def func_key(func, fargs=None, fkwargs=None):
     if fargs is None:
         fargs = []
     if fkwargs is None:
-        fkwargs = []
+        fkwargs = {}
 
     # Check if the function has a `key` attribute. If it does use this
     # to get its key rather than the general purpose code written here.
@@ -747,66 +751,68 @@ class Energy(metaclass=EMeta):
 
         # To prevent conflicts when running this function in parallel,
         # a temporary copy of the molecular structure file is made and
-        # used for macromodel calculations.
-
-        # Unique file name is generated by inserting a random int into
-        # the file path.
-        tmp_file = "{}.mol".format(uuid4().int)
-        self.molecule.write(tmp_file, conformer)
-
-        file_root, ext = os.path.splitext(tmp_file)
-        convrt_app = os.path.join(macromodel_path,
-                                  'utilities',
-                                  'structconvert')
-        convrt_cmd = [convrt_app,
-                      tmp_file,
-                      file_root+'.mae']
-        sp.call(convrt_cmd, stdout=sp.PIPE, stderr=sp.PIPE)
-
-        # Create an input file and run it.
-        input_script = (
-         "{0}.mae\n"
-         "{0}-out.maegz\n"
-         " MMOD       0      1      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " FFLD{1:8}      1      0      0     1.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " BGIN       0      0      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " READ      -1      0      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " ELST      -1      0      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " WRIT       0      0      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n"
-         " END       0      0      0      0     0.0000     0.0000     "
-         "0.0000     0.0000\n\n"
-        ).format(file_root, forcefield)
-
-        with open(file_root+'.com', 'w') as f:
-            f.write(input_script)
-
-        cmd = [os.path.join(macromodel_path, 'bmin'),
-               file_root,
-               "-WAIT",
-               "-LOCAL"]
-        sp.call(cmd)
-
-        # Check if the license was found. If not run the function
-        # again.
-        with open(file_root+'.log', 'r') as f:
-            log_content = f.read()
-        if ('FATAL -96: Could not check out a license for mmlibs' in
-           log_content):
-            return self.macromodel(forcefield,
-                                   macromodel_path,
-                                   conformer)
-
-        # Read the .log file and return the energy.
-        with open(file_root+'.log', 'r') as f:
-            for line in f:
-                if "                   Total Energy =" in line:
-                    eng = float(line.split()[-2].replace("=", ""))
+        # used for macromodel calculations. All files are written into
+        # a job directory, which is cleaned up afterwards.
+        with EXECUTOR.workspace.job('macromodel') as job_dir:
+            # Unique file name is generated by inserting a random int
+            # into the file path.
+            name = str(uuid4().int)
+            file_root = os.path.join(job_dir, name)
+            self.molecule.write(file_root+'.mol', conformer)
+
+            convrt_app = os.path.join(macromodel_path,
+                                      'utilities',
+                                      'structconvert')
+            convrt_cmd = [convrt_app,
+                          file_root+'.mol',
+                          file_root+'.mae']
+            run_coroutine(EXECUTOR.run('structconvert',
+                                       convrt_cmd,
+                                       cwd=job_dir))
+
+            # Create an input file and run it.
+            input_script = (
+             "{0}.mae\n"
+             "{0}-out.maegz\n"
+             " MMOD       0      1      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " FFLD{1:8}      1      0      0     1.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " BGIN       0      0      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " READ      -1      0      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " ELST      -1      0      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " WRIT       0      0      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n"
+             " END       0      0      0      0     0.0000     0.0000     "
+             "0.0000     0.0000\n\n"
+            ).format(name, forcefield)
+
+            with open(file_root+'.com', 'w') as f:
+                f.write(input_script)
+
+            # ``bmin`` is run inside the job directory, so only the
+            # name of the job is passed.
+            cmd = [os.path.join(macromodel_path, 'bmin'),
+                   name,
+                   "-WAIT",
+                   "-LOCAL"]
+            # If the license was not found, the executor runs the
+            # calculation again.
+            run_coroutine(EXECUTOR.run(
+                                'bmin',
+                                cmd,
+                                cwd=job_dir,
+                                license_found=partial(_bmin_license_found,
+                                                      file_root)))
+
+            # Read the .log file and return the energy.
+            with open(file_root+'.log', 'r') as f:
+                for line in f:
+                    if "                   Total Energy =" in line:
+                        eng = float(line.split()[-2].replace("=", ""))
 
         try:
             return eng
@@ -814,9 +820,16 @@ class Energy(metaclass=EMeta):
             raise EnergyError('MacroModel energy calculation failed.')
 
     @exclude('mopac_path')
-    def mopac(self, mopac_path, settings=None):
+    def mopac_properties(self, mopac_path, settings=None):
         """
-        Calculates the energy using MOPAC.
+        Calculates a number of properties with a single MOPAC run.
+
+        All the properties MOPAC writes to its ``.arc`` file are
+        extracted at the same time. The energy and dipole moment are
+        also stored in :attr:`values` under the keys of
+        :meth:`mopac` and :meth:`mopac_dipole`, so calling those
+        methods with the same arguments afterwards does not run MOPAC
+        again.
 
         Note that this requires MOPAC to be installed and have a
         valid license.
@@ -861,8 +874,20 @@ class Energy(metaclass=EMeta):
 
         Returns
         -------
-        :class:`float`
-            The calculated energy.
+        :class:`dict`
+            Maps the name of each property to its value. The names
+            are
+
+                ``'heat_of_formation'`` (kcal/mol),
+                ``'total_energy'`` (eV),
+                ``'electronic_energy'`` (eV),
+                ``'core_core_repulsion'`` (eV),
+                ``'dipole'`` (Debye),
+                ``'ionization_potential'`` (eV),
+                ``'homo'`` (eV) and
+                ``'lumo'`` (eV).
+
+            Properties missing from the MOPAC output are not present.
 
         References
         ----------
@@ -886,25 +911,38 @@ class Energy(metaclass=EMeta):
 
         # To prevent conflicts when running this function in parallel,
         # a temporary copy of the molecular structure file is made and
-        # used for mopac calculations.
-
-        # Unique file name is generated by inserting a random int into
-        # the file path.
-        tmp_file = "{}.mol".format(uuid4().int)
-        self.molecule.write(tmp_file)
-
-        file_root, ext = os.path.splitext(tmp_file)
-
-        # Generate the input file
-        _create_mop(file_root, self.molecule, vals)
-        # Run MOPAC
-        _run_mopac(file_root, mopac_path)
-        return _extract_MOPAC_en(file_root)
+        # used for mopac calculations. All files are written into a
+        # job directory, which is cleaned up afterwards.
+        with EXECUTOR.workspace.job('mopac') as job_dir:
+            # Unique file name is generated by inserting a random int
+            # into the file path.
+            file_root = os.path.join(job_dir, str(uuid4().int))
+            self.molecule.write(file_root+'.mol')
+
+            # Generate the input file
+            _create_mop(file_root, self.molecule, vals)
+            # Run MOPAC
+            _run_mopac(file_root, mopac_path, vals['timeout'])
+            properties = _extract_MOPAC_properties(file_root)
+
+        # Store the properties which have their own methods, so that
+        # they are not calculated again.
+        fkwargs = {'mopac_path': mopac_path, 'settings': settings}
+        for method, name in (('mopac', 'total_energy'),
+                             ('mopac_dipole', 'dipole')):
+            if name in properties:
+                fkey = func_key(getattr(Energy, method), (self, ), fkwargs)
+                self.values[fkey] = properties[name]
+
+        return properties
 
     @exclude('mopac_path')
-    def mopac_dipole(self, mopac_path, settings=None):
+    def mopac(self, mopac_path, settings=None):
         """
-        Calculates the dipole moment using MOPAC.
+        Calculates the energy using MOPAC.
+
+        MOPAC is not run again if :meth:`mopac_properties` was
+        already called with the same `settings`.
 
         Note that this requires MOPAC to be installed and have a
         valid license.
@@ -950,7 +988,7 @@ class Energy(metaclass=EMeta):
         Returns
         -------
         :class:`float`
-            The calculated dipole.
+            The calculated energy.
 
         References
         ----------
@@ -958,36 +996,71 @@ class Energy(metaclass=EMeta):
 
         """
 
-        if settings is None:
-            settings = {}
+        properties = self._mopac_properties(mopac_path, settings)
+        return properties['total_energy']
 
-        # Define default vals for the MOPAC input
-        vals = {
-                'hamiltonian': 'PM7',
-                'method': 'NOOPT',
-                'eps': 80.1,
-                'charge': 0,
-                'timeout': 172800,
-                }
+    @exclude('mopac_path')
+    def mopac_dipole(self, mopac_path, settings=None):
+        """
+        Calculates the dipole moment using MOPAC.
 
-        vals.update(settings)
+        MOPAC is not run again if :meth:`mopac_properties` was
+        already called with the same `settings`.
 
-        # To prevent conflicts when running this function in parallel,
-        # a temporary copy of the molecular structure file is made and
-        # used for mopac calculations.
+        Note that this requires MOPAC to be installed and have a
+        valid license.
+
+        Parameters
+        ----------
+        settings : :class:`dict`, optional
+            A dictionary which maps the names of the optimization
+            parameters to their values. Valid values are:
+
+                'hamiltonian' : :class:`str` (default = ``'PM7'``
+                    A series of different methods can be selected:
+                    PM7, PM6, AM1, CIS (CISD, CISDT), MNDO, RM1, etc..
+
+                    PM7 is the latest version of the reparametrization
+                    of NDDO theory, where all the atomic and diatomic
+                    parameters were re-optimized / updated from PM6
+                    [#]_.
+
+                'eps' : :class:`float` (default = ``80.1``)
+                    Sets the dielectric constant for the solvent.
+                    Presence of this keyword will cause the COSMO
+                    (Conductor-like Screening Model) method to be used
+                    to approximate the effect of a solvent model
+                    surrounding the molecule. Solvents with a low
+                    dielectric constant are not likely to work well
+                    with this model. ``0`` means that the dielectric
+                    constant is not included in the calculation.
+                    ``80.1`` can be used to model a water environment
+                    at room temperature.
+
+                'charge' : :class:`float` (default = ``0``)
+                    The charge of the system.
+
+                'timeout' : :class:`float` (default = ``172800``)
+                    The amount in seconds the calculation is allowed to
+                    run before being terminated. The default value is
+                    ``2`` days or ``172,800`` seconds.
+
+        mopac_path : :class:`str`
+            The full path to the MOPAC installation.
+
+        Returns
+        -------
+        :class:`float`
+            The calculated dipole.
 
-        # Unique file name is generated by inserting a random int into
-        # the file path.
-        tmp_file = "{}.mol".format(uuid4().int)
-        self.molecule.write(tmp_file)
+        References
+        ----------
+        .. [#] http://openmopac.net/PM7_accuracy/PM7_accuracy.html
 
-        file_root, ext = os.path.splitext(tmp_file)
+        """
 
-        # Generate the input file
-        _create_mop(file_root, self.molecule, vals)
-        # Run MOPAC
-        _run_mopac(file_root, mopac_path)
-        return _extract_MOPAC_dipole(file_root)
+        properties = self._mopac_properties(mopac_path, settings)
+        return properties['dipole']
 
     @exclude('mopac_path')
     def mopac_ea(self, mopac_path, settings=None):
@@ -1059,25 +1132,9 @@ class Energy(metaclass=EMeta):
                 }
         vals.update(settings)
 
-        # First check the energy of the neutral system
-        # To prevent conflicts when running this function in parallel,
-        # a temporary copy of the molecular structure file is made and
-        # used for mopac calculations.
-
-        # Unique file name is generated by inserting a random int into
-        # the file path.
-        tmp_file = "{}.mol".format(uuid4().int)
-        self.molecule.write(tmp_file)
-
-        file_root, ext = os.path.splitext(tmp_file)
-
-        # Generate the input file
-        _create_mop(file_root, self.molecule, vals)
-        # Run MOPAC
-        _run_mopac(file_root, mopac_path)
-
-        # Extract the neutral energy
-        en1 = _extract_MOPAC_en(file_root)
+        # First get the energy of the neutral system. If it was
+        # already calculated, the result is reused.
+        en1 = self.mopac(mopac_path, settings)
 
         # Update the settings for the anion optimization
         settings2 = {
@@ -1171,25 +1228,9 @@ class Energy(metaclass=EMeta):
                 }
         vals.update(settings)
 
-        # First check the energy of the neutral system
-        # To prevent conflicts when running this function in parallel,
-        # a temporary copy of the molecular structure file is made and
-        # used for mopac calculations.
-
-        # Unique file name is generated by inserting a random int into
-        # the file path.
-        tmp_file = "{}.mol".format(uuid4().int)
-        self.molecule.write(tmp_file)
-
-        file_root, ext = os.path.splitext(tmp_file)
-
-        # Generate the input file
-        _create_mop(file_root, self.molecule, vals)
-        # Run MOPAC
-        _run_mopac(file_root, mopac_path)
-
-        # Extract the neutral energy
-        en1 = _extract_MOPAC_en(file_root)
+        # First get the energy of the neutral system. If it was
+        # already calculated, the result is reused.
+        en1 = self.mopac(mopac_path, settings)
 
         # Update the settings for the cation optimization
         settings2 = {
@@ -1213,6 +1254,34 @@ class Energy(metaclass=EMeta):
         # Calculate the IP (eV)
         return en2 - en1
 
+    def _mopac_properties(self, mopac_path, settings):
+        """
+        Returns the results of :meth:`mopac_properties`.
+
+        MOPAC is only run if :meth:`mopac_properties` has not already
+        been called with the same `settings`.
+
+        Parameters
+        ----------
+        mopac_path : :class:`str`
+            The full path to the MOPAC installation.
+
+        settings : :class:`dict`
+            See :meth:`mopac_properties`.
+
+        Returns
+        -------
+        :class:`dict`
+            The properties calculated by :meth:`mopac_properties`.
+
+        """
+
+        fkey = func_key(Energy.mopac_properties,
+                        (self, mopac_path, settings))
+        if fkey not in self.values.keys():
+            self.mopac_properties(mopac_path, settings)
+        return self.values[fkey]
+
 
 def formation_key(fargs, fkwargs):
     """
@@ -1325,30 +1394,45 @@ def pseudoformation_key(fargs, fkwargs):
 Energy.pseudoformation.key = pseudoformation_key
 
 
-def _run_mopac(file_root, mopac_path, timeout=3600):
+def _bmin_license_found(file_root, output):
+    """
+    Checks if the ``.log`` file of a ``bmin`` run found a license.
+
+    Parameters
+    ----------
+    file_root : :class:`str`
+        The path of the ``bmin`` job, without an extension.
+
+    output : :class:`str`
+        The console output of ``bmin``. Not used.
+
+    Returns
+    -------
+    :class:`bool`
+        ``False`` if the calculation failed due to a missing license.
+
+    """
+
+    with open(file_root+'.log', 'r') as f:
+        log_content = f.read()
+    return ('FATAL -96: Could not check out a license for mmlibs' not in
+            log_content)
 
-    mop_file = file_root + '.mop'
+
+def _run_mopac(file_root, mopac_path, timeout=3600):
 
     logger.info(f'Running MOPAC - {file_root}.')
 
-    # To run MOPAC a command is issued to the console via
-    # ``subprocess.Popen``. The command is the full path of the
-    # ``mopac`` program.
-    file_root, ext = os.path.splitext(mop_file)
+    # To run MOPAC a command is issued to the console via the
+    # executor. The command is the full path of the ``mopac``
+    # program.
     opt_cmd = [mopac_path, file_root]
-    opt_proc = psutil.Popen(opt_cmd, stdout=sp.PIPE,
-                            stderr=sp.STDOUT,
-                            universal_newlines=True)
-
-    try:
-        if timeout:
-            proc_out, _ = opt_proc.communicate(timeout=timeout)
-        else:
-            proc_out, _ = opt_proc.communicate()
-    except sp.TimeoutExpired:
-        logger.info(('Minimization took too long and was terminated '
-                     'by force - {}').format(file_root))
-        _kill_mopac(file_root)
+    run_coroutine(EXECUTOR.run('mopac',
+                               opt_cmd,
+                               timeout=timeout,
+                               cwd=os.path.dirname(file_root) or None,
+                               on_timeout=partial(_kill_mopac,
+                                                  file_root)))
 
 
 def _kill_mopac(file_root):
@@ -1441,7 +1525,7 @@ def _create_mop(file_root, molecule, settings):
         # line for the run info
         mop.write(_mop_line(settings) + "\n")
         # line with the name of the molecule
-        mop.write(file_root + "\n\n")
+        mop.write(os.path.basename(file_root) + "\n\n")
 
         # print the structural info
         for atom in mol.GetAtoms():
@@ -1455,23 +1539,54 @@ def _create_mop(file_root, molecule, settings):
     return mop_file
 
 
-def _extract_MOPAC_en(file_root):
-    mopac_out = file_root + '.arc'
+def _extract_MOPAC_properties(file_root):
+    """
+    Extracts the properties in a MOPAC ``.arc`` file.
 
-    with open(mopac_out) as outfile:
-        target = "TOTAL ENERGY"
-        energy_str = str([x for x in outfile.readlines() if target in x][0])
-        energy_val = float(energy_str.split()[3])
+    The file is read only once.
+
+    Parameters
+    ----------
+    file_root : :class:`str`
+        The path of the MOPAC job, without an extension.
 
-    return energy_val
+    Returns
+    -------
+    :class:`dict`
+        Maps the name of each property found to its value. See
+        :meth:`Energy.mopac_properties`.
 
+    """
 
-def _extract_MOPAC_dipole(file_root):
     mopac_out = file_root + '.arc'
 
+    properties = {}
     with open(mopac_out) as outfile:
-        target = "DIPOLE"
-        energy_str = str([x for x in outfile.readlines() if target in x][0])
-        energy_val = float(energy_str.split()[2])
+        for line in outfile:
+            label, sep, value = line.partition('=')
+            label = label.strip()
+            if not sep or not value.split():
+                continue
+
+            if label == 'HOMO LUMO ENERGIES (EV)':
+                homo, lumo = value.split()[:2]
+                properties.setdefault('homo', float(homo))
+                properties.setdefault('lumo', float(lumo))
+
+            elif label in _MOPAC_PROPERTIES:
+                name = _MOPAC_PROPERTIES[label]
+                properties.setdefault(name, float(value.split()[0]))
+
+    return properties
+
 
-    return energy_val
+# Maps the labels of lines in a MOPAC ``.arc`` file to the names of the
+# properties they hold.
+_MOPAC_PROPERTIES = {
+    'HEAT OF FORMATION': 'heat_of_formation',
+    'TOTAL ENERGY': 'total_energy',
+    'ELECTRONIC ENERGY': 'electronic_energy',
+    'CORE-CORE REPULSION': 'core_core_repulsion',
+    'DIPOLE': 'dipole',
+    'IONIZATION POTENTIAL': 'ionization_potential'
+}
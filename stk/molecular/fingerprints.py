@@ -0,0 +1,185 @@
+"""
+Defines tools for comparing molecules by their fingerprints.
+
+Molecules are compared with the Dice similarity of their Morgan
+fingerprints of radius 4. Fingerprints of :class:`.StructUnit`
+molecules are calculated once, by :meth:`.StructUnit.fingerprint`,
+so that they can be compared many times cheaply
+
+.. code-block:: python
+
+    fps = [bb.fingerprint() for bb in building_blocks]
+    similarities = bulk_similarity(fps[0], fps)
+    matrix = similarity_matrix(fps)
+
+    picker = MaxMinPicker(fps)
+    diverse = [building_blocks[picker.pick()] for _ in range(10)]
+
+"""
+
+import numpy as np
+import rdkit.Chem.AllChem as rdkit
+from rdkit import DataStructs
+
+
+def morgan_fingerprint(mol):
+    """
+    Returns the Morgan fingerprint of radius 4 of a molecule.
+
+    Parameters
+    ----------
+    mol : :class:`rdkit.Chem.rdchem.Mol`
+        The molecule.
+
+    Returns
+    -------
+    :class:`rdkit.DataStructs.cDataStructs.UIntSparseIntVect`
+        The fingerprint.
+
+    """
+
+    rdkit.GetSSSR(mol)
+    mol.UpdatePropertyCache(strict=False)
+    return rdkit.GetMorganFingerprint(mol, 4)
+
+
+def bulk_similarity(fp, fps):
+    """
+    Returns the similarity of one fingerprint to many.
+
+    Parameters
+    ----------
+    fp : :class:`rdkit.DataStructs.cDataStructs.UIntSparseIntVect`
+        A fingerprint, made by :func:`morgan_fingerprint`.
+
+    fps : :class:`list`
+        Fingerprints, made by :func:`morgan_fingerprint`, to which
+        `fp` is compared.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The Dice similarity of `fp` to each fingerprint in `fps`.
+
+    """
+
+    return np.array(DataStructs.BulkDiceSimilarity(fp, list(fps)))
+
+
+def similarity_matrix(fps):
+    """
+    Returns the similarity of every pair of fingerprints.
+
+    Parameters
+    ----------
+    fps : :class:`list`
+        Fingerprints, made by :func:`morgan_fingerprint`.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A symmetric matrix holding the Dice similarity of
+        fingerprints ``i`` and ``j`` at ``[i, j]``.
+
+    """
+
+    fps = list(fps)
+    matrix = np.ones((len(fps), len(fps)))
+    for i in range(1, len(fps)):
+        matrix[i, :i] = DataStructs.BulkDiceSimilarity(fps[i], fps[:i])
+        matrix[:i, i] = matrix[i, :i]
+    return matrix
+
+
+class MaxMinPicker:
+    """
+    Picks diverse molecules with the MaxMin algorithm.
+
+    Each pick is the molecule whose highest similarity to any molecule
+    picked so far is lowest. The highest similarity of every molecule
+    to the picked ones is updated after each pick, so each pick takes
+    time proportional to the number of molecules.
+
+    Attributes
+    ----------
+    fps : :class:`list`
+        The fingerprints of the molecules being picked from, made by
+        :func:`morgan_fingerprint`.
+
+    picked : :class:`list` of :class:`int`
+        The indices of the picked molecules, in the order they were
+        picked or added.
+
+    """
+
+    def __init__(self, fps):
+        """
+        Initializes a :class:`MaxMinPicker`.
+
+        Parameters
+        ----------
+        fps : :class:`list`
+            The fingerprints of the molecules being picked from.
+
+        """
+
+        self.fps = list(fps)
+        self.picked = []
+        # The highest similarity of each molecule to a picked one.
+        # Picked molecules are given infinity so they are not picked
+        # again.
+        self._max_similarity = np.full(len(self.fps), -np.inf)
+
+    def add(self, index):
+        """
+        Marks a molecule as picked.
+
+        Used to pick molecules which are diverse with respect to ones
+        chosen in some other way. Adding a molecule which has already
+        been picked does nothing.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the molecule.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if self._max_similarity[index] == np.inf:
+            return
+
+        similarity = bulk_similarity(self.fps[index], self.fps)
+        np.maximum(self._max_similarity,
+                   similarity,
+                   out=self._max_similarity)
+        self._max_similarity[index] = np.inf
+        self.picked.append(index)
+
+    def pick(self):
+        """
+        Picks the molecule least similar to the picked molecules.
+
+        If no molecules have been picked, the first one is picked.
+
+        Returns
+        -------
+        :class:`int`
+            The index of the picked molecule.
+
+        Raises
+        ------
+        :class:`ValueError`
+            If every molecule has been picked.
+
+        """
+
+        if len(self.picked) == len(self.fps):
+            raise ValueError('Every molecule has been picked.')
+
+        index = int(np.argmin(self._max_similarity))
+        self.add(index)
+        return index
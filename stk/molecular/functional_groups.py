@@ -61,7 +61,6 @@ as an example.
 """
 
 import numpy as np
-from scipy.spatial.distance import euclidean
 import rdkit.Chem.AllChem as rdkit
 import rdkit.Geometry.rdGeometry as rdkit_geo
 from collections import Counter
@@ -429,7 +428,7 @@ def diol_with_difluorne(mol, del_atoms, fg1, fg2):
         cpos = np.array([*conf.GetAtomPosition(c.GetIdx())])
         for o in oxygens:
             opos = np.array([*conf.GetAtomPosition(o.GetIdx())])
-            d = euclidean(cpos, opos)
+            d = np.linalg.norm(cpos - opos)
             distances.append((d, c.GetIdx(), o.GetIdx()))
     distances.sort()
 
@@ -0,0 +1,434 @@
+"""
+Defines :class:`BuildingBlockLibrary`.
+
+:meth:`.StructUnit.init_random` lists and tries the files of a
+database every time it is called, and
+:meth:`.Population.init_from_files` makes every molecule in a folder
+one after another. A :class:`BuildingBlockLibrary` reads a folder of
+structure files, or a single ``.sdf`` file holding many molecules,
+once, in parallel, and keeps an index of what it holds. Picks are
+then made from the index and a :class:`.StructUnit` is only made for
+the building blocks picked
+
+.. code-block:: python
+
+    library = BuildingBlockLibrary('amines2f', processes=4)
+    library.dump('amines2f_index.json')
+
+    # Later, without reading the structure files again.
+    library = BuildingBlockLibrary.load('amines2f_index.json',
+                                        StructUnit2)
+    amine = library.random(fg_count=2)
+    diverse_amines = library.diverse(10, fg_count=2)
+
+"""
+
+import base64
+import json
+import logging
+import os
+from glob import glob
+
+import numpy as np
+import rdkit.Chem.AllChem as rdkit
+from rdkit import DataStructs
+
+from .fingerprints import morgan_fingerprint, MaxMinPicker
+from .functional_groups import functional_groups
+from .molecules import StructUnit
+from ..utilities import remake, WorkerPool
+
+
+logger = logging.getLogger(__name__)
+
+
+def _read_records(path, records):
+    """
+    Yields the molecules in a structure file.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to the file.
+
+    records : :class:`range`
+        The records of a multi-record ``.sdf`` file to read. If
+        ``None``, `path` holds a single molecule.
+
+    Yields
+    ------
+    :class:`tuple`
+        The record of the molecule, ``None`` if `records` is
+        ``None``, and the molecule.
+
+    """
+
+    if records is None:
+        _, ext = os.path.splitext(path)
+        yield None, StructUnit.init_funcs[ext](path)
+        return
+
+    supplier = rdkit.SDMolSupplier(path, sanitize=False, removeHs=False)
+    for record in records:
+        yield record, supplier[record]
+
+
+def _index(path, records, functional_group):
+    """
+    Makes the index entries of the molecules in a structure file.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to the file.
+
+    records : :class:`range`
+        The records of a multi-record ``.sdf`` file to index. If
+        ``None``, `path` holds a single molecule.
+
+    functional_group : :class:`str`
+        The name of the functional group of the molecules. If
+        ``None``, the name found in `path` is used, as done by
+        :class:`.StructUnit`.
+
+    Returns
+    -------
+    :class:`list` of :class:`dict`
+        An entry for each molecule which could be read. Fingerprints
+        are given in binary.
+
+    """
+
+    if functional_group is None:
+        functional_group = next((x.name for x in functional_groups if
+                                 x.name in path), None)
+    fg = next((x for x in functional_groups if
+               x.name == functional_group), None)
+
+    entries = []
+    try:
+        for record, mol in _read_records(path, records):
+            try:
+                mol = remake(mol)
+                key = StructUnit.gen_key(mol, functional_group)
+                for atom in mol.GetAtoms():
+                    atom.UpdatePropertyCache()
+                fg_count = (0 if fg is None else len(
+                    mol.GetSubstructMatches(
+                        rdkit.MolFromSmarts(fg.fg_smarts))))
+                entries.append({
+                    'file': path,
+                    'record': record,
+                    'key': list(key),
+                    'functional_group': functional_group,
+                    'fg_count': fg_count,
+                    'fingerprint': morgan_fingerprint(mol).ToBinary()
+                })
+            except Exception:
+                logger.warning(f'Could not index record {record} '
+                               f'of {path}.')
+    except Exception:
+        logger.warning(f'Could not index {path}.')
+
+    return entries
+
+
+class BuildingBlockLibrary:
+    """
+    An index of the building blocks in a database.
+
+    Attributes
+    ----------
+    source : :class:`str`
+        The folder of structure files or the ``.sdf`` file holding
+        the building blocks.
+
+    moltype : :class:`type`
+        The class of the building blocks made by the library, for
+        example :class:`.StructUnit2`.
+
+    entries : :class:`list` of :class:`dict`
+        An entry for each building block. Each entry holds the
+        ``'file'`` it is in, its ``'record'`` in that file, which is
+        ``None`` unless `source` is an ``.sdf`` file, its ``'key'``,
+        see :meth:`.StructUnit.gen_key`, the name of its
+        ``'functional_group'``, its number of functional groups,
+        ``'fg_count'``, and its ``'fingerprint'``, see
+        :meth:`.StructUnit.fingerprint`.
+
+    """
+
+    def __init__(self,
+                 source,
+                 moltype=StructUnit,
+                 functional_group=None,
+                 glob_pattern='*',
+                 processes=1,
+                 chunksize=100,
+                 pool=None):
+        """
+        Indexes the building blocks in `source`.
+
+        Files which cannot be read are skipped with a warning.
+
+        Parameters
+        ----------
+        source : :class:`str`
+            A folder of structure files, each holding one building
+            block, or an ``.sdf`` file holding many.
+
+        moltype : :class:`type`, optional
+            The class of the building blocks made by the library.
+
+        functional_group : :class:`str`, optional
+            The name of the functional group of the building blocks.
+            If ``None``, the name found in the path of each file is
+            used, as done by :class:`.StructUnit`.
+
+        glob_pattern : :class:`str`, optional
+            Selects the files in `source` which are indexed, if it is
+            a folder.
+
+        processes : :class:`int`, optional
+            The number of parallel processes used to index the
+            building blocks.
+
+        chunksize : :class:`int`, optional
+            The number of files or records indexed by a process at a
+            time.
+
+        pool : :class:`.WorkerPool`, optional
+            A running pool of processes used instead of making a new
+            one.
+
+        """
+
+        self.source = source
+        self.moltype = moltype
+
+        if os.path.isdir(source):
+            args = [(path, None, functional_group) for
+                    path in sorted(glob(os.path.join(source,
+                                                     glob_pattern)))]
+            task_size = chunksize
+        else:
+            supplier = rdkit.SDMolSupplier(source,
+                                           sanitize=False,
+                                           removeHs=False)
+            args = [
+                (source,
+                 range(i, min(i+chunksize, len(supplier))),
+                 functional_group)
+                for i in range(0, len(supplier), chunksize)
+            ]
+            # Each task already holds a chunk of records.
+            task_size = 1
+
+        if pool is not None:
+            results = pool.starmap(_index, args, task_size)
+        elif processes > 1 and len(args) > 1:
+            with WorkerPool(processes) as pool:
+                results = pool.starmap(_index, args, task_size)
+        else:
+            results = [_index(*arg) for arg in args]
+
+        self.entries = [entry for result in results for entry in result]
+        for entry in self.entries:
+            entry['key'] = tuple(entry['key'])
+            entry['fingerprint'] = DataStructs.UIntSparseIntVect(
+                                                entry['fingerprint'])
+
+    def dump(self, path):
+        """
+        Writes the index to a JSON file.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the file.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        entries = [
+            dict(entry,
+                 key=list(entry['key']),
+                 fingerprint=base64.b64encode(
+                        entry['fingerprint'].ToBinary()).decode())
+            for entry in self.entries
+        ]
+        with open(path, 'w') as f:
+            json.dump({'source': self.source, 'entries': entries}, f)
+
+    @classmethod
+    def load(cls, path, moltype=StructUnit):
+        """
+        Loads an index written by :meth:`dump`.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the file.
+
+        moltype : :class:`type`, optional
+            The class of the building blocks made by the library.
+
+        Returns
+        -------
+        :class:`BuildingBlockLibrary`
+            The library.
+
+        """
+
+        with open(path, 'r') as f:
+            index = json.load(f)
+
+        obj = cls.__new__(cls)
+        obj.source = index['source']
+        obj.moltype = moltype
+        obj.entries = index['entries']
+        for entry in obj.entries:
+            entry['key'] = tuple(entry['key'])
+            entry['fingerprint'] = DataStructs.UIntSparseIntVect(
+                            base64.b64decode(entry['fingerprint']))
+        return obj
+
+    def select(self, functional_group=None, fg_count=None):
+        """
+        Returns the indices of the building blocks which match.
+
+        Parameters
+        ----------
+        functional_group : :class:`str`, optional
+            Only building blocks with this functional group match. If
+            ``None``, any functional group matches.
+
+        fg_count : :class:`int`, optional
+            Only building blocks with this number of functional groups
+            match. If ``None``, any number matches.
+
+        Returns
+        -------
+        :class:`list` of :class:`int`
+            The indices of the matching entries in :attr:`entries`.
+
+        """
+
+        return [
+            i for i, entry in enumerate(self.entries)
+            if (functional_group is None or
+                entry['functional_group'] == functional_group) and
+            (fg_count is None or entry['fg_count'] == fg_count)
+        ]
+
+    def random(self, functional_group=None, fg_count=None):
+        """
+        Makes a random building block from the library.
+
+        Parameters
+        ----------
+        functional_group : :class:`str`, optional
+            Only building blocks with this functional group are
+            picked.
+
+        fg_count : :class:`int`, optional
+            Only building blocks with this number of functional groups
+            are picked.
+
+        Returns
+        -------
+        :class:`.StructUnit`
+            A random building block.
+
+        Raises
+        ------
+        :class:`RuntimeError`
+            If no building blocks match.
+
+        """
+
+        indices = self.select(functional_group, fg_count)
+        if not indices:
+            raise RuntimeError(
+                f'No building blocks in "{self.source}" match.')
+        return self[indices[np.random.randint(len(indices))]]
+
+    def diverse(self, size, functional_group=None, fg_count=None):
+        """
+        Makes a diverse set of building blocks from the library.
+
+        The first building block is picked at random and the rest by
+        a :class:`.MaxMinPicker`.
+
+        Parameters
+        ----------
+        size : :class:`int`
+            The number of building blocks to pick. If fewer match,
+            all the matching building blocks are returned.
+
+        functional_group : :class:`str`, optional
+            Only building blocks with this functional group are
+            picked.
+
+        fg_count : :class:`int`, optional
+            Only building blocks with this number of functional groups
+            are picked.
+
+        Returns
+        -------
+        :class:`list` of :class:`.StructUnit`
+            The picked building blocks.
+
+        """
+
+        indices = self.select(functional_group, fg_count)
+        size = min(size, len(indices))
+        if size == 0:
+            return []
+
+        picker = MaxMinPicker(self.entries[i]['fingerprint'] for
+                              i in indices)
+        picker.add(np.random.randint(len(indices)))
+        while len(picker.picked) < size:
+            picker.pick()
+        return [self[indices[i]] for i in picker.picked]
+
+    def __getitem__(self, index):
+        """
+        Makes a building block in the library.
+
+        Parameters
+        ----------
+        index : :class:`int`
+            The index of the building block in :attr:`entries`.
+
+        Returns
+        -------
+        :class:`.StructUnit`
+            The building block, an instance of :attr:`moltype`.
+
+        """
+
+        entry = self.entries[index]
+        if entry['record'] is None:
+            return self.moltype(entry['file'], entry['functional_group'])
+
+        supplier = rdkit.SDMolSupplier(entry['file'],
+                                       sanitize=False,
+                                       removeHs=False)
+        return self.moltype.rdkit_init(supplier[entry['record']],
+                                       entry['functional_group'])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return (f'BuildingBlockLibrary({self.source!r}, '
+                f'building_blocks={len(self)})')
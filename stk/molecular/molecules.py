@@ -161,19 +161,14 @@ import logging
 import json
 import os
 import numpy as np
-import networkx as nx
 import itertools as it
 import math
 import rdkit.Geometry.rdGeometry as rdkit_geo
 import rdkit.Chem.AllChem as rdkit
 from rdkit.Chem import rdMolTransforms
 
-from rdkit import DataStructs
 from glob import glob
 from functools import total_ordering, partial
-from scipy.spatial.distance import euclidean
-from scipy.optimize import minimize
-from sklearn.metrics.pairwise import euclidean_distances
 
 from collections import Counter, defaultdict
 from inspect import signature
@@ -181,16 +176,19 @@ from inspect import signature
 from . import topologies
 from .functional_groups import functional_groups, react, periodic_react
 from .energy import Energy
-import pywindow
+from .fingerprints import morgan_fingerprint, bulk_similarity
 from ..utilities import (flatten,
                          normalize_vector,
                          rotation_matrix,
                          vector_theta,
                          mol_from_mae_file,
+                         mae_conformers,
                          rotation_matrix_arbitrary_axis,
                          atom_vdw_radii,
                          Cell,
-                         remake)
+                         remake,
+                         canonical_key,
+                         INSTRUMENTATION)
 
 
 logger = logging.getLogger(__name__)
@@ -220,8 +218,10 @@ class Cached(type):
         key = self.gen_key(sig['building_blocks'], sig['topology'])
 
         if key in self.cache and OPTIONS['cache']:
+            INSTRUMENTATION.record(f'cache.{self.__name__}.hit')
             return self.cache[key]
         else:
+            INSTRUMENTATION.record(f'cache.{self.__name__}.miss')
             obj = super().__call__(*args, **kwargs)
             obj.key = key
             if OPTIONS['cache']:
@@ -266,9 +266,12 @@ class CachedStructUnit(type):
 
         key = self.gen_key(mol, fg)
         if key in self.cache and OPTIONS['cache']:
+            INSTRUMENTATION.record(f'cache.{self.__name__}.hit')
             return self.cache[key]
         else:
-            obj = super().__call__(*args, **kwargs)
+            INSTRUMENTATION.record(f'cache.{self.__name__}.miss')
+            with INSTRUMENTATION.timer('StructUnit.__init__'):
+                obj = super().__call__(*args, **kwargs)
             obj.key = key
             if OPTIONS['cache']:
                 self.cache[key] = obj
@@ -328,6 +331,13 @@ class Molecule:
         Indicates whether a :class:`Molecule` has been passed through
         an optimization function or not.
 
+    structure_version : :class:`int`
+        Incremented each time the positions of the atoms are changed
+        by a method of the molecule or by an optimization function.
+        Values calculated from the structure of the molecule are out
+        of date if this has changed since. Changes made to
+        :attr:`mol` directly are not tracked.
+
     name : :class:`str`
         A name which can be optionally given to the molecule for easy
         identification.
@@ -339,6 +349,7 @@ class Molecule:
     """
 
     subclasses = {}
+    structure_version = 0
 
     def __init__(self, name="", note=""):
         self.optimized = False
@@ -432,6 +443,10 @@ class Molecule:
 
         """
 
+        # scipy.spatial is slow to import, so only import it when
+        # needed.
+        from scipy.spatial.distance import euclidean
+
         # Get the atomic positions of each atom and use the scipy
         # function to calculate their distance in Euclidean space.
         atom1_coords = self.atom_coords(atom1_id, conformer)
@@ -533,8 +548,8 @@ class Molecule:
         atom_vdw = np.array([atom_vdw_radii[x.GetSymbol()] for x
                             in self.mol.GetAtoms()])
         pos_mat = self.mol.GetConformer(conformer).GetPositions()
-        distances = euclidean_distances(pos_mat, np.array([origin]))
-        distances = distances.flatten() - atom_vdw
+        distances = np.linalg.norm(pos_mat - origin, axis=1)
+        distances = distances - atom_vdw
         return -2*min(distances)
 
     def cavity_size(self, conformer=-1):
@@ -560,6 +575,11 @@ class Molecule:
         # What this function does is finds the value of `origin` which
         # causes _cavity_size() to calculate the largest possible
         # cavity.
+
+        # scipy.optimize is slow to import, so only import it when
+        # needed.
+        from scipy.optimize import minimize
+
         ref = self.center_of_mass(conformer)
         icavity = 0.5*self._cavity_size(ref, conformer)
         bounds = [(coord+icavity, coord-icavity) for coord in ref]
@@ -755,7 +775,7 @@ class Molecule:
 
         c1 = self.fg_centroid(fg1, conformer)
         c2 = self.fg_centroid(fg2, conformer)
-        return euclidean(c1, c2)
+        return np.linalg.norm(c1 - c2)
 
     @classmethod
     def from_dict(self, json_dict, optimized=True, load_names=True):
@@ -807,6 +827,9 @@ class Molecule:
         # the atom ids from each end of a bond to define edges. Do this
         # for all bonds to account for all edges.
 
+        # networkx is slow to import, so only import it when needed.
+        import networkx as nx
+
         graph = nx.Graph()
 
         for atom in self.mol.GetAtoms():
@@ -889,8 +912,12 @@ class Molecule:
 
         """
 
+        # scipy.spatial is slow to import, so only import it when
+        # needed.
+        from scipy.spatial.distance import cdist
+
         coords = self.mol.GetConformer(conformer).GetPositions()
-        dist = euclidean_distances(coords, coords)
+        dist = cdist(coords, coords)
         vdw = np.array([[atom_vdw_radii[self.atom_symbol(i)] for
                         i in range(self.mol.GetNumAtoms())]])
         dist = dist + vdw + vdw.T
@@ -913,6 +940,31 @@ class Molecule:
 
         """
 
+        pos_mat = self.mol.GetConformer(conformer).GetPositions()
+        return self.mdl_mol_block_template().format(*pos_mat.ravel())
+
+    def mdl_mol_block_template(self):
+        """
+        Returns a V3000 mol block of the molecule without coordinates.
+
+        The coordinates of each atom are replaced by ``{:.4f}``
+        fields, so that
+
+        .. code-block:: python
+
+            pos_mat = mol.mol.GetConformer().GetPositions()
+            mol.mdl_mol_block_template().format(*pos_mat.ravel())
+
+        gives the mol block of the molecule. Molecules with the same
+        atoms and bonds, in the same order, have the same template.
+
+        Returns
+        -------
+        :class:`str`
+            The V3000 mol block template of the molecule.
+
+        """
+
         # Kekulize the mol, which means that each aromatic bond is
         # converted to a single or double. This is necessary because
         # .mol V3000 only supports integer bonds. However, this fails
@@ -925,27 +977,16 @@ class Molecule:
         n_atoms = self.mol.GetNumAtoms()
         n_bonds = self.mol.GetNumBonds()
 
-        dtype = np.dtype(object)
-
-        atom_ids = np.array([np.arange(1, n_atoms+1)],
-                            dtype=dtype).T
-
-        atom_symbols = np.array([[self.atom_symbol(i)]
-                                 for i in range(n_atoms)],
-                                dtype=dtype)
-
-        pos_mat = self.mol.GetConformer(conformer).GetPositions()
-
-        charges = np.array([[f' CHG={a.GetFormalCharge()}' if
-                             a.GetFormalCharge() else '']
-                            for a in self.mol.GetAtoms()],
-                           dtype=dtype)
-
-        atom_data = np.concatenate(
-                        [atom_ids, atom_symbols, pos_mat, charges],
-                        axis=1).reshape((-1, ))
-        atom_block = "M  V30 {} {} {:.4f} {:.4f} {:.4f} 0{}\n"*n_atoms
-        atom_block = atom_block.format(*atom_data)
+        atom_block = ''.join(
+            f'M  V30 {i} {self.atom_symbol(i-1)} {{:.4f}} {{:.4f}} '
+            f'{{:.4f}} 0{charge}\n'
+            for i, charge in enumerate(
+                (f' CHG={a.GetFormalCharge()}' if
+                 a.GetFormalCharge() else '' for
+                 a in self.mol.GetAtoms()),
+                1
+            )
+        )
 
         bond_data = [prop for bond in self.mol.GetBonds() for prop in
                      (bond.GetIdx(),
@@ -989,6 +1030,16 @@ class Molecule:
 
         """
 
+        if self is other:
+            return True
+
+        # Molecules with the same key are made from the same
+        # building blocks and topology, or have the same InChI, so
+        # there is no need to make their InChIs.
+        key = getattr(self, 'key', None)
+        if key is not None and key == getattr(other, 'key', None):
+            return True
+
         return self.inchi == other.inchi
 
     def retag_atoms(self):
@@ -1187,6 +1238,7 @@ class Molecule:
         # is at `position`.
         self.mol.RemoveConformer(conf_id)
         self.mol.AddConformer(new_conf)
+        self.structure_version += 1
 
         return self.mol
 
@@ -1221,6 +1273,7 @@ class Molecule:
                                       coord_mat.item(1),
                                       coord_mat.item(2))
             conf.SetAtomPosition(i, coord)
+        self.structure_version += 1
 
     def shift(self, shift, conformer=-1):
         """
@@ -1295,11 +1348,14 @@ class Molecule:
         """
         Updates molecular structure to match an ``.mae`` file.
 
+        If the file holds more than one structure, the last one is
+        used.
+
         Parameters
         ----------
         path : :class:`str`
-            The full path of the ``.mae`` file from which the structure
-            should be updated.
+            The full path of the ``.mae`` or ``.maegz`` file from which
+            the structure should be updated.
 
         conformer : :class:`int`, optional
             The conformer to be updated.
@@ -1308,16 +1364,30 @@ class Molecule:
         -------
         None : :class:`NoneType`
 
+        Raises
+        ------
+        :class:`ValueError`
+            If the file holds no structures.
+
         """
 
         if conformer == -1:
             conformer = self.mol.GetConformer(conformer).GetId()
 
-        mol = mol_from_mae_file(path)
-        conf = rdkit.Conformer(mol.GetConformer())
+        coords = None
+        for _, coords in mae_conformers(path):
+            continue
+
+        if coords is None:
+            raise ValueError(f'"{path}" holds no structures.')
+
+        conf = rdkit.Conformer(len(coords))
+        for atom_id, (x, y, z) in enumerate(coords):
+            conf.SetAtomPosition(atom_id, rdkit_geo.Point3D(x, y, z))
         conf.SetId(conformer)
         self.mol.RemoveConformer(conformer)
         self.mol.AddConformer(conf)
+        self.structure_version += 1
 
     def update_from_mol(self, path, conformer=-1):
         """
@@ -1348,6 +1418,7 @@ class Molecule:
         conf.SetId(conformer)
         self.mol.RemoveConformer(conformer)
         self.mol.AddConformer(conf)
+        self.structure_version += 1
 
     def update_stereochemistry(self, conformer=-1):
         """
@@ -1582,6 +1653,10 @@ class StructUnit(Molecule, metaclass=CachedStructUnit):
         """
         Picks a random file from `db` to initialize from.
 
+        The files in `db` are listed on every call. When many picks
+        are made from the same database, a :class:`.BuildingBlockLibrary`
+        is faster.
+
         Parameters
         ----------
         db : :class:`str`
@@ -1646,7 +1721,7 @@ class StructUnit(Molecule, metaclass=CachedStructUnit):
         centroids = it.combinations(self.bonder_centroids(conformer), 2)
         ids = it.combinations(range(len(self.bonder_ids)), 2)
         for (id1, id2), (c1, c2) in zip(ids, centroids):
-                yield id1, id2, euclidean(c1, c2)
+                yield id1, id2, np.linalg.norm(c1 - c2)
 
     def bonder_direction_vectors(self, conformer=-1):
         """
@@ -2080,6 +2155,7 @@ class StructUnit(Molecule, metaclass=CachedStructUnit):
         # Make sure the rkdit molecule has only one conformer.
         self.mol.RemoveConformer(conf_id)
         self.mol.AddConformer(new_conf)
+        self.structure_version += 1
 
         return self.mol
 
@@ -2210,22 +2286,34 @@ class StructUnit(Molecule, metaclass=CachedStructUnit):
 
         """
 
-        # First get the fingerprint of `self`.
-        rdkit.GetSSSR(self.mol)
-        self.mol.UpdatePropertyCache(strict=False)
-        fp = rdkit.GetMorganFingerprint(self.mol, 4)
+        mols = list(mols)
+        similarities = bulk_similarity(
+                            self.fingerprint(),
+                            [morgan_fingerprint(mol) for mol in mols])
+        # A stable sort keeps molecules with equal similarities in
+        # the order of `mols`.
+        order = np.argsort(-similarities, kind='stable')
+        return [(float(similarities[i]), mols[i]) for i in order]
+
+    def fingerprint(self):
+        """
+        Returns the Morgan fingerprint of radius 4 of the molecule.
+
+        The fingerprint is calculated the first time it is needed and
+        kept. It depends only on the atoms and bonds of the molecule,
+        so optimizing the molecule does not change it.
 
-        # For every structure file in the database create a rdkit
-        # molecule. Place these in a list.
-        similarities = []
-        for mol in mols:
-            rdkit.GetSSSR(mol)
-            mol.UpdatePropertyCache(strict=False)
-            mol_fp = rdkit.GetMorganFingerprint(mol, 4)
-            similarity = DataStructs.DiceSimilarity(fp, mol_fp)
-            similarities.append((similarity, mol))
+        Returns
+        -------
+        :class:`rdkit.DataStructs.cDataStructs.UIntSparseIntVect`
+            The fingerprint. See :mod:`.fingerprints`.
 
-        return sorted(similarities, reverse=True, key=lambda x: x[0])
+        """
+
+        fp = getattr(self, '_fingerprint', None)
+        if fp is None:
+            fp = self._fingerprint = morgan_fingerprint(self.mol)
+        return fp
 
     @classmethod
     def smiles_init(cls,
@@ -2377,6 +2465,7 @@ class StructUnit(Molecule, metaclass=CachedStructUnit):
                 atom.SetIntProp(tag, tag_id)
                 tag_id += 1
 
+    @INSTRUMENTATION.timed('StructUnit.tag_atoms')
     def tag_atoms(self):
         """
         Adds atom properties to atoms.
@@ -2911,7 +3000,7 @@ class MacroMolecule(Molecule, metaclass=Cached):
                     coremol.RemoveAtom(atomid)
             yield coremol.GetMol()
 
-    def json(self):
+    def json(self, building_blocks=True):
         """
         Returns a JSON representation of the molecule.
 
@@ -2931,6 +3020,16 @@ class MacroMolecule(Molecule, metaclass=Cached):
                 'name' : 'Poly-Benzene'
             }
 
+        Parameters
+        ----------
+        building_blocks : :class:`bool`, optional
+            If ``False``, ``'building_blocks'`` is left out and
+            building blocks in ``'bb_counter'`` are represented by
+            their keys, given by :func:`.canonical_key`, instead of
+            their JSON representations. The building blocks then have
+            to be stored separately, as done by
+            :meth:`.Population.dump_jsonl`.
+
         Returns
         -------
         :class:`dict`
@@ -2938,14 +3037,10 @@ class MacroMolecule(Molecule, metaclass=Cached):
 
         """
 
-        return {
-            'bb_counter': [(key.json(), val) for key, val in
-                           self.bb_counter.items()],
+        json_dict = {
             'bonds_made': self.bonds_made,
             'class': self.__class__.__name__,
             'mol_block': self.mdl_mol_block(),
-            'building_blocks': [x.json() for x in
-                                self.building_blocks],
             'topology': repr(self.topology),
             'unscaled_fitness': repr(self.unscaled_fitness),
             'progress_params': self.progress_params,
@@ -2955,6 +3050,17 @@ class MacroMolecule(Molecule, metaclass=Cached):
 
         }
 
+        if building_blocks:
+            json_dict['bb_counter'] = [(key.json(), val) for key, val in
+                                       self.bb_counter.items()]
+            json_dict['building_blocks'] = [x.json() for x in
+                                            self.building_blocks]
+        else:
+            json_dict['bb_counter'] = [(canonical_key(key.key), val) for
+                                       key, val in self.bb_counter.items()]
+
+        return json_dict
+
     @classmethod
     def _json_init(cls, json_dict):
         """
@@ -2975,8 +3081,12 @@ class MacroMolecule(Molecule, metaclass=Cached):
 
         """
 
-        bb_counter = Counter({Molecule.from_dict(key): val for
-                              key, val in json_dict['bb_counter']})
+        # Building blocks may have been loaded already, for example
+        # by Population.load_jsonl.
+        bb_counter = Counter({
+            Molecule.from_dict(key) if isinstance(key, dict) else key:
+            val for key, val in json_dict['bb_counter']
+        })
         bbs = list(bb_counter)
         topology = eval(json_dict['topology'],  topologies.__dict__)
 
@@ -3299,6 +3409,9 @@ class Cage(MacroMolecule):
 
         """
 
+        # pywindow is slow to import, so only import it when needed.
+        import pywindow
+
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             # Load an RDKit molecule object to pywindow.
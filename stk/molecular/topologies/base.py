@@ -70,7 +70,10 @@ from inspect import signature
 from collections import Counter
 
 from ..functional_groups import react
-from ...utilities import dedupe, add_fragment_props, remake
+from ...utilities import (dedupe,
+                          add_fragment_props,
+                          remake,
+                          INSTRUMENTATION)
 
 
 def remove_confs(building_blocks, keep):
@@ -177,6 +180,7 @@ class Topology(metaclass=TopologyMeta):
     def __init__(self, react_del=True):
         self.react_del = react_del
 
+    @INSTRUMENTATION.timed('build')
     def build(self, macro_mol, bb_conformers=None):
         """
         Assembles ``rdkit`` instances of macromolecules.
@@ -225,14 +229,18 @@ class Topology(metaclass=TopologyMeta):
         macro_mol.mol = rdkit.Mol()
         macro_mol.bb_counter = Counter()
 
-        self.place_mols(macro_mol)
-        self.prepare(macro_mol)
+        with INSTRUMENTATION.timer('build.place_mols'):
+            self.place_mols(macro_mol)
+        with INSTRUMENTATION.timer('build.prepare'):
+            self.prepare(macro_mol)
         for fgs in self.bonded_fgs(macro_mol):
-            macro_mol.mol, new_bonds = react(macro_mol.mol,
-                                             self.react_del,
-                                             *fgs)
+            with INSTRUMENTATION.timer('build.react'):
+                macro_mol.mol, new_bonds = react(macro_mol.mol,
+                                                 self.react_del,
+                                                 *fgs)
             macro_mol.bonds_made += new_bonds
-        self.cleanup(macro_mol)
+        with INSTRUMENTATION.timer('build.cleanup'):
+            self.cleanup(macro_mol)
 
         # Make sure that the property cache of each atom is up to date.
         for atom in macro_mol.mol.GetAtoms():
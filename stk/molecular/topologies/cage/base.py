@@ -1,6 +1,5 @@
 import itertools
 from collections import deque
-from scipy.spatial.distance import euclidean
 import numpy as np
 import rdkit.Chem.AllChem as rdkit
 
@@ -785,7 +784,7 @@ class CageTopology(Topology):
         for fg in vertex.fg_ids:
             fg_coord = macro_mol.fg_centroid(fg)
             for position in vertex.connected:
-                distance = euclidean(fg_coord, position.coord*scale)
+                distance = np.linalg.norm(fg_coord - position.coord*scale)
                 distances.append((distance, fg, position))
 
         # Sort the pairings of fgs with potential bonding position,
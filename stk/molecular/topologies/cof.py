@@ -69,7 +69,6 @@ are registered in :attr:`.Periodic.periodic_bonds`.
 
 import rdkit.Chem.AllChem as rdkit
 import numpy as np
-from scipy.spatial.distance import euclidean
 from collections import deque
 
 from .base import Topology
@@ -466,9 +465,8 @@ class Edge:
                 fg_ids.append(a.GetIntProp('fg_id'))
 
         v1coord = self.v1.calc_coord(cell_params)
-        fgs = sorted(fg_ids, key=lambda x: euclidean(
-                                             v1coord,
-                                             macro_mol.fg_centroid(x)))
+        fgs = sorted(fg_ids, key=lambda x: np.linalg.norm(
+                                        v1coord - macro_mol.fg_centroid(x)))
         self.fg_map = {0: fgs[0], 1: fgs[1]}
 
 
@@ -737,13 +735,11 @@ class NoLinkerHoneycomb(NoLinkerCOFLattice):
         # atom in the bottom fragment closest to the position of the
         # top fragment.
         bottom_fg2 = min(bottom,
-                         key=lambda x: euclidean(
-                                            self.vertices[1],
-                                            macro_mol.fg_centroid(x)))
+                         key=lambda x: np.linalg.norm(
+                                  self.vertices[1] - macro_mol.fg_centroid(x)))
         top_fg2 = min(top,
-                      key=lambda x: euclidean(
-                                            self.vertices[0],
-                                            macro_mol.fg_centroid(x)))
+                      key=lambda x: np.linalg.norm(
+                               self.vertices[0] - macro_mol.fg_centroid(x)))
         yield top_fg2, bottom_fg2
 
     def place_mols(self, macro_mol):
@@ -4,17 +4,20 @@ Defines optimization functions which use MacroModel.
 """
 
 import os
-import subprocess as sp
+import asyncio
 import time
-import rdkit.Chem.AllChem as rdkit
 import warnings
-import psutil
 import re
+import itertools as it
 from uuid import uuid4
+from functools import partial, lru_cache
 import logging
-import gzip
 
-from ..utilities import MAEExtractor, flatten
+from ..utilities import (lowest_energy_conformers,
+                         flatten,
+                         EXECUTOR,
+                         run_coroutine,
+                         TELEMETRY)
 
 
 logger = logging.getLogger(__name__)
@@ -121,10 +124,60 @@ def macromodel_opt(mol,
 
     """
 
+    return run_coroutine(macromodel_opt_async(mol,
+                                              macromodel_path,
+                                              settings,
+                                              md,
+                                              conformer))
+
+
+async def macromodel_opt_async(mol,
+                               macromodel_path,
+                               settings=None,
+                               md=None,
+                               conformer=-1,
+                               executor=None):
+    """
+    Optimizes the molecule using MacroModel, asynchronously.
+
+    This is the coroutine version of :func:`macromodel_opt`. Awaiting
+    it runs the optimization through `executor`, which allows many
+    molecules to be optimized at the same time from a single process.
+
+    Parameters
+    ----------
+    mol : :class:`.Molecule`
+        The molecule who's structure must be optimized.
+
+    macromodel_path : :class:`str`
+        The full path of the Schrodinger suite within the user's
+        machine.
+
+    settings : :class:`dict`, optional
+        See :func:`macromodel_opt`.
+
+    md : :class:`dict`, optional
+        See :func:`macromodel_opt`.
+
+    conformer : :class:`int`, optional
+        The id of the conformer to be optimized.
+
+    executor : :class:`.Executor`, optional
+        The executor used to run MacroModel. If ``None``,
+        :data:`.EXECUTOR` is used.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
     if settings is None:
         settings = {}
     if md is None:
         md = {}
+    if executor is None:
+        executor = EXECUTOR
 
     vals = {
              'restricted': True,
@@ -137,36 +190,44 @@ def macromodel_opt(mol,
     vals.update(settings)
 
     try:
-        mol._file = '{}.mol'.format(uuid4().int)
-        # First write a .mol file of the molecule.
-        mol.write(mol._file, conformer)
-        # MacroModel requires a ``.mae`` file as input. This creates a
-        # ``.mae`` file holding the molecule.
-        _create_mae(mol, macromodel_path)
-        # generate the ``.com`` file for the MacroModel run.
-        _generate_com(mol, vals)
-        # Run the optimization.
-        _run_bmin(mol, macromodel_path, vals['timeout'])
-        # Get the ``.maegz`` file output from the optimization and
-        # convert it to a ``.mae`` file.
-        _convert_maegz_to_mae(mol)
-        mol.update_from_mae(mol._file.replace('.mol', '.mae'),
-                            conformer)
+        # All files of the run are written into a job directory, which
+        # is cleaned up once the structure has been updated.
+        with executor.workspace.job('macromodel') as job_dir:
+            mol._file = os.path.join(job_dir,
+                                     '{}.mol'.format(uuid4().int))
+            # First write a .mol file of the molecule.
+            mol.write(mol._file, conformer)
+            # MacroModel requires a ``.mae`` file as input. This
+            # creates a ``.mae`` file holding the molecule.
+            await _create_mae(mol, macromodel_path, executor)
+            # generate the ``.com`` file for the MacroModel run.
+            _generate_com(mol, vals)
+            # Run the optimization.
+            await _run_bmin(mol,
+                            macromodel_path,
+                            vals['timeout'],
+                            executor)
+            # Update the structure from the ``.maegz`` file output by
+            # the optimization.
+            name, ext = os.path.splitext(mol._file)
+            mol.update_from_mae(name + '-out.maegz', conformer)
 
         if vals['restricted'] == 'both':
             new_vals = dict(vals)
             new_vals['md'] = False
             new_vals['restricted'] = False
-            macromodel_opt(mol=mol,
-                           macromodel_path=macromodel_path,
-                           settings=new_vals,
-                           md={})
+            await macromodel_opt_async(mol=mol,
+                                       macromodel_path=macromodel_path,
+                                       settings=new_vals,
+                                       md={},
+                                       executor=executor)
 
         if vals['md']:
-            _macromodel_md_opt(mol,
-                               macromodel_path,
-                               md,
-                               conformer)
+            await _macromodel_md_opt(mol,
+                                     macromodel_path,
+                                     md,
+                                     conformer,
+                                     executor)
 
     except _ForceFieldError as ex:
         # If OPLS_2005 has been tried already - record an exception.
@@ -177,12 +238,14 @@ def macromodel_opt(mol,
         logger.warning(('Minimization with OPLS3 failed on "{}". '
                         'Trying OPLS_2005.').format(mol.name))
 
+        TELEMETRY.add_event('OPLS_2005 fallback')
         vals['force_field'] = 14
-        return macromodel_opt(mol,
-                              macromodel_path,
-                              vals,
-                              md,
-                              conformer)
+        return await macromodel_opt_async(mol,
+                                          macromodel_path,
+                                          vals,
+                                          md,
+                                          conformer,
+                                          executor)
 
 
 def macromodel_cage_opt(mol,
@@ -266,10 +329,58 @@ def macromodel_cage_opt(mol,
 
     """
 
+    return run_coroutine(macromodel_cage_opt_async(mol,
+                                                   macromodel_path,
+                                                   settings,
+                                                   md,
+                                                   conformer))
+
+
+async def macromodel_cage_opt_async(mol,
+                                    macromodel_path,
+                                    settings=None,
+                                    md=None,
+                                    conformer=-1,
+                                    executor=None):
+    """
+    Optimizes the cage using MacroModel, asynchronously.
+
+    This is the coroutine version of :func:`macromodel_cage_opt`.
+
+    Parameters
+    ----------
+    mol : :class:`.Molecule`
+        The molecule who's structure must be optimized.
+
+    macromodel_path : :class:`str`
+        The full path of the Schrodinger suite within the user's
+        machine.
+
+    settings : :class:`dict`, optional
+        See :func:`macromodel_cage_opt`.
+
+    md : :class:`dict`, optional
+        See :func:`macromodel_cage_opt`.
+
+    conformer : :class:`int`, optional
+        The id of the conformer to be optimized.
+
+    executor : :class:`.Executor`, optional
+        The executor used to run MacroModel. If ``None``,
+        :data:`.EXECUTOR` is used.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
     if settings is None:
         settings = {}
     if md is None:
         md = {}
+    if executor is None:
+        executor = EXECUTOR
 
     vals = {
              'restricted': True,
@@ -282,30 +393,37 @@ def macromodel_cage_opt(mol,
     vals.update(settings)
 
     try:
-        mol._file = '{}.mol'.format(uuid4().int)
-        # First write a .mol file of the molecule.
-        mol.write(mol._file, conformer)
-        # MacroModel requires a ``.mae`` file as input. This creates a
-        # ``.mae`` file holding the molecule.
-        _create_mae(mol, macromodel_path)
-        # generate the ``.com`` file for the MacroModel run.
-        _generate_com(mol, vals)
-        # Run the optimization.
-        _run_bmin(mol, macromodel_path, vals['timeout'])
-        # Get the ``.maegz`` file output from the optimization and
-        # convert it to a ``.mae`` file.
-        _convert_maegz_to_mae(mol)
-        mol.update_from_mae(mol._file.replace('.mol', '.mae'),
-                            conformer)
+        # All files of the run are written into a job directory, which
+        # is cleaned up once the structure has been updated.
+        with executor.workspace.job('macromodel') as job_dir:
+            mol._file = os.path.join(job_dir,
+                                     '{}.mol'.format(uuid4().int))
+            # First write a .mol file of the molecule.
+            mol.write(mol._file, conformer)
+            # MacroModel requires a ``.mae`` file as input. This
+            # creates a ``.mae`` file holding the molecule.
+            await _create_mae(mol, macromodel_path, executor)
+            # generate the ``.com`` file for the MacroModel run.
+            _generate_com(mol, vals)
+            # Run the optimization.
+            await _run_bmin(mol,
+                            macromodel_path,
+                            vals['timeout'],
+                            executor)
+            # Update the structure from the ``.maegz`` file output by
+            # the optimization.
+            name, ext = os.path.splitext(mol._file)
+            mol.update_from_mae(name + '-out.maegz', conformer)
 
         if vals['restricted'] == 'both':
             new_vals = dict(vals)
             new_vals['md'] = False
             new_vals['restricted'] = False
-            macromodel_opt(mol=mol,
-                           macromodel_path=macromodel_path,
-                           settings=new_vals,
-                           md={})
+            await macromodel_opt_async(mol=mol,
+                                       macromodel_path=macromodel_path,
+                                       settings=new_vals,
+                                       md={},
+                                       executor=executor)
 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
@@ -315,10 +433,11 @@ def macromodel_cage_opt(mol,
                                mol.topology.n_windows)
 
                 if vals['md'] and all_windows:
-                    _macromodel_md_opt(mol,
-                                       macromodel_path,
-                                       md,
-                                       conformer)
+                    await _macromodel_md_opt(mol,
+                                             macromodel_path,
+                                             md,
+                                             conformer,
+                                             executor)
 
     except _ForceFieldError as ex:
         # If OPLS_2005 has been tried already - record an exception.
@@ -329,18 +448,21 @@ def macromodel_cage_opt(mol,
         logger.warning(('Minimization with OPLS3 failed on "{}". '
                         'Trying OPLS_2005.').format(mol.name))
 
+        TELEMETRY.add_event('OPLS_2005 fallback')
         vals['force_field'] = 14
-        return macromodel_cage_opt(mol,
-                                   macromodel_path,
-                                   vals,
-                                   md,
-                                   conformer)
-
-
-def _macromodel_md_opt(mol,
-                       macromodel_path,
-                       settings=None,
-                       conformer=-1):
+        return await macromodel_cage_opt_async(mol,
+                                               macromodel_path,
+                                               vals,
+                                               md,
+                                               conformer,
+                                               executor)
+
+
+async def _macromodel_md_opt(mol,
+                             macromodel_path,
+                             settings=None,
+                             conformer=-1,
+                             executor=None):
     """
     Runs a MD conformer search on `mol`.
 
@@ -393,6 +515,10 @@ def _macromodel_md_opt(mol,
     conformer : :class:`int`, optional
         The id of the conformer to be optimized.
 
+    executor : :class:`.Executor`, optional
+        The executor used to run MacroModel. If ``None``,
+        :data:`.EXECUTOR` is used.
+
     Returns
     -------
     None : :class:`NoneType`
@@ -401,6 +527,8 @@ def _macromodel_md_opt(mol,
 
     if settings is None:
         settings = {}
+    if executor is None:
+        executor = EXECUTOR
 
     vals = {
                'timeout': None,
@@ -418,19 +546,27 @@ def _macromodel_md_opt(mol,
 
     logger.info('Running MD on "{}".'.format(mol.name))
     try:
-        mol._file = '{}.mol'.format(uuid4().int)
-        # First write a .mol file of the molecule.
-        mol.write(mol._file, conformer)
-        # MacroModel requires a ``.mae`` file as input. This creates a
-        # ``.mae`` file holding the molecule.
-        _create_mae(mol, macromodel_path)
-        # Generate the ``.com`` file for the MacroModel MD run.
-        _generate_md_com(mol, vals)
-        # Run the optimization.
-        _run_bmin(mol, macromodel_path, vals['timeout'])
-        # Extract the lowest energy conformer into its own .mae file.
-        conformer_mae = MAEExtractor(mol._file).path
-        mol.update_from_mae(conformer_mae, conformer)
+        with executor.workspace.job('macromodel_md') as job_dir:
+            mol._file = os.path.join(job_dir,
+                                     '{}.mol'.format(uuid4().int))
+            # First write a .mol file of the molecule.
+            mol.write(mol._file, conformer)
+            # MacroModel requires a ``.mae`` file as input. This
+            # creates a ``.mae`` file holding the molecule.
+            await _create_mae(mol, macromodel_path, executor)
+            # Generate the ``.com`` file for the MacroModel MD run.
+            _generate_md_com(mol, vals)
+            # Run the optimization.
+            await _run_bmin(mol,
+                            macromodel_path,
+                            vals['timeout'],
+                            executor)
+            # Update the structure to the lowest energy conformer
+            # found.
+            name, ext = os.path.splitext(mol._file)
+            (_, coords), = lowest_energy_conformers(
+                                                name + '-out.maegz')
+            mol.set_position_from_matrix(coords.T, conformer)
 
     except _ForceFieldError as ex:
         # If OPLS_2005 has been tried already - record an exception.
@@ -440,105 +576,96 @@ def _macromodel_md_opt(mol,
         logger.warning(('Minimization with OPLS3 failed on "{}". '
                         'Trying OPLS_2005.').format(mol.name))
 
+        TELEMETRY.add_event('OPLS_2005 fallback')
         vals['force_field'] = 14
-        return _macromodel_md_opt(mol,
-                                  macromodel_path,
-                                  vals,
-                                  conformer)
+        return await _macromodel_md_opt(mol,
+                                        macromodel_path,
+                                        vals,
+                                        conformer,
+                                        executor)
 
 
-def _run_bmin(macro_mol, macromodel_path, timeout):
+async def _run_bmin(macro_mol, macromodel_path, timeout, executor):
 
     logger.info('Running bmin on "{}".'.format(macro_mol.name))
 
-    # To run MacroModel a command is issued to the console via
-    # ``subprocess.Popen``. The command is the full path of the
-    # ``bmin`` program. ``bmin`` is located in the Schrodinger
-    # installation folder.
+    # To run MacroModel a command is issued to the console via the
+    # executor. The command is the full path of the ``bmin`` program.
+    # ``bmin`` is located in the Schrodinger installation folder.
     file_root, ext = os.path.splitext(macro_mol._file)
+    job_dir, name = os.path.split(file_root)
     log_file = file_root + '.log'
     opt_app = os.path.join(macromodel_path, "bmin")
     # The first member of the list is the command, the following ones
-    # are any additional arguments.
-
-    opt_cmd = [opt_app, file_root, "-WAIT", "-LOCAL"]
-
-    incomplete = True
-    while incomplete:
-        opt_proc = psutil.Popen(opt_cmd,
-                                stdout=sp.PIPE,
-                                stderr=sp.STDOUT,
-                                universal_newlines=True)
-        try:
-            proc_out, _ = opt_proc.communicate(timeout=timeout)
-
-        except sp.TimeoutExpired:
-            logger.warning(('Minimization took too long'
-                            ' and was terminated '
-                            f'by force on "{macro_mol.name}".'))
-            _kill_bmin(macro_mol, macromodel_path)
-            proc_out = ""
-
-        logger.debug(
-            f'Output of bmin on "{macro_mol.name}" was: {proc_out}.')
-
-        with open(log_file, 'r') as log:
-            log_content = log.read()
-
-        # Check the log for error reports.
-        if ("termination due to error condition           21-" in
-           log_content):
-            raise _OptimizationError(("`bmin` crashed due to"
-                                      " an error condition. "
-                                      "See .log file."))
-
-        if ("FATAL do_nosort_typing: NO MATCH found for atom " in
-           log_content):
-            raise _ForceFieldError(
-                            'The log implies the force field failed.')
-
-        if (("FATAL gen_lewis_structure(): could not find best Lewis"
-             " structure") in log_content and
-            ("skipping input structure  due to "
-             "forcefield interaction errors") in log_content):
-            raise _LewisStructureError(
-                    '`bmin` failed due to poor Lewis structure.')
-
-        # If optimization fails because a wrong Schrodinger path was
-        # given, raise.
-        if 'The system cannot find the path specified' in proc_out:
-            raise _PathError(('Wrong Schrodinger path supplied to'
-                              ' `macromodel_opt` function.'))
-
-        # If optimization fails because the license is not found, rerun
-        # the function.
-        if _license_found(proc_out, macro_mol):
-            incomplete = False
+    # are any additional arguments. ``bmin`` is run inside the job
+    # directory, so only the name of the job is passed.
+
+    opt_cmd = [opt_app, name, "-WAIT", "-LOCAL"]
+
+    # If optimization fails because the license is not found, the
+    # executor reruns the command. If the optimization takes too long,
+    # it is stopped via job control.
+    job = await executor.run(
+                'bmin',
+                opt_cmd,
+                timeout=timeout,
+                cwd=job_dir or None,
+                license_found=partial(_license_found, mol=macro_mol),
+                on_timeout=partial(_kill_bmin,
+                                   macro_mol,
+                                   macromodel_path,
+                                   executor))
+    proc_out = job.output
+
+    logger.debug(
+        f'Output of bmin on "{macro_mol.name}" was: {proc_out}.')
+
+    with open(log_file, 'r') as log:
+        log_content = log.read()
+
+    # Check the log for error reports.
+    if ("termination due to error condition           21-" in
+       log_content):
+        raise _OptimizationError(("`bmin` crashed due to"
+                                  " an error condition. "
+                                  "See .log file."))
+
+    if ("FATAL do_nosort_typing: NO MATCH found for atom " in
+       log_content):
+        raise _ForceFieldError(
+                        'The log implies the force field failed.')
+
+    if (("FATAL gen_lewis_structure(): could not find best Lewis"
+         " structure") in log_content and
+        ("skipping input structure  due to "
+         "forcefield interaction errors") in log_content):
+        raise _LewisStructureError(
+                '`bmin` failed due to poor Lewis structure.')
+
+    # If optimization fails because a wrong Schrodinger path was
+    # given, raise.
+    if 'The system cannot find the path specified' in proc_out:
+        raise _PathError(('Wrong Schrodinger path supplied to'
+                          ' `macromodel_opt` function.'))
 
     # Make sure the .maegz file created by the optimization is present.
     maegz = file_root + '-out.maegz'
-    _wait_for_file(maegz)
+    await executor.wait_for_file(maegz)
     if not os.path.exists(log_file) or not os.path.exists(maegz):
         raise _OptimizationError(('The .log and/or .maegz '
                                   'files were not created by '
                                   'the optimization.'))
 
 
-def _kill_bmin(macro_mol, macromodel_path):
+async def _kill_bmin(macro_mol, macromodel_path, executor):
     name, ext = os.path.splitext(macro_mol._file)
     name = re.split(r'\\|/', name)[-1]
     app = os.path.join(macromodel_path, 'jobcontrol')
     cmd = [app, '-stop', name]
 
-    incomplete = True
-    while incomplete:
-        out = sp.run(cmd, stdout=sp.PIPE,
-                     stderr=sp.STDOUT, universal_newlines=True)
-
-        # If no license if found, keep re-running the function until it
-        # is.
-        if _license_found(out.stdout):
-            incomplete = False
+    # If no license if found, the executor keeps re-running the
+    # command until it is.
+    await executor.run('jobcontrol', cmd, license_found=_license_found)
 
     # This loop causes the function to wait until the job has been
     # killed via job control. This means the output files will have
@@ -548,11 +675,13 @@ def _kill_bmin(macro_mol, macromodel_path):
     cmd = [app, '-list']
     output = name
     start = time.time()
+    interval = 0.1
     while name in output:
-        output = sp.run(cmd, stdout=sp.PIPE, stderr=sp.STDOUT,
-                        universal_newlines=True).stdout
+        output = (await executor.run('jobcontrol', cmd)).output
         if time.time() - start > 600:
             break
+        await asyncio.sleep(interval)
+        interval = min(2*interval, 5)
 
 
 def _license_found(output, mol=None):
@@ -592,7 +721,7 @@ def _license_found(output, mol=None):
 
     # Check if the file exists first. If not, this is often means the
     # calculation must be redone so return False anyway.
-    log_file_path = mol._file.replace('mol', 'log')
+    log_file_path = os.path.splitext(mol._file)[0] + '.log'
     with open(log_file_path, 'r') as log_file:
         log_file_content = log_file.read()
 
@@ -658,25 +787,22 @@ def _generate_com(mol, settings):
     # the ``.mae`` file and the output file in the same way.
     name, ext = os.path.splitext(mol._file)
     com_file = name + '.com'
-    mae = name + '.mae'
-    output = name + '-out.maegz'
+    # ``bmin`` is run inside the job directory, so the paths in the
+    # ``.com`` file are relative to it.
+    mae = os.path.basename(name) + '.mae'
+    output = os.path.basename(name) + '-out.maegz'
 
     # This function adds all the lines which fix bond distances and
     # angles into ``main_string``.
     main_string = _fix_params_in_com_file(mol, main_string,
                                           settings['restricted'])
 
-    # Writes the ``.com`` file.
+    # Writes the ``.com`` file. The first line holds the ``.mae`` file
+    # containing the molecule to be optimized. The second line holds
+    # the name of the output file of the optimization. Next is the body
+    # of the ``.com`` file, held in ``main_string``.
     with open(com_file, "w") as com:
-        # The first line hold the ``.mae`` file containing the molecule
-        # to be optimized.
-        com.write(str(mae + "\n"))
-        # The second line holds the name of the output file of the
-        # optimization.
-        com.write(str(output + "\n"))
-        # Next is the body of the ``.com`` file, held in
-        # ``main_string``.
-        com.write(main_string)
+        com.write(f"{mae}\n{output}\n{main_string}")
 
 
 def _generate_md_com(macro_mol, settings):
@@ -709,8 +835,10 @@ def _generate_md_com(macro_mol, settings):
 
     name, ext = os.path.splitext(macro_mol._file)
     com_file = name + '.com'
-    mae = name + '.mae'
-    output = name + '-out.maegz'
+    # ``bmin`` is run inside the job directory, so the paths in the
+    # ``.com`` file are relative to it.
+    mae = os.path.basename(name) + '.mae'
+    output = os.path.basename(name) + '-out.maegz'
 
     # Generate the com file containing the info for the run
     with open(com_file, "w") as com:
@@ -722,7 +850,7 @@ def _generate_md_com(macro_mol, settings):
         com.write(main_string)
 
 
-def _create_mae(mol, macromodel_path):
+async def _create_mae(mol, macromodel_path, executor):
     """
     Creates the ``.mae`` file holding the molecule to be optimized.
 
@@ -738,6 +866,9 @@ def _create_mae(mol, macromodel_path):
         machine. For example, on a Linux machine this may be something
         like ``'/opt/schrodinger2017-2'``.
 
+    executor : :class:`.Executor`
+        The executor used to run ``structconvert``.
+
     Returns
     -------
     :class:`str`
@@ -752,83 +883,47 @@ def _create_mae(mol, macromodel_path):
     # Create the name of the new ``.mae`` file. It is the same as the
     # original structure file, including the same path. Only the
     # extensions are different.
-    mae_file = mol._file.replace(ext, '.mae')
-    _structconvert(mol._file, mae_file, macromodel_path)
+    mae_file = os.path.splitext(mol._file)[0] + '.mae'
+    await _structconvert(mol._file, mae_file, macromodel_path, executor)
     return mae_file
 
 
-def _convert_maegz_to_mae(mol):
-    """
-    Converts a ``.maegz`` file to a ``.mae`` file.
-
-    Parameters
-    ----------
-    mol : :class:`.Molecule`
-        The molecule being optimized. The ``.maegz`` file holding
-        its optimized structure is converted to a ``.mae`` file. Both
-        versions are kept.
-
-    Returns
-    -------
-    None : :class:`NoneType`
-
-    """
-
-    logger.debug(f'Converting .maegz of "{mol.name}" to .mae.')
-    name, ext = os.path.splitext(mol._file)
-    # ``out`` is the full path of the optimized ``.mae`` file.
-    maegz = name + '-out.maegz'
-    # Replace extensions to get the names of the various files.
-    mae = name + '.mae'
-
-    gz_file = gzip.open(maegz)
-    with open(mae, 'wb') as f:
-        f.write(gz_file.read())
-    gz_file.close()
-
-
-def _structconvert(iname, oname, macromodel_path):
+async def _structconvert(iname, oname, macromodel_path, executor):
 
     convrt_app = os.path.join(macromodel_path,
                               'utilities',
                               'structconvert')
     convrt_cmd = [convrt_app, iname, oname]
 
-    incomplete = True
-    while incomplete:
-
-        # Execute the file conversion.
-        try:
-            convrt_return = sp.run(convrt_cmd,
-                                   stdout=sp.PIPE,
-                                   stderr=sp.STDOUT,
-                                   universal_newlines=True)
-
-        # If conversion fails because a wrong Schrodinger path was
-        # given, raise.
-        except FileNotFoundError:
-            raise _PathError(('Wrong Schrodinger path supplied to'
-                              ' `structconvert` function.'))
-
-        if 'File does not exist' in convrt_return.stdout:
-            raise _ConversionError(
-                    (f'structconvert input file, {iname}, missing. '
-                     f'Console output was {convrt_return.stdout}'))
-
-        # If no license if found, keep re-running the function until it
-        # is.
-        if _license_found(convrt_return.stdout):
-            incomplete = False
+    # Execute the file conversion. If no license if found, the
+    # executor keeps re-running the conversion until it is.
+    try:
+        convrt_return = await executor.run(
+                                    'structconvert',
+                                    convrt_cmd,
+                                    cwd=os.path.dirname(oname) or None,
+                                    license_found=_license_found)
+
+    # If conversion fails because a wrong Schrodinger path was
+    # given, raise.
+    except FileNotFoundError:
+        raise _PathError(('Wrong Schrodinger path supplied to'
+                          ' `structconvert` function.'))
+
+    if 'File does not exist' in convrt_return.output:
+        raise _ConversionError(
+                (f'structconvert input file, {iname}, missing. '
+                 f'Console output was {convrt_return.output}'))
 
     # If force field failed, raise.
-    if 'number 1' in convrt_return.stdout:
-        raise _ForceFieldError(convrt_return.stdout)
+    if 'number 1' in convrt_return.output:
+        raise _ForceFieldError(convrt_return.output)
 
-    _wait_for_file(oname)
+    await executor.wait_for_file(oname)
     if not os.path.exists(oname):
         raise _ConversionError(
          (f'Conversion output file {oname} was not found.'
-          f' Console output was {convrt_return.stdout}.'))
+          f' Console output was {convrt_return.output}.'))
 
     return convrt_return
 
@@ -865,189 +960,152 @@ def _fix_params_in_com_file(mol, main_string, restricted):
 
     """
 
-    # Make a string to hold all of the ``FX`` lines.
-    fix_block = ""
+    filler = "!!!BLOCK_OF_FIXED_PARAMETERS_COMES_HERE!!!\n"
 
     # If `restricted` is ``False`` do not add a fix block.
     if not restricted:
-        return main_string.replace(("!!!BLOCK_OF_FIXED_PARAMETERS_"
-                                    "COMES_HERE!!!\n"), fix_block)
-    # Add lines that fix the bond distance.
-    fix_block = _fix_distance_in_com_file(mol, fix_block)
-    # Add lines that fix the bond angles.
-    fix_block = _fix_bond_angle_in_com_file(mol, fix_block)
-    # Add lines that fix the torsional angles.
-    fix_block = _fix_torsional_angle_in_com_file(mol, fix_block)
+        return main_string.replace(filler, "")
 
-    return main_string.replace(("!!!BLOCK_OF_FIXED_PARAMETERS_"
-                                "COMES_HERE!!!\n"), fix_block)
+    # The fix block only depends on the bonds of the molecule, not on
+    # its conformation, so it is cached using them as the key.
+    bonds = tuple((bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()) for
+                  bond in mol.mol.GetBonds())
+    bonder_ids = frozenset(flatten(mol.bonder_ids))
+    fix_block = _fix_block(bonds, mol.mol.GetNumAtoms(), bonder_ids)
+    return main_string.replace(filler, fix_block)
 
 
-def _fix_distance_in_com_file(mol, fix_block):
+@lru_cache(maxsize=32)
+def _fix_block(bonds, num_atoms, bonder_ids):
     """
-    Adds lines fixing bond distances to ``.com`` body string.
-
-    Only bond distances which do not involve bonds created during
-    assembly are fixed.
+    Creates the lines of the ``.com`` file which fix parameters.
 
     Parameters
     ----------
-    mol : :class:`.Molecule`
-        The molecule to be optimized.
+    bonds : :class:`tuple`
+        Holds a :class:`tuple` of the form ``(atom1_id, atom2_id)``
+        for every bond in the molecule.
+
+    num_atoms : :class:`int`
+        The number of atoms in the molecule.
 
-    fix_block : :class:`str`
-        The string holding all the lines containing fix commands for
-        the ``.com`` file.
+    bonder_ids : :class:`frozenset` of :class:`int`
+        The ids of the bonder atoms of the molecule.
 
     Returns
     -------
     :class:`str`
-        A string holding lines containg fix commands for the ``.com``
-        file. The string has the lines fixing bond distances added to
-        it by this function.
+        The lines fixing the bond distances, bond angles and torsional
+        angles of the molecule.
 
     """
 
-    bonder_ids = set(flatten(mol.bonder_ids))
-
-    # Go through all the bonds in the rdkit molecule. If the bond
-    # is not between bonder atoms add a fix line to the ``fix_block``.
-    # If the bond does invovle two bonder atoms go to the next bond.
-    # This is because a bond between 2 bonder atoms was added during
-    # assembly and should therefore not be fixed.
-    for bond in mol.mol.GetBonds():
-        atom1 = bond.GetBeginAtom()
-        atom2 = bond.GetEndAtom()
+    # ``neighbors[i]`` holds the ids of all atoms bonded to atom ``i``.
+    neighbors = [[] for _ in range(num_atoms)]
+    for atom1, atom2 in bonds:
+        neighbors[atom1].append(atom2)
+        neighbors[atom2].append(atom1)
 
-        if (atom1.GetIdx() in bonder_ids and
-           atom2.GetIdx() in bonder_ids):
-            continue
-
-        # Make sure that the indices are increased by 1 in the .mae
-        # file.
-        atom1_id = atom1.GetIdx() + 1
-        atom2_id = atom2.GetIdx() + 1
-        fix_block += (_com_line('FXDI', atom1_id, atom2_id, 0, 0,
-                                99999, 0, 0, 0) + '\n')
+    lines = it.chain(_fix_distance_in_com_file(bonds, bonder_ids),
+                     _fix_bond_angle_in_com_file(neighbors),
+                     _fix_torsional_angle_in_com_file(bonds, neighbors))
+    return ''.join(f'{line}\n' for line in lines)
 
-    return fix_block
 
-
-def _fix_bond_angle_in_com_file(mol, fix_block):
+def _fix_distance_in_com_file(bonds, bonder_ids):
     """
-    Adds lines fixing bond angles to ``.com`` body string.
+    Yields lines fixing bond distances for the ``.com`` file.
 
-    All bond angles of the molecule are fixed.
+    Only bond distances which do not involve bonds created during
+    assembly are fixed.
 
     Parameters
     ----------
-    mol : :class:`.Molecule`
-        The molecule to be optimized.
+    bonds : :class:`tuple`
+        Holds a :class:`tuple` of the form ``(atom1_id, atom2_id)``
+        for every bond in the molecule.
 
-    fix_block : :class:`str`
-        The string holding all the lines containing fix commands for
-        the ``.com`` file.
+    bonder_ids : :class:`frozenset` of :class:`int`
+        The ids of the bonder atoms of the molecule.
 
-    Returns
-    -------
+    Yields
+    ------
     :class:`str`
-        A string holding lines containg fix commands for the ``.com``
-        file. The string has the lines fixing bond angles added to it
-        by this function.
+        A line fixing a bond distance.
 
     """
 
-    # Create a substructure consisting of 3 dummy atoms bonded with 3
-    # dummy bonds. This substructure will match with any 3 atoms which
-    # are bonded together with any combination of bonds. These 3 atoms
-    # will therefore have a bond angle.
-    ba_mol = rdkit.MolFromSmarts('[*]~[*]~[*]')
-
-    # Get the indices of all atoms which have a bond angle.
-    # ``ba_atoms`` is a tuple of tuples of the form ((1,2,3), (4,5,6),
-    # (7,8,9), ...). Each inner tuple holds the indicies of the atoms
-    # which form a bond angle.
-    ba_atoms = mol.mol.GetSubstructMatches(ba_mol)
-
-    for atom_ids in ba_atoms:
-        atom_ids = [i+1 for i in atom_ids]
-        fix_block += (_com_line('FXBA', *atom_ids,
-                                99999, 0, 0, 0, 0) + '\n')
+    # Go through all the bonds in the molecule. If the bond is not
+    # between bonder atoms yield a fix line. If the bond does invovle
+    # two bonder atoms go to the next bond. This is because a bond
+    # between 2 bonder atoms was added during assembly and should
+    # therefore not be fixed.
+    for atom1, atom2 in bonds:
+        if atom1 in bonder_ids and atom2 in bonder_ids:
+            continue
 
-    return fix_block
+        # Make sure that the indices are increased by 1 in the .mae
+        # file.
+        yield _com_line('FXDI', atom1+1, atom2+1, 0, 0, 99999, 0, 0, 0)
 
 
-def _fix_torsional_angle_in_com_file(mol, fix_block):
+def _fix_bond_angle_in_com_file(neighbors):
     """
-    Adds lines fixing torsional bond angles to ``.com`` body string.
+    Yields lines fixing bond angles for the ``.com`` file.
 
-    All torsional angles of the molecule are fixed.
+    All bond angles of the molecule are fixed.
 
     Parameters
     ----------
-    macro_mol : :class:`.Molecule`
-        The molecule to be optimized.
+    neighbors : :class:`list` of :class:`list` of :class:`int`
+        Holds the ids of the atoms bonded to each atom.
 
-    fix_block : :class:`str`
-        The string holding all the lines containing fix commands for
-        the ``.com`` file.
-
-    Returns
-    -------
+    Yields
+    ------
     :class:`str`
-        A string holding lines containg fix commands for the ``.com``
-        file. The string has the lines fixing bond angles added to it
-        by this function.
+        A line fixing a bond angle.
 
     """
 
-    # Create a substructure consisting of 4 dummy atoms bonded with 4
-    # dummy bonds. This substructure will match with any 4 atoms which
-    # are bonded together with any combination of bonds. These 4 atoms
-    # will therefore have a torsinal angle.
-    ta_mol = rdkit.MolFromSmarts('[*]~[*]~[*]~[*]')
-
-    # Get the indices of all atoms which have a torsional angle.
-    # ``ta_atoms`` as a tuple of tuples of the form ((1,2,3,4),
-    # (4,5,6,7), ...). Each inner tuple holds the indicies of the atoms
-    # which have a torsional angle.
-    ta_atoms = mol.mol.GetSubstructMatches(ta_mol)
-
-    # Apply the fix.
-    for atom_ids in ta_atoms:
-        atom_ids = [i+1 for i in atom_ids]
-        fix_block += (_com_line('FXTA', *atom_ids,
-                                99999, 361, 0, 0) + '\n')
-
-    return fix_block
+    # Every pair of atoms bonded to the same atom forms a bond angle
+    # with it.
+    for atom2, bonded in enumerate(neighbors):
+        for atom1, atom3 in it.combinations(bonded, 2):
+            yield _com_line('FXBA', atom1+1, atom2+1, atom3+1,
+                            99999, 0, 0, 0, 0)
 
 
-def _wait_for_file(file_name, timeout=10):
+def _fix_torsional_angle_in_com_file(bonds, neighbors):
     """
-    Stalls until a given file exists or `timeout` expires.
+    Yields lines fixing torsional angles for the ``.com`` file.
+
+    All torsional angles of the molecule are fixed.
 
     Parameters
     ----------
-    file_name : :class:`str`
-        The full path of the file which should be waited for.
+    bonds : :class:`tuple`
+        Holds a :class:`tuple` of the form ``(atom1_id, atom2_id)``
+        for every bond in the molecule.
 
-    timeout : :class:`int` or :class:`float`, optional
-        The number of seconds before the function stops waiting and
-        returns.
+    neighbors : :class:`list` of :class:`list` of :class:`int`
+        Holds the ids of the atoms bonded to each atom.
 
-    Returns
-    --------
-    None : :class:`NoneType`
+    Yields
+    ------
+    :class:`str`
+        A line fixing a torsional angle.
 
     """
 
-    t_start = time.time()
-    tick = 0
-    while True:
-        time_taken = time.time() - t_start
-        if divmod(time_taken, 5)[0] == tick + 1:
-            logger.warning('Waiting for "{}".'.format(file_name))
-            tick += 1
-
-        if os.path.exists(file_name) or time_taken > timeout:
-            break
+    # Every bond is the central bond of the torsional angles formed
+    # by the other atoms bonded to its two atoms.
+    for atom2, atom3 in bonds:
+        for atom1 in neighbors[atom2]:
+            if atom1 == atom3:
+                continue
+            for atom4 in neighbors[atom3]:
+                # Skip atoms which would close a 3 membered ring.
+                if atom4 == atom2 or atom4 == atom1:
+                    continue
+                yield _com_line('FXTA', atom1+1, atom2+1, atom3+1,
+                                atom4+1, 99999, 361, 0, 0)
@@ -4,12 +4,12 @@ Defines optimization functions which use MOPAC.
 """
 
 import os
-import subprocess as sp
-import psutil
-import time
 import logging
 import rdkit.Chem.AllChem as rdkit
 from uuid import uuid4
+from functools import partial
+
+from ..utilities import EXECUTOR, run_coroutine
 
 logger = logging.getLogger(__name__)
 
@@ -92,8 +92,42 @@ def mopac_opt(mol, mopac_path, settings=None):
 
     """
 
+    return run_coroutine(mopac_opt_async(mol, mopac_path, settings))
+
+
+async def mopac_opt_async(mol, mopac_path, settings=None, executor=None):
+    """
+    Optimizes the molecule using MOPAC, asynchronously.
+
+    This is the coroutine version of :func:`mopac_opt`. Awaiting it
+    runs the optimization through `executor`, which allows many
+    molecules to be optimized at the same time from a single process.
+
+    Parameters
+    ----------
+    mol : :class:`.Molecule`
+        The molecule to be optimized.
+
+    mopac_path : :class:`str`
+        The full path to the MOPAC suite on the user's machine.
+
+    settings: :class:`dict`, optional
+        See :func:`mopac_opt`.
+
+    executor : :class:`.Executor`, optional
+        The executor used to run MOPAC. If ``None``,
+        :data:`.EXECUTOR` is used.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
     if settings is None:
         settings = {}
+    if executor is None:
+        executor = EXECUTOR
 
     vals = {
             'hamiltonian': 'PM7',
@@ -106,45 +140,41 @@ def mopac_opt(mol, mopac_path, settings=None):
             }
     vals.update(settings)
 
-    mol._file = '{}.mol'.format(uuid4().int)
+    # All files of the run are written into a job directory, which is
+    # cleaned up once the structure has been updated.
+    with executor.workspace.job('mopac') as job_dir:
+        mol._file = os.path.join(job_dir, '{}.mol'.format(uuid4().int))
 
-    # First write a .mol file of the molecule.
-    mol.write(mol._file)
-    # MOPAC requires a ``.mop`` file as input. This creates a ``.mop``
-    # file holding the molecule.
-    _create_mop(mol, vals)
-    # Run the optimization
-    _run_mopac(mol, mopac_path, settings)
-    # Update the rdkit mol info with the ``.pdb`` file generated from
-    # the MOPAC run
-    _convert_mopout_to_mol(mol)
+        # First write a .mol file of the molecule.
+        mol.write(mol._file)
+        # MOPAC requires a ``.mop`` file as input. This creates a
+        # ``.mop`` file holding the molecule.
+        _create_mop(mol, vals)
+        # Run the optimization
+        await _run_mopac(mol, mopac_path, vals['timeout'], executor)
+        # Update the rdkit mol info with the ``.pdb`` file generated
+        # from the MOPAC run
+        _convert_mopout_to_mol(mol)
 
 
-def _run_mopac(mol, mopac_path, settings, timeout=7200):
+async def _run_mopac(mol, mopac_path, timeout, executor):
 
     name, ext = os.path.splitext(mol._file)
     mop_file = name + '.mop'
 
-    print("", time.ctime(time.time()),
-          'Running MOPAC - {}.'.format(mol.name), sep='\n')
+    logger.info(f'Running MOPAC - {mol.name}.')
 
-    # To run MOPAC a command is issued to the console via
-    # ``subprocess.Popen``. The command is the full path of the
-    # ``mopac`` program.
+    # To run MOPAC a command is issued to the console via the
+    # executor. The command is the full path of the ``mopac``
+    # program. If the run takes too long, MOPAC is asked to stop by
+    # writing a ``.end`` file.
     file_root, ext = os.path.splitext(mop_file)
     opt_cmd = [mopac_path, file_root]
-    opt_proc = psutil.Popen(opt_cmd, stdout=sp.PIPE,
-                            stderr=sp.STDOUT,
-                            universal_newlines=True)
-
-    try:
-        proc_out, _ = opt_proc.communicate(timeout=timeout)
-    except sp.TimeoutExpired:
-        logger.warning('\nMinimization took too long and was terminated '
-                       'by force - {}\n'.format(mol.name))
-        _kill_mopac(mol)
-
-    return
+    await executor.run('mopac',
+                       opt_cmd,
+                       timeout=timeout,
+                       cwd=os.path.dirname(file_root) or None,
+                       on_timeout=partial(_kill_mopac, mol))
 
 
 def _kill_mopac(mol):
@@ -247,7 +277,7 @@ def _create_mop(mol, settings):
         # line for the run info
         mop.write(_mop_line(settings) + "\n")
         # line with the name of the molecule
-        mop.write(name + "\n\n")
+        mop.write(os.path.basename(name) + "\n\n")
 
         # print the structural info
         for atom in mol.GetAtoms():
@@ -290,3 +320,4 @@ def _convert_mopout_to_mol(mol):
                                    removeHs=False)
     # Updating the macro_mol.mol infos with the new mol
     mol.mol = new_mol
+    mol.structure_version += 1
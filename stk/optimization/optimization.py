@@ -28,23 +28,56 @@ file, not any of the helper functions or classes.
 """
 
 import rdkit.Chem.AllChem as rdkit
-import multiprocessing as mp
+from rdkit.Geometry import Point3D
 from functools import partial, wraps
 import numpy as np
 import logging
-from threading import Thread
-
-from .macromodel import macromodel_opt, macromodel_cage_opt
-from ..utilities import daemon_logger, logged_call
+import asyncio
+import contextvars
+import signal
+import threading
+import time
+import os
+import json
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .macromodel import (macromodel_opt,
+                         macromodel_cage_opt,
+                         macromodel_opt_async,
+                         macromodel_cage_opt_async)
+from .mopac import mopac_opt, mopac_opt_async
+from .rigid import rigid_relaxation
+from ..utilities import (FunctionData,
+                         canonical_key,
+                         logged_call,
+                         logging_levels,
+                         EXECUTOR,
+                         run_coroutine,
+                         deadline,
+                         DeadlineError,
+                         WorkerPool,
+                         TELEMETRY)
 
 
 logger = logging.getLogger(__name__)
 
 
-def _optimize_all(func_data, population, processes):
+def _optimize_all(func_data,
+                  population,
+                  processes,
+                  transfer='coords',
+                  deadline=None,
+                  chunksize=1,
+                  pool=None,
+                  journal=None):
     """
     Run opt function on all population members in parallel.
 
+    Molecules are updated as soon as their optimization finishes,
+    in whatever order that happens. Progress is logged after each
+    molecule.
+
     Parameters
     ----------
     func_data : :class:`.FunctionData`
@@ -58,16 +91,45 @@ def _optimize_all(func_data, population, processes):
     processes : :class:`int`
         The number of parallel processes to create.
 
+    transfer : :class:`str`, optional
+        How molecules are sent between processes. Can be one of
+
+            ``'coords'`` - Molecules are sent without their building
+            blocks, atom properties and energies. Only the new
+            coordinates, the optimized flag and any new energies are
+            sent back and applied to the molecules in place.
+            Molecules which are already optimized are not sent at all.
+
+            ``'molecule'`` - Whole molecules are sent to and from the
+            processes. The cache is updated with the returned copies.
+
+    deadline : :class:`float`, optional
+        The number of seconds the optimization of a single molecule
+        is allowed to take. Molecules which take longer are treated
+        as failed optimizations. If ``None``, there is no deadline.
+
+    chunksize : :class:`int`, optional
+        The number of molecules sent to a process at a time.
+
+    pool : :class:`.WorkerPool`, optional
+        The pool of processes which runs the optimizations. It is left
+        running once the optimizations are done. If ``None``, a new
+        pool of `processes` processes is created and closed
+        afterwards.
+
+    journal : :class:`_OptimizationJournal`, optional
+        If provided, each molecule is recorded in it as soon as it
+        is optimized.
+
     Returns
     -------
     None : :class:`NoneType`
 
     """
 
-    manager = mp.Manager()
-    logq = manager.Queue()
-    log_thread = Thread(target=daemon_logger, args=(logq, ))
-    log_thread.start()
+    own_pool = pool is None
+    if own_pool:
+        pool = WorkerPool(processes)
 
     # Using the name of the function stored in `func_data` get the
     # function object from one of the functions defined within the
@@ -75,23 +137,81 @@ def _optimize_all(func_data, population, processes):
     func = globals()[func_data.name]
     # Provide the function with any additional paramters it may
     # require.
-    p_func = _OptimizationFunc(partial(func, **func_data.params))
+    p_func = _OptimizationFunc(partial(func, **func_data.params),
+                               deadline)
+
+    if transfer == 'coords':
+        # Each molecule is only sent once, even if it is held by the
+        # population multiple times.
+        members = []
+        for member in {id(mem): mem for mem in population}.values():
+            if member.optimized:
+                logger.info(f'Skipping {member.name}.')
+            else:
+                members.append(member)
+        jobs = ((i, _OptimizationJob(mem), p_func) for
+                i, mem in enumerate(members))
+
+    else:
+        members = list(population)
+        jobs = ((i, p_func, mem) for i, mem in enumerate(members))
 
     # Apply the function to every member of the population, in
     # parallel.
-    with mp.get_context('spawn').Pool(processes) as pool:
-        optimized = pool.starmap(logged_call,
-                                 ((logq, p_func, mem) for
-                                  mem in population))
-    # Make sure the cache is updated with the optimized versions.
-    for member in optimized:
-        member.update_cache()
+    start = time.time()
+    try:
+        results = pool.imap_unordered(
+                            partial(_indexed_call, logging_levels()),
+                            jobs,
+                            chunksize)
+        for done, (i, result) in enumerate(results, 1):
+            # Update the molecules as soon as the results arrive.
+            if transfer == 'coords':
+                result.apply(members[i])
+                result = members[i]
+            else:
+                # Make sure the cache is updated with the optimized
+                # version.
+                result.update_cache()
+
+            if journal is not None:
+                journal.record(result)
+
+            elapsed = max(time.time() - start, 1e-6)
+            logger.info(f'Optimized {done} of {len(members)} '
+                        f'molecules ({done/elapsed:.3f} per second).')
+    finally:
+        if own_pool:
+            pool.close()
+
+
+def _indexed_call(levels, job):
+    """
+    Calls a function in a subprocess and returns its index.
 
-    logq.put(None)
-    log_thread.join()
+    Parameters
+    ----------
+    levels : :class:`dict`
+        The effective levels of the loggers in the main process.
 
+    job : :class:`tuple`
+        A :class:`tuple` of the form ``(index, func, arg)``.
+
+    Returns
+    -------
+    :class:`tuple`
+        A :class:`tuple` of the form ``(index, func(arg))``.
 
-def _optimize_all_serial(func_data, population):
+    """
+
+    index, func, arg = job
+    return index, logged_call(levels, func, arg)
+
+
+def _optimize_all_serial(func_data,
+                         population,
+                         deadline=None,
+                         journal=None):
     """
     Run opt function on all population members sequentially.
 
@@ -105,6 +225,14 @@ def _optimize_all_serial(func_data, population):
         The :class:`.Population` instance who's members are to be
         optimized.
 
+    deadline : :class:`float`, optional
+        The number of seconds the optimization of a single molecule
+        is allowed to take. If ``None``, there is no deadline.
+
+    journal : :class:`_OptimizationJournal`, optional
+        If provided, each molecule is recorded in it as soon as it
+        is optimized.
+
     Returns
     -------
     None : :class:`NoneType`
@@ -117,11 +245,425 @@ def _optimize_all_serial(func_data, population):
     func = globals()[func_data.name]
     # Provide the function with any additional paramters it may
     # require.
-    p_func = _OptimizationFunc(partial(func, **func_data.params))
+    p_func = _OptimizationFunc(partial(func, **func_data.params),
+                               deadline)
 
     # Apply the function to every member of the population.
     for member in population:
         p_func(member)
+        if journal is not None:
+            journal.record(member)
+
+
+def _optimize_all_async(func_data,
+                        population,
+                        executor=None,
+                        journal=None):
+    """
+    Run opt function on all population members from a single process.
+
+    If the optimization function has a coroutine version, named
+    ``<name>_async``, it is used and all external programs are run
+    through `executor`. This means that many molecules can be
+    optimized at the same time without creating a process for each
+    one. Optimization functions without a coroutine version are run
+    in threads.
+
+    Parameters
+    ----------
+    func_data : :class:`.FunctionData`
+        The :class:`.FunctionData` object which represents the chosen
+        optimization function.
+
+    population : :class:`.Population`
+        The :class:`.Population` instance who's members are to be
+        optimized.
+
+    executor : :class:`.Executor`, optional
+        The executor used to run external programs. If ``None``,
+        :data:`.EXECUTOR` is used.
+
+    journal : :class:`_OptimizationJournal`, optional
+        If provided, each molecule is recorded in it as soon as it
+        is optimized.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
+    if executor is None:
+        executor = EXECUTOR
+
+    async_name = f'{func_data.name}_async'
+    if async_name in globals():
+        func = partial(globals()[async_name],
+                       executor=executor,
+                       **func_data.params)
+    else:
+        func = partial(globals()[func_data.name], **func_data.params)
+    p_func = _OptimizationFunc(func)
+
+    # The same molecule can be held by the population more than once
+    # but should only be optimized once.
+    members = list({id(mem): mem for mem in population}.values())
+
+    async def optimize_member(mem, pool):
+        await p_func.call_async(mem, pool)
+        if journal is not None:
+            journal.record(mem)
+
+    async def optimize():
+        with ThreadPoolExecutor() as pool:
+            await asyncio.gather(*(optimize_member(mem, pool) for
+                                   mem in members))
+
+    run_coroutine(optimize())
+
+
+class _OptimizationJob:
+    """
+    A compact copy of a molecule, which is sent to be optimized.
+
+    The building blocks and energies of the molecule are not needed
+    to optimize it and are left out. This makes the job much cheaper
+    to send to another process than the molecule. Atom properties are
+    kept, because optimization functions such as
+    :func:`.rigid_relaxation` use them to find the building blocks.
+
+    Attributes
+    ----------
+    cls : :class:`type`
+        The class of the molecule.
+
+    energy_cls : :class:`type`
+        The class of the :attr:`.Molecule.energy` attribute.
+
+    state : :class:`dict`
+        The attributes of the molecule, except those left out.
+
+    """
+
+    excluded = {'building_blocks', 'bb_counter', 'energy'}
+
+    def __init__(self, mol):
+        self.cls = mol.__class__
+        self.energy_cls = mol.energy.__class__
+        self.state = {key: value for key, value in vars(mol).items() if
+                      key not in self.excluded}
+
+    def __call__(self, func):
+        """
+        Optimizes the molecule with `func`.
+
+        Parameters
+        ----------
+        func : :class:`_OptimizationFunc`
+            The optimization function.
+
+        Returns
+        -------
+        :class:`_OptimizationResult`
+            The changes made to the molecule by `func`.
+
+        """
+
+        mol = self.cls.__new__(self.cls)
+        mol.__dict__.update(self.state)
+        mol.energy = self.energy_cls(mol)
+        rdkit_mol = mol.mol
+        func(mol)
+        return _OptimizationResult(mol, mol.mol is not rdkit_mol)
+
+
+class _OptimizationResult:
+    """
+    The changes made to a molecule by an optimization function.
+
+    Attributes
+    ----------
+    conformers : :class:`list` of :class:`tuple`
+        Holds a :class:`tuple` of the form ``(conformer_id, coords)``
+        for every conformer of the optimized molecule. ``coords`` is
+        a :class:`numpy.ndarray` of shape ``[n_atoms, 3]``.
+
+    mol : :class:`rdkit.Mol`
+        If the optimization function replaced the ``rdkit`` molecule,
+        the new ``rdkit`` molecule. Otherwise ``None``.
+
+    optimized : :class:`bool`
+        The optimized flag of the molecule.
+
+    energies : :class:`dict`
+        The energies calculated during the optimization.
+
+    """
+
+    def __init__(self, mol, replaced):
+        self.mol = mol.mol if replaced else None
+        self.conformers = [] if replaced else [
+            (conf.GetId(), conf.GetPositions()) for
+            conf in mol.mol.GetConformers()
+        ]
+        self.optimized = mol.optimized
+        self.energies = mol.energy.values
+
+    def apply(self, mol):
+        """
+        Applies the changes to `mol`.
+
+        Parameters
+        ----------
+        mol : :class:`.Molecule`
+            The molecule which was optimized.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if self.mol is not None:
+            mol.mol = self.mol
+
+        # Remove conformers which the optimization function removed.
+        kept = {conf_id for conf_id, _ in self.conformers}
+        conf_ids = {conf.GetId() for conf in mol.mol.GetConformers()}
+        if self.mol is None:
+            for conf_id in conf_ids - kept:
+                mol.mol.RemoveConformer(conf_id)
+            conf_ids &= kept
+
+        for conf_id, coords in self.conformers:
+            if conf_id in conf_ids:
+                conf = mol.mol.GetConformer(conf_id)
+            else:
+                conf = rdkit.Conformer(len(coords))
+                conf.SetId(conf_id)
+                conf_id = mol.mol.AddConformer(conf)
+                conf = mol.mol.GetConformer(conf_id)
+
+            for atom_id, (x, y, z) in enumerate(coords):
+                conf.SetAtomPosition(atom_id, Point3D(x, y, z))
+
+        mol.optimized = self.optimized
+        mol.structure_version += 1
+        mol.energy.values.update(self.energies)
+
+    def json(self):
+        """
+        Returns a JSON representation of the result.
+
+        Only results which did not replace the ``rdkit`` molecule can
+        be represented.
+
+        Returns
+        -------
+        :class:`dict`
+            A :class:`dict` which represents the result.
+
+        """
+
+        return {
+            'conformers': [(conf_id, coords.tolist()) for
+                           conf_id, coords in self.conformers],
+            'optimized': self.optimized,
+            'energies': [
+                {'name': key.name,
+                 'params': key.params,
+                 'value': _json_energy(value)}
+                for key, value in self.energies.items()
+            ]
+        }
+
+    @classmethod
+    def from_json(cls, json_dict):
+        """
+        Creates a result from its JSON representation.
+
+        Parameters
+        ----------
+        json_dict : :class:`dict`
+            A :class:`dict` made by :meth:`json`.
+
+        Returns
+        -------
+        :class:`_OptimizationResult`
+            The result represented by `json_dict`.
+
+        """
+
+        obj = cls.__new__(cls)
+        obj.mol = None
+        obj.conformers = [(conf_id, np.array(coords)) for
+                          conf_id, coords in json_dict['conformers']]
+        obj.optimized = json_dict['optimized']
+        obj.energies = {
+            FunctionData(energy['name'], **energy['params']):
+            energy['value'] for energy in json_dict['energies']
+        }
+        return obj
+
+
+def _json_energy(value):
+    """
+    Converts an energy value to a type which JSON can represent.
+
+    Parameters
+    ----------
+    value : :class:`object`
+        A value held by :attr:`.Energy.values`.
+
+    Returns
+    -------
+    :class:`float` or :class:`list` or :class:`dict`
+        `value`, with :mod:`numpy` types converted to built in ones.
+
+    """
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return value
+
+
+class _OptimizationJournal:
+    """
+    Records optimized molecules in a file as they finish.
+
+    Each line of the file holds the JSON representation of one
+    optimized molecule, given by :meth:`_OptimizationResult.json`,
+    together with its key. Every line is flushed as soon as it is
+    written, so that the molecules optimized before a crash can be
+    restored when the optimization is run again.
+
+    Attributes
+    ----------
+    path : :class:`str`
+        The path to the journal file.
+
+    records : :class:`dict`
+        Maps the canonical key of each recorded molecule, given by
+        :func:`.canonical_key`, to its JSON representation.
+
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        Opens a journal.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path to the journal file.
+
+        resume : :class:`bool`, optional
+            If ``True``, molecules already in the file are kept and
+            new ones are appended to it. If ``False``, the file is
+            emptied.
+
+        """
+
+        self.path = path
+        self.records = {}
+        if resume and os.path.exists(path):
+            # The end of the last complete line.
+            end = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    # The last line is incomplete if the process was
+                    # killed while writing it.
+                    if not line.endswith(b'\n'):
+                        logger.warning(
+                            f'Removing incomplete line from "{path}".'
+                        )
+                        break
+                    end += len(line)
+                    try:
+                        record = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        logger.warning(
+                            f'Skipping unreadable line in "{path}".'
+                        )
+                        continue
+                    self.records[record['key']] = record
+
+            # Remove the incomplete line, so that new records are not
+            # appended to it.
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+
+        self._file = open(path, 'a' if resume else 'w')
+
+    def restore(self, population):
+        """
+        Restores recorded molecules in `population`.
+
+        Parameters
+        ----------
+        population : :class:`.Population`
+            The population whose members are restored.
+
+        Returns
+        -------
+        :class:`int`
+            The number of restored molecules.
+
+        """
+
+        restored = 0
+        for member in population:
+            record = self.records.get(canonical_key(member.key))
+            if record is not None:
+                _OptimizationResult.from_json(record).apply(member)
+                restored += 1
+
+        if restored:
+            logger.info(f'Restored {restored} molecules from '
+                        f'"{self.path}".')
+        return restored
+
+    def record(self, mol):
+        """
+        Writes `mol` to the journal.
+
+        Molecules which are already in the journal are not written
+        again.
+
+        Parameters
+        ----------
+        mol : :class:`.Molecule`
+            An optimized molecule.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        key = canonical_key(mol.key)
+        if key in self.records:
+            return
+
+        record = _OptimizationResult(mol, False).json()
+        record['key'] = key
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self.records[key] = record
+
+    def close(self):
+        """
+        Closes the journal file.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self._file.close()
 
 
 class _OptimizationFunc:
@@ -136,10 +678,20 @@ class _OptimizationFunc:
     they fail (necessary for multiprocessing) and prevents them from
     being run twice on the same molecule.
 
+    It can also stop optimizations which take too long, see
+    :func:`_deadline`.
+
+    Attributes
+    ----------
+    deadline : :class:`float`
+        The number of seconds an optimization is allowed to take. If
+        ``None``, there is no deadline.
+
     """
 
-    def __init__(self, func):
+    def __init__(self, func, deadline=None):
         wraps(func)(self)
+        self.deadline = deadline
 
     def __call__(self, mol):
         """
@@ -161,9 +713,16 @@ class _OptimizationFunc:
             logger.info(f'Skipping {mol.name}.')
             return mol
 
+        name = self.__wrapped__.func.__name__
         try:
             logger.info(f'Optimizing {mol.name}.')
-            self.__wrapped__(mol)
+            with TELEMETRY.track(mol, 'optimization', name) as record:
+                try:
+                    with _deadline(self.deadline, mol):
+                        self.__wrapped__(mol)
+                except DeadlineError:
+                    record.outcome = 'deadline'
+                    raise
 
         except Exception as ex:
             errormsg = (f'Optimization function '
@@ -173,8 +732,123 @@ class _OptimizationFunc:
 
         finally:
             mol.optimized = True
+            mol.structure_version += 1
             return mol
 
+    async def call_async(self, mol, pool=None):
+        """
+        Decorates and calls the optimization function, asynchronously.
+
+        If the optimization function is a coroutine function it is
+        awaited, otherwise it is run in `pool`.
+
+        Parameters
+        ----------
+        mol : :class:`.Molecule`
+            The molecule to be optimized.
+
+        pool : :class:`concurrent.futures.Executor`, optional
+            The pool in which optimization functions which are not
+            coroutine functions are run. If ``None``, the default
+            executor of the event loop is used.
+
+        Returns
+        -------
+        :class:`.Molecule`
+            The optimized molecule.
+
+        """
+
+        if mol.optimized:
+            logger.info(f'Skipping {mol.name}.')
+            return mol
+
+        name = self.__wrapped__.func.__name__
+        try:
+            logger.info(f'Optimizing {mol.name}.')
+            with TELEMETRY.track(mol, 'optimization', name):
+                if asyncio.iscoroutinefunction(self.__wrapped__.func):
+                    await self.__wrapped__(mol)
+                else:
+                    # Run with a copy of the current context, so that
+                    # external programs are added to the telemetry
+                    # record of `mol`.
+                    context = contextvars.copy_context()
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(pool,
+                                               context.run,
+                                               self.__wrapped__,
+                                               mol)
+
+        except Exception as ex:
+            errormsg = (f'Optimization function '
+                        f'"{self.__wrapped__.func.__name__}()" '
+                        f'failed on molecule "{mol.name}".')
+            logger.error(errormsg, exc_info=True)
+
+        finally:
+            mol.optimized = True
+            mol.structure_version += 1
+            return mol
+
+
+@contextmanager
+def _deadline(seconds, mol):
+    """
+    Raises :class:`.DeadlineError` if the context takes too long.
+
+    External programs, such as ``bmin`` and MOPAC, run by an
+    :class:`.Executor` in the context are killed when the deadline
+    passes, see :func:`.deadline`. Everything else is interrupted with
+    :data:`signal.SIGALRM`, which only works on Unix and in the main
+    thread of a process. Python only handles the signal between
+    bytecodes, so a call into :mod:`rdkit`, such as an embedding or a
+    force field minimization, cannot be interrupted. It runs to
+    completion and the error is raised once it returns.
+
+    Parameters
+    ----------
+    seconds : :class:`float`
+        The number of seconds the context is allowed to take. If
+        ``None``, there is no deadline.
+
+    mol : :class:`.Molecule`
+        The molecule being optimized.
+
+    Yields
+    ------
+    None : :class:`NoneType`
+
+    """
+
+    if seconds is None:
+        yield
+        return
+
+    if (not hasattr(signal, 'setitimer') or
+       threading.current_thread() is not threading.main_thread()):
+        logger.warning('Optimization deadlines are only applied to '
+                       'external programs here.')
+        with deadline(seconds):
+            yield
+        return
+
+    def handler(signum, frame):
+        raise DeadlineError(f'Optimization of "{mol.name}" took '
+                            f'longer than {seconds} seconds.')
+
+    # If the signal interrupts an event loop run by
+    # :func:`.run_coroutine`, the running jobs are cancelled, which
+    # kills their programs.
+    old_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        with deadline(seconds):
+            yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
 
 def do_not_optimize(mol):
     """
@@ -292,6 +966,7 @@ def rdkit_optimization(mol, embed=False, conformer=-1):
     # Sanitize then optimize the rdkit molecule.
     rdkit.SanitizeMol(mol.mol)
     rdkit.MMFFOptimizeMolecule(mol.mol, confId=conformer)
+    mol.structure_version += 1
 
 
 def rdkit_ETKDG(mol, conformer=-1):
@@ -325,3 +1000,173 @@ def rdkit_ETKDG(mol, conformer=-1):
     mol.mol.RemoveConformer(conformer)
     new_conf.SetId(conformer)
     mol.mol.AddConformer(new_conf)
+    mol.structure_version += 1
+
+
+def rdkit_conformers(mol,
+                     num_conformers=10,
+                     keep=1,
+                     forcefield='mmff',
+                     num_threads=0,
+                     max_iters=200,
+                     random_seed=-1):
+    """
+    Embeds and optimizes an ensemble of conformers with ``rdkit``.
+
+    The conformers are embedded with :func:`rdkit.ETKDG` and then
+    optimized with :func:`rdkit_optimize_conformers`. Both steps are
+    spread over `num_threads` threads by ``rdkit``. All previous
+    conformers of the molecule are replaced, unless no conformer
+    could be embedded.
+
+    Parameters
+    ----------
+    mol : :class:`.Molecule`
+        The molecule who's structure should be optimized.
+
+    num_conformers : :class:`int`, optional
+        The number of conformers to embed.
+
+    keep : :class:`int`, optional
+        The number of lowest energy conformers to keep.
+
+    forcefield : :class:`str`, optional
+        The forcefield to use. Can be ``'mmff'`` or ``'uff'``.
+
+    num_threads : :class:`int`, optional
+        The number of threads to use. If ``0``, all available
+        threads are used.
+
+    max_iters : :class:`int`, optional
+        The maximum number of iterations of each optimization.
+
+    random_seed : :class:`int`, optional
+        The random seed used for embedding. If ``-1``, a random seed
+        is used.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    Raises
+    ------
+    :class:`RuntimeError`
+        If no conformer could be embedded or the forcefield could not
+        be set up for any of them. The previous conformers of the
+        molecule are kept.
+
+    """
+
+    confs = [rdkit.Conformer(conf) for conf in mol.mol.GetConformers()]
+    params = rdkit.ETKDG()
+    params.numThreads = num_threads
+    params.randomSeed = random_seed
+    params.clearConfs = True
+    try:
+        if not list(rdkit.EmbedMultipleConfs(mol.mol,
+                                             num_conformers,
+                                             params)):
+            raise RuntimeError(
+                f'No conformers of "{mol.name}" could be embedded.')
+
+        rdkit_optimize_conformers(mol=mol,
+                                  keep=keep,
+                                  forcefield=forcefield,
+                                  num_threads=num_threads,
+                                  max_iters=max_iters)
+    except RuntimeError:
+        mol.mol.RemoveAllConformers()
+        for conf in confs:
+            mol.mol.AddConformer(conf)
+        raise
+
+
+def rdkit_optimize_conformers(mol,
+                              keep=None,
+                              forcefield='mmff',
+                              num_threads=0,
+                              max_iters=200):
+    """
+    Optimizes all conformers of a molecule with ``rdkit``.
+
+    The conformers are optimized at the same time, spread over
+    `num_threads` threads. Afterwards, the conformers are renumbered
+    from ``0`` in order of increasing energy, so that the lowest
+    energy conformer is used by default. The energy of each kept
+    conformer is stored in :attr:`.Energy.values`, under the same key
+    as :meth:`.Energy.rdkit` uses.
+
+    Parameters
+    ----------
+    mol : :class:`.Molecule`
+        The molecule who's structure should be optimized.
+
+    keep : :class:`int`, optional
+        The number of lowest energy conformers to keep. If ``None``,
+        all conformers are kept.
+
+    forcefield : :class:`str`, optional
+        The forcefield to use. Can be ``'mmff'`` or ``'uff'``.
+
+    num_threads : :class:`int`, optional
+        The number of threads to use. If ``0``, all available
+        threads are used.
+
+    max_iters : :class:`int`, optional
+        The maximum number of iterations of each optimization.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    Conformers for which the forcefield could not be set up are
+    removed.
+
+    Raises
+    ------
+    :class:`ValueError`
+        If `forcefield` is not ``'mmff'`` or ``'uff'``.
+
+    :class:`RuntimeError`
+        If the forcefield could not be set up for any conformer. The
+        conformers of the molecule are left as they are.
+
+    """
+
+    # Sanitize then optimize the rdkit molecule.
+    rdkit.SanitizeMol(mol.mol)
+    if forcefield == 'mmff':
+        results = rdkit.MMFFOptimizeMoleculeConfs(mol.mol,
+                                                  numThreads=num_threads,
+                                                  maxIters=max_iters)
+    elif forcefield == 'uff':
+        results = rdkit.UFFOptimizeMoleculeConfs(mol.mol,
+                                                 numThreads=num_threads,
+                                                 maxIters=max_iters)
+    else:
+        raise ValueError(f'"{forcefield}" is not a valid forcefield.')
+
+    # The results are in the same order as the conformers. A result
+    # of ``-1`` means the forcefield could not be set up, so the
+    # energy is not real.
+    confs = [rdkit.Conformer(conf) for conf in mol.mol.GetConformers()]
+    energies = [energy for _, energy in results]
+    valid = [i for i, (status, _) in enumerate(results) if status != -1]
+    if not valid:
+        raise RuntimeError(f'The "{forcefield}" forcefield could not '
+                           f'be set up for "{mol.name}".')
+    if len(valid) < len(confs):
+        logger.warning(f'Removing {len(confs)-len(valid)} conformers '
+                       f'of "{mol.name}" for which the "{forcefield}" '
+                       'forcefield could not be set up.')
+    order = sorted(valid, key=energies.__getitem__)
+    if keep is not None:
+        order = order[:keep]
+
+    mol.mol.RemoveAllConformers()
+    for new_id, i in enumerate(order):
+        confs[i].SetId(new_id)
+        mol.mol.AddConformer(confs[i])
+        key = FunctionData('rdkit', forcefield=forcefield, conformer=new_id)
+        mol.energy.values[key] = energies[i]
+    mol.structure_version += 1
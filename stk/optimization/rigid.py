@@ -0,0 +1,288 @@
+"""
+Defines an optimization function which moves building blocks as rigid
+bodies.
+
+Freshly assembled macromolecules often have stretched bonds between
+building blocks and atoms of neighbouring building blocks which sit on
+top of each other. :func:`rigid_relaxation` removes these defects
+without changing the structure of any building block. Each building
+block is translated and rotated as a whole, to minimize a simple force
+field made of harmonic bonds between building blocks and a repulsive
+term between atoms of different building blocks which are too close.
+
+The force field is evaluated with :mod:`numpy`, so a relaxation takes
+milliseconds for a typical cage. This makes it a cheap first step
+before a more expensive optimization, such as
+:func:`.macromodel_cage_opt`.
+
+"""
+
+import logging
+import numpy as np
+import rdkit.Chem.AllChem as rdkit
+
+
+logger = logging.getLogger(__name__)
+
+
+def rigid_relaxation(mol,
+                     bond_length=None,
+                     clash_distance=2.0,
+                     max_iters=500,
+                     conformer=-1):
+    """
+    Relaxes bonds between building blocks, which are kept rigid.
+
+    The building blocks are found from the ``'bb_index'`` and
+    ``'mol_index'`` entries of :attr:`.MacroMolecule.atom_props`. Any
+    bond between atoms of different building blocks is a bond made
+    during assembly.
+
+    Parameters
+    ----------
+    mol : :class:`.MacroMolecule`
+        The molecule to be optimized.
+
+    bond_length : :class:`float`, optional
+        The length of bonds between building blocks. If ``None``, the
+        sum of the covalent radii of the bonded atoms is used.
+
+    clash_distance : :class:`float`, optional
+        Atoms of different building blocks which are closer than this
+        are pushed apart. Atoms separated by 3 bonds or fewer are
+        ignored.
+
+    max_iters : :class:`int`, optional
+        The maximum number of steps taken.
+
+    conformer : :class:`int`, optional
+        The conformer to use.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
+    conf = mol.mol.GetConformer(conformer)
+    coords = conf.GetPositions()
+
+    # Give each building block an index, held by each of its atoms.
+    fragments = {}
+    labels = np.array([
+        fragments.setdefault((props['bb_index'], props['mol_index']),
+                             len(fragments))
+        for _, props in sorted(mol.atom_props.items())
+    ])
+
+    bonds = np.array([
+        (bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()) for
+        bond in mol.mol.GetBonds()
+    ]).reshape(-1, 2)
+    bonds = bonds[labels[bonds[:, 0]] != labels[bonds[:, 1]]]
+    if len(bonds) == 0:
+        return
+
+    if bond_length is None:
+        table = rdkit.GetPeriodicTable()
+        radii = np.array([table.GetRcovalent(atom.GetAtomicNum()) for
+                          atom in mol.mol.GetAtoms()])
+        bond_length = radii[bonds[:, 0]] + radii[bonds[:, 1]]
+
+    excluded = _excluded_pairs(mol.mol, bonds)
+    ff = _ForceField(labels, bonds, bond_length, clash_distance,
+                     excluded)
+
+    energy, forces = ff(coords)
+    start_energy = energy
+    step = 0.1
+    for i in range(max_iters):
+        new_coords = ff.step(coords, forces, step)
+        new_energy, new_forces = ff(new_coords)
+        if new_energy < energy:
+            coords, energy, forces = new_coords, new_energy, new_forces
+            step *= 1.2
+        else:
+            step *= 0.5
+
+        if step < 1e-6 or energy < 1e-6:
+            break
+
+    logger.debug(f'Rigid relaxation of "{mol.name}" lowered energy '
+                 f'from {start_energy:.3f} to {energy:.3f} in '
+                 f'{i+1} steps.')
+    mol.set_position_from_matrix(coords.T, conformer)
+
+
+class _ForceField:
+    """
+    Calculates the energy and forces of :func:`rigid_relaxation`.
+
+    Attributes
+    ----------
+    labels : :class:`numpy.ndarray`
+        The index of the building block of each atom.
+
+    bonds : :class:`numpy.ndarray`
+        The ids of bonded atoms in different building blocks. Has
+        the shape ``[n_bonds, 2]``.
+
+    bond_length : :class:`numpy.ndarray`
+        The equilibrium length of each bond in :attr:`bonds`.
+
+    clash_distance : :class:`float`
+        The distance below which atoms of different building blocks
+        repel.
+
+    excluded : :class:`numpy.ndarray`
+        Pairs of atoms which do not repel. Each pair is held as
+        ``i*n + j``, where ``i`` is the smaller atom id, ``j`` the
+        larger one and ``n`` the number of atoms.
+
+    """
+
+    def __init__(self,
+                 labels,
+                 bonds,
+                 bond_length,
+                 clash_distance,
+                 excluded):
+        self.labels = labels
+        self.bonds = bonds
+        self.bond_length = bond_length
+        self.clash_distance = clash_distance
+        self.excluded = excluded
+        self._sizes = np.bincount(labels)
+
+    def __call__(self, coords):
+        """
+        Calculates the energy and forces.
+
+        Parameters
+        ----------
+        coords : :class:`numpy.ndarray`
+            The coordinates of the atoms. Has the shape ``[n, 3]``.
+
+        Returns
+        -------
+        :class:`tuple`
+            The energy, a :class:`float`, and the force on each atom,
+            a :class:`numpy.ndarray` of shape ``[n, 3]``.
+
+        """
+
+        forces = np.zeros_like(coords)
+        i, j = self.bonds.T
+        d = np.linalg.norm(coords[i] - coords[j], axis=1)
+        stretch = d - self.bond_length
+        energy = np.sum(stretch**2)
+        self._add_forces(coords, i, j, stretch, d, forces)
+
+        # scipy.spatial is slow to import, so only import it when
+        # needed.
+        from scipy.spatial import cKDTree
+
+        pairs = cKDTree(coords).query_pairs(self.clash_distance,
+                                            output_type='ndarray')
+        pairs = pairs.reshape(-1, 2)
+        i, j = pairs.T
+        keep = self.labels[i] != self.labels[j]
+        keep &= ~np.isin(i*len(coords) + j, self.excluded)
+        i, j = i[keep], j[keep]
+
+        d = np.linalg.norm(coords[i] - coords[j], axis=1)
+        overlap = d - self.clash_distance
+        energy += np.sum(overlap**2)
+        self._add_forces(coords, i, j, overlap, d, forces)
+        return energy, forces
+
+    @staticmethod
+    def _add_forces(coords, i, j, stretch, d, forces):
+        """
+        Adds the forces of harmonic terms between atoms `i` and `j`.
+
+        """
+
+        direction = (coords[i] - coords[j]) / np.maximum(d, 1e-8)[:, None]
+        f = -2 * stretch[:, None] * direction
+        np.add.at(forces, i, f)
+        np.add.at(forces, j, -f)
+
+    def step(self, coords, forces, size):
+        """
+        Moves each building block along its force and torque.
+
+        Parameters
+        ----------
+        coords : :class:`numpy.ndarray`
+            The coordinates of the atoms. Has the shape ``[n, 3]``.
+
+        forces : :class:`numpy.ndarray`
+            The force on each atom. Has the shape ``[n, 3]``.
+
+        size : :class:`float`
+            The size of the step.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The new coordinates of the atoms.
+
+        """
+
+        from scipy.spatial.transform import Rotation
+
+        n = len(self._sizes)
+        centroids = np.zeros((n, 3))
+        np.add.at(centroids, self.labels, coords)
+        centroids /= self._sizes[:, None]
+        rel = coords - centroids[self.labels]
+
+        total_force = np.zeros((n, 3))
+        np.add.at(total_force, self.labels, forces)
+        torque = np.zeros((n, 3))
+        np.add.at(torque, self.labels, np.cross(rel, forces))
+        inertia = np.bincount(self.labels,
+                              np.sum(rel**2, axis=1),
+                              minlength=n) + 1
+
+        translation = size * total_force / self._sizes[:, None]
+        rotation = Rotation.from_rotvec(size * torque / inertia[:, None])
+        rotated = np.einsum('aij,aj->ai',
+                            rotation.as_matrix()[self.labels],
+                            rel)
+        return (rotated + centroids[self.labels] +
+                translation[self.labels])
+
+
+def _excluded_pairs(mol, bonds):
+    """
+    Finds pairs of atoms which are at most 3 bonds apart across `bonds`.
+
+    Parameters
+    ----------
+    mol : :class:`rdkit.Mol`
+        The molecule.
+
+    bonds : :class:`numpy.ndarray`
+        The ids of bonded atoms in different building blocks. Has
+        the shape ``[n_bonds, 2]``.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Each pair is held as ``i*n + j``, where ``i`` is the smaller
+        atom id, ``j`` the larger one and ``n`` the number of atoms.
+
+    """
+
+    n = mol.GetNumAtoms()
+    excluded = set()
+    for a, b in bonds:
+        a_side = [a] + [n.GetIdx() for n in
+                        mol.GetAtomWithIdx(int(a)).GetNeighbors()]
+        b_side = [b] + [n.GetIdx() for n in
+                        mol.GetAtomWithIdx(int(b)).GetNeighbors()]
+        excluded.update(min(x, y)*n + max(x, y) for
+                        x in a_side for y in b_side)
+    return np.array(sorted(excluded))
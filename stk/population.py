@@ -9,13 +9,337 @@ from os.path import join
 import numpy as np
 import json
 from glob import iglob
-import multiprocessing as mp
-import psutil
-
-from .molecular import Molecule
-from .utilities import dedupe
+import logging
+import weakref
+from collections import Counter
+from functools import partial
+
+from .molecular import Molecule, MacroMolecule, MaxMinPicker, OPTIONS
+from .archive import PopulationArchive
+from .utilities import (dedupe,
+                        canonical_key,
+                        WorkerPool,
+                        TELEMETRY,
+                        dump_telemetry,
+                        summarize_telemetry)
 from .optimization.optimization import (_optimize_all_serial,
-                                        _optimize_all)
+                                        _optimize_all,
+                                        _optimize_all_async,
+                                        _OptimizationJournal)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _read_jsonl(path, member_init, building_blocks):
+    """
+    Yields the records in a file written by :meth:`.Population.dump_jsonl`.
+
+    Building block records are not yielded. Instead, the building
+    blocks are made and put in place of their keys in the members
+    which refer to them.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to the file.
+
+    member_init : :class:`function`
+        Makes the building blocks from their JSON representations.
+
+    building_blocks : :class:`dict`
+        Maps the key of each building block read so far to the
+        building block. Updated as building blocks are read.
+
+    Yields
+    ------
+    :class:`dict`
+        A member or population record.
+
+    """
+
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if 'building_block' in record:
+                bb = member_init(record['json'])
+                building_blocks[record['building_block']] = bb
+                continue
+
+            member = record.get('member', {})
+            if 'bb_counter' in member:
+                member['bb_counter'] = [
+                    (building_blocks[key] if isinstance(key, str) else
+                     key, count) for key, count in member['bb_counter']
+                ]
+            yield record
+
+
+def _share_building_blocks(mols, building_blocks):
+    """
+    Makes molecules use the building blocks in `building_blocks`.
+
+    Parameters
+    ----------
+    mols : :class:`list` of :class:`.Molecule`
+        The molecules.
+
+    building_blocks : :class:`dict`
+        Maps the canonical key of a building block to the building
+        block which should be used.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
+    for mol in mols:
+        if not isinstance(mol, MacroMolecule):
+            continue
+
+        mol.bb_counter = Counter({
+            building_blocks.get(canonical_key(bb.key), bb): count for
+            bb, count in mol.bb_counter.items()
+        })
+        mol.building_blocks = list(mol.bb_counter)
+
+
+def _init_members(member_init, items):
+    return [member_init(item) for item in items]
+
+
+def _use_cache(mols):
+    """
+    Replaces molecules made in other processes with cached ones.
+
+    Molecules which are not in the cache are added to it.
+
+    Parameters
+    ----------
+    mols : :class:`list` of :class:`.Molecule`
+        Molecules made in other processes. Replaced in place.
+
+    Returns
+    -------
+    :class:`list` of :class:`.Molecule`
+        `mols`.
+
+    """
+
+    if not OPTIONS['cache']:
+        return mols
+
+    for i, mol in enumerate(mols):
+        cache = mol.__class__.cache
+        # If the molecule did not exist already add it to the cache.
+        # If it did exist already, use the cached version.
+        mols[i] = cache.setdefault(mol.key, mol)
+    return mols
+
+
+def _inchi(mol):
+    return mol.inchi
+
+
+def _get_key(keys, mol):
+    return keys[id(mol)]
+
+
+def _structure_keys(mols, processes=1, pool=None):
+    """
+    Returns a key for each molecule, which is shared by molecules of
+    the same structure.
+
+    Parameters
+    ----------
+    mols : :class:`iterable` of :class:`.Molecule`
+        The molecules.
+
+    processes : :class:`int`, optional
+        The number of parallel processes used to make the keys.
+
+    pool : :class:`.WorkerPool`, optional
+        A running pool of processes used instead of making a new one.
+
+    Returns
+    -------
+    :class:`dict`
+        Maps the id of each molecule to its InChI.
+
+    """
+
+    # Molecules with the same key are made from the same building
+    # blocks and topology, or have the same InChI, so only one InChI
+    # per key needs to be made.
+    groups = {}
+    for mol in mols:
+        key = getattr(mol, 'key', None)
+        if key is None:
+            key = (None, id(mol))
+        groups.setdefault(key, []).append(mol)
+
+    groups = list(groups.values())
+    args = [(group[0], ) for group in groups]
+    if pool is not None:
+        inchis = pool.starmap(_inchi, args)
+    elif processes > 1 and len(args) > 1:
+        with WorkerPool(processes) as pool:
+            inchis = pool.starmap(_inchi, args)
+    else:
+        inchis = [_inchi(*arg) for arg in args]
+
+    return {
+        id(mol): inchi
+        for group, inchi in zip(groups, inchis)
+        for mol in group
+    }
+
+
+def _build(macromol_class, keys, args, pool):
+    """
+    Yields molecules, building any which are not in the cache.
+
+    Parameters
+    ----------
+    macromol_class : :class:`type`
+        The class of the molecules.
+
+    keys : :class:`list` of :class:`tuple`
+        The key of each molecule to yield, in order.
+
+    args : :class:`dict`
+        Maps the key of each molecule which needs to be built to the
+        building blocks and topology used to build it.
+
+    pool : :class:`.WorkerPool`
+        The pool of processes which builds the molecules. If ``None``,
+        they are built in this process.
+
+    Yields
+    ------
+    :class:`.MacroMolecule`
+        The molecule with each key in `keys`.
+
+    """
+
+    if pool is None:
+        mols = [macromol_class(*arg) for arg in args.values()]
+    else:
+        mols = _use_cache(pool.starmap(macromol_class, args.values()))
+    built = dict(zip(args, mols))
+
+    for key in keys:
+        mol = built.get(key)
+        yield macromol_class.cache[key] if mol is None else mol
+
+
+def _build_all(macromol_class,
+               building_blocks,
+               topologies,
+               batch_size,
+               duplicates,
+               pool):
+    """
+    Yields every molecule made from the building blocks.
+
+    See :meth:`.Population.iter_all`.
+
+    """
+
+    # Different combinations only have the same key if a building
+    # block or topology appears more than once. Otherwise, keys do
+    # not have to be held to find duplicates.
+    bb_keys = [bb.key for bbs in building_blocks for bb in bbs]
+    topology_keys = [repr(topology) for topology in topologies]
+    seen = None
+    if (not duplicates and
+            (len(set(bb_keys)) != len(bb_keys) or
+             len(set(topology_keys)) != len(topology_keys))):
+        seen = set()
+
+    keys, args = [], {}
+    for *bbs, topology in it.product(*building_blocks, topologies):
+        key = macromol_class.gen_key(bbs, topology)
+        if seen is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+
+        keys.append(key)
+        cached = OPTIONS['cache'] and key in macromol_class.cache
+        if not cached and key not in args:
+            args[key] = (bbs, topology)
+
+        if len(keys) == batch_size:
+            yield from _build(macromol_class, keys, args, pool)
+            keys, args = [], {}
+
+    yield from _build(macromol_class, keys, args, pool)
+
+
+class _PopulationList(list):
+    """
+    A :class:`list` which tells its :class:`Population` when it changes.
+
+    Used for :attr:`Population.members` and
+    :attr:`Population.populations`, so that the index of the
+    population is kept up to date.
+
+    Attributes
+    ----------
+    on_change : :class:`callable`
+        Called after every change. Takes one argument, a :class:`list`
+        of the items appended to the end of the list or ``None`` if
+        the list was changed in any other way.
+
+    """
+
+    def __init__(self, iterable=(), on_change=None):
+        super().__init__(iterable)
+        self.on_change = on_change
+
+    def append(self, item):
+        super().append(item)
+        self.on_change([item])
+
+    def extend(self, iterable):
+        items = list(iterable)
+        super().extend(items)
+        self.on_change(items)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def __reduce__(self):
+        # Pickle as a plain list, the population rebuilds its index
+        # when it is unpickled.
+        return list, (list(self), )
+
+
+def _changes_list(name):
+    """
+    Makes a method of :class:`_PopulationList` which reports changes.
+
+    """
+
+    def method(self, *args, **kwargs):
+        result = getattr(list, name)(self, *args, **kwargs)
+        self.on_change(None)
+        return result
+
+    method.__name__ = name
+    return method
+
+
+for _name in ('insert', 'remove', 'pop', 'clear', 'sort', 'reverse',
+              '__setitem__', '__delitem__', '__imul__'):
+    setattr(_PopulationList, _name, _changes_list(_name))
+del _name
 
 
 class Population:
@@ -56,6 +380,17 @@ class Population:
         of a population the generator :meth:`all_members` should be
         used.
 
+    Notes
+    -----
+    A population keeps an index of all the molecules it holds,
+    including those in its subpopulations. This makes membership
+    checks, indexing and :func:`len` take constant time, no matter how
+    large or deeply nested the population is. The index is updated
+    whenever :attr:`members` or :attr:`populations` of the population,
+    or of any of its subpopulations, is changed. Appending molecules
+    updates the index in place, any other change causes it to be
+    rebuilt when it is next used.
+
     """
 
     def __init__(self, *args):
@@ -78,25 +413,201 @@ class Population:
 
         """
 
-        self.populations = []
-        self.members = []
-
+        # Maps the id of each molecule in the population to the number
+        # of times it is held. ``None`` if the index needs to be
+        # rebuilt.
+        self._member_ids = None
+        # All molecules in the order of all_members(). ``None`` if it
+        # needs to be rebuilt.
+        self._flat = None
+        self._size = 0
+        # The populations which hold this one as a subpopulation.
+        self._parents = weakref.WeakSet()
+
+        populations = []
+        members = []
         for arg in args:
             if isinstance(arg, Population):
-                self.populations.append(arg)
+                populations.append(arg)
             elif isinstance(arg, Molecule):
-                self.members.append(arg)
+                members.append(arg)
             else:
                 raise TypeError(('Must use Population and Molecule '
                                  'objects for initialization.'))
 
+        self.populations = populations
+        self.members = members
+
+    @property
+    def members(self):
+        return self._members
+
+    @members.setter
+    def members(self, members):
+        self._members = _PopulationList(members, self._members_changed)
+        self._members_changed(None)
+
+    @property
+    def populations(self):
+        return self._populations
+
+    @populations.setter
+    def populations(self, populations):
+        self._populations = _PopulationList(populations,
+                                            self._populations_changed)
+        self._populations_changed(None)
+
+    def _members_changed(self, added):
+        """
+        Updates the index after :attr:`members` changes.
+
+        Parameters
+        ----------
+        added : :class:`list` of :class:`.Molecule`
+            The molecules appended to :attr:`members`. ``None`` if
+            :attr:`members` was changed in any other way.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        # Molecules appended to the members of a population without
+        # subpopulations are also at the end of all_members().
+        self._update_index(added, not self._populations)
+
+    def _populations_changed(self, added):
+        """
+        Updates the index after :attr:`populations` changes.
+
+        Parameters
+        ----------
+        added : :class:`list` of :class:`Population`
+            The populations appended to :attr:`populations`. ``None``
+            if :attr:`populations` was changed in any other way.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        # Subpopulations which were removed are found and forgotten
+        # the next time they change.
+        for pop in self._populations if added is None else added:
+            pop._parents.add(self)
+
+        if added is None:
+            self._update_index(None)
+        else:
+            mols = [mol for pop in added for mol in pop]
+            self._update_index(mols, True)
+
+    def _update_index(self, added, at_end=False):
+        """
+        Updates the index of the population and of its parents.
+
+        Parameters
+        ----------
+        added : :class:`list` of :class:`.Molecule`
+            Molecules added to the population. If ``None``, the
+            population was changed in some other way and the index is
+            rebuilt when it is next used.
+
+        at_end : :class:`bool`, optional
+            If ``True``, the molecules in `added` were added to the end
+            of :meth:`all_members`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if added is None:
+            self._member_ids = None
+            self._flat = None
+
+        else:
+            # The two parts of the index are built separately, so
+            # either may exist without the other.
+            if self._member_ids is not None:
+                for mol in added:
+                    key = id(mol)
+                    self._member_ids[key] = (
+                        self._member_ids.get(key, 0) + 1)
+                self._size += len(added)
+
+            if at_end and self._flat is not None:
+                self._flat.extend(added)
+            else:
+                self._flat = None
+
+        for parent in list(self._parents):
+            # The population may be held more than once, or not at all
+            # if it has been removed.
+            count = sum(pop is self for pop in parent._populations)
+            if count == 0:
+                self._parents.discard(parent)
+            else:
+                parent._update_index(None if added is None else
+                                     added*count)
+
+    def _index(self):
+        """
+        Returns the index of the population, building it if needed.
+
+        Returns
+        -------
+        :class:`dict`
+            Maps the id of each molecule in the population to the
+            number of times it is held.
+
+        """
+
+        if self._member_ids is None:
+            member_ids = {}
+            size = 0
+            for mol in self.all_members():
+                key = id(mol)
+                member_ids[key] = member_ids.get(key, 0) + 1
+                size += 1
+            self._member_ids, self._size = member_ids, size
+        return self._member_ids
+
+    def _flat_members(self):
+        """
+        Returns all molecules in the order of :meth:`all_members`.
+
+        Returns
+        -------
+        :class:`list` of :class:`.Molecule`
+            All the molecules in the population.
+
+        """
+
+        if self._flat is None:
+            self._flat = list(self.all_members())
+        return self._flat
+
+    def __getstate__(self):
+        return {'members': list(self._members),
+                'populations': list(self._populations)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.populations = state['populations']
+        self.members = state['members']
+
     @classmethod
     def init_all(cls,
                  macromol_class,
                  building_blocks,
                  topologies,
                  processes=None,
-                 duplicates=False):
+                 duplicates=False,
+                 pool=None):
         """
         Creates all possible molecules from provided building blocks.
 
@@ -139,6 +650,12 @@ class Population:
             If ``False``, duplicate structures are removed from
             the population.
 
+        pool : :class:`.WorkerPool`, optional
+            The pool of processes which builds the molecules. It is
+            left running afterwards, so that it can be reused. If
+            ``None``, a new pool of `processes` processes is created
+            and closed once the molecules are built.
+
         Returns
         -------
         :class:`Population`
@@ -147,28 +664,109 @@ class Population:
 
         """
 
-        args = []
-        for *bbs, topology in it.product(*building_blocks, topologies):
-            args.append((bbs, topology))
+        return cls(*cls.iter_all(macromol_class=macromol_class,
+                                 building_blocks=building_blocks,
+                                 topologies=topologies,
+                                 processes=processes,
+                                 duplicates=duplicates,
+                                 pool=pool))
+
+    @staticmethod
+    def iter_all(macromol_class,
+                 building_blocks,
+                 topologies,
+                 processes=None,
+                 chunksize=100,
+                 duplicates=False,
+                 pool=None):
+        """
+        Yields all possible molecules from provided building blocks.
+
+        This is the streaming version of :meth:`init_all`, for
+        libraries too large to hold in memory. Combinations of
+        building blocks are made as they are needed and built
+        `chunksize` per process at a time, so only one chunk of
+        molecules is held at once, on top of any the caller keeps.
+        Molecules can be written to a :class:`.PopulationArchive` as
+        they are made
 
-        with mp.Pool(processes) as pool:
-            mols = pool.starmap(macromol_class, args)
+        .. code-block:: python
 
-        # Update the cache.
-        for i, mol in enumerate(mols):
-            # If the molecule did not exist already add it to the
-            # cache.
-            if mol.key not in macromol_class.cache:
-                macromol_class.cache[mol.key] = mol
-            # If the molecule did exist already, use the cached
-            # version.
-            else:
-                mols[i] = macromol_class.cache[mol.key]
+            stk.OPTIONS['cache'] = False
+            with stk.PopulationArchive('library', 'w') as archive:
+                for mol in stk.Population.iter_all(stk.Cage,
+                                                   building_blocks,
+                                                   topologies):
+                    archive.add_member(mol)
 
-        p = cls(*mols)
-        if not duplicates:
-            p.remove_duplicates()
-        return p
+        If :data:`.OPTIONS` ``['cache']`` is ``True``, molecules
+        already in the cache are not built again and built
+        molecules are added to the cache, which then grows with the
+        library.
+
+        Duplicates are found by their keys before they are built.
+        If a building block or topology appears more than once in the
+        input, the keys of the molecules made so far are held to do
+        this.
+
+        Parameters
+        ----------
+        macromol_class : :class:`type`
+            The class of the :class:`.MacroMolecule` objects being
+            built.
+
+        building_blocks : :class:`list`
+            A :class:`list` holding a :class:`list` of
+            :class:`.StructUnit` for each building block position.
+            See :meth:`init_all`.
+
+        topologies : :class:`list` of :class:`.Topology`
+            The topologies of macromolecules being made.
+
+        processes : :class:`int`, optional
+            The number of parallel processes to create when building
+            the molecules. If ``None``, one per CPU is made.
+
+        chunksize : :class:`int`, optional
+            The number of molecules built by each process at a time.
+
+        duplicates : :class:`bool`, optional
+            If ``False``, molecules with the same key are yielded
+            only once.
+
+        pool : :class:`.WorkerPool`, optional
+            The pool of processes which builds the molecules. It is
+            left running afterwards. If ``None``, a new pool of
+            `processes` processes is created and closed once all the
+            molecules are yielded.
+
+        Yields
+        ------
+        :class:`.MacroMolecule`
+            A molecule, in the order of
+            ``itertools.product(*building_blocks, topologies)``.
+
+        """
+
+        def build_all(batch_size, pool):
+            return _build_all(macromol_class=macromol_class,
+                              building_blocks=building_blocks,
+                              topologies=topologies,
+                              batch_size=batch_size,
+                              duplicates=duplicates,
+                              pool=pool)
+
+        if pool is None and processes == 1:
+            yield from build_all(chunksize, None)
+
+        elif pool is None:
+            with WorkerPool(processes) as pool:
+                num_processes = pool.processes or os.cpu_count()
+                yield from build_all(chunksize*num_processes, pool)
+
+        else:
+            num_processes = pool.processes or os.cpu_count()
+            yield from build_all(chunksize*num_processes, pool)
 
     @classmethod
     def init_diverse(cls,
@@ -184,10 +782,12 @@ class Population:
         From the supplied sublists of building blocks, a random
         molecule is selected to initialize a :class:`.MacroMolecule`
         per sublist. The next molecule selected from the same sublist
-        is the one most with the most different Morgan fingerprint. The
-        next molecule is picked at random again and so on. This is done
-        until `size` :class:`.MacroMolecule` instances have been
-        formed.
+        is the one whose Morgan fingerprint is most different from
+        those of all the molecules selected from it so far, picked by
+        a :class:`.MaxMinPicker`. The next molecule is picked at random
+        again and so on. Once every molecule in a sublist has been
+        selected, the picker starts again. This is done until `size`
+        :class:`.MacroMolecule` instances have been formed.
 
         Parameters
         ----------
@@ -236,6 +836,15 @@ class Population:
         for db in building_blocks:
             np.random.shuffle(db)
 
+        # Each picker selects the building blocks of a sublist which
+        # are most different from those already selected.
+        pickers = [MaxMinPicker(bb.fingerprint() for bb in db) for
+                   db in building_blocks]
+        # Maps the id of each building block to its index in its
+        # sublist.
+        indices = [{id(bb): i for i, bb in enumerate(db)} for
+                   db in building_blocks]
+
         # Go through every possible macromolecule.
         for *bbs, top in it.product(*building_blocks, topologies):
 
@@ -247,22 +856,17 @@ class Population:
             if len(pop) == size:
                 break
 
-            # Make an iterators which goes through all rdkit molecules
-            # in the sublists.
-            mol_iters = [(struct_unit.mol for struct_unit in db) for
-                         db in building_blocks]
-            # Make a dictionary which maps every rdkit molecule to its
-            # StructUnit, for every sublist in building_blocks.
-            mol_maps = [{struct_unit.mol: struct_unit for struct_unit in db}
-                        for db in building_blocks]
-
             # Get the most different StructUnit to the previously
-            # selected one, per sublist. Take index of 1 because the
-            # index of 0 will the molecule itself.
-            diff_mols = [bb.similar_molecules(mols)[1][1] for
-                         bb, mols in zip(bbs, mol_iters)]
-            diff_bbs = [mol_map[mol] for
-                        mol_map, mol in zip(mol_maps, diff_mols)]
+            # selected ones, per sublist.
+            diff_bbs = []
+            for i, (db, bb) in enumerate(zip(building_blocks, bbs)):
+                index = indices[i][id(bb)]
+                pickers[i].add(index)
+                if len(pickers[i].picked) == len(db) > 1:
+                    pickers[i] = MaxMinPicker(pickers[i].fps)
+                    pickers[i].add(index)
+                diff_bbs.append(db[pickers[i].pick()] if
+                                len(db) > 1 else bb)
 
             macro_mol = macromol_class(diff_bbs, top)
             if macro_mol not in pop:
@@ -279,6 +883,10 @@ class Population:
         """
         Creates a population from files in `folder`.
 
+        The files are read one after another. A
+        :class:`.BuildingBlockLibrary` indexes a folder in parallel
+        and makes molecules only when they are used.
+
         Parameters
         ----------
         folder : :class:`str`
@@ -416,8 +1024,11 @@ class Population:
         if duplicates:
             self.members.extend(mol for mol in population)
         else:
-            self.members.extend(mol for mol in population if
-                                mol not in self)
+            # Append one at a time, so that molecules held more than
+            # once by `population` are only added once.
+            for mol in population:
+                if mol not in self:
+                    self.members.append(mol)
 
     def add_subpopulation(self, population):
         """
@@ -529,6 +1140,105 @@ class Population:
         with open(path, 'w') as f:
             json.dump(self.to_list(), f, indent=4)
 
+    def dump_jsonl(self, path, share_building_blocks=True):
+        """
+        Dumps the population to a JSON Lines file, one member at a time.
+
+        Unlike :meth:`dump`, the representation of the whole population
+        is never held in memory. Each line of the file holds one
+        record. A member is written as
+
+        .. code-block:: python
+
+            {"location": [1, 0], "member": mol.json()}
+
+        where ``"location"`` gives the indices of the subpopulations
+        which hold the member, in :attr:`populations` of the
+        population, then of the subpopulation and so on. An empty
+        ``"location"`` means the member is held directly by the
+        population. Before the members of a subpopulation, it is
+        written as
+
+        .. code-block:: python
+
+            {"population": [1, 0]}
+
+        so that empty subpopulations are kept too.
+
+        If `share_building_blocks` is ``True``, each building block
+        of a :class:`.MacroMolecule` is written once, as
+
+        .. code-block:: python
+
+            {"building_block": canonical_key(bb.key), "json": bb.json()}
+
+        before the first member made from it. Members then refer to
+        their building blocks by key, see :meth:`.MacroMolecule.json`.
+        When the file is loaded, each building block is made once and
+        shared by all the members made from it. This makes the file
+        much smaller when many members share building blocks.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The full path of the file to which the population should
+            be dumped.
+
+        share_building_blocks : :class:`bool`, optional
+            If ``True``, building blocks are written once, instead of
+            once per member made from them.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        written = set() if share_building_blocks else None
+        with open(path, 'w') as f:
+            for record in self._jsonl_records([], written):
+                f.write(json.dumps(record) + '\n')
+
+    def _jsonl_records(self, location, written):
+        """
+        Yields the records written by :meth:`dump_jsonl`.
+
+        Parameters
+        ----------
+        location : :class:`list` of :class:`int`
+            The location of the population, within the population
+            being dumped.
+
+        written : :class:`set` of :class:`str`
+            The keys of the building blocks written so far. Updated
+            with any written by this method. If ``None``, building
+            blocks are written as part of each member.
+
+        Yields
+        ------
+        :class:`dict`
+            A record.
+
+        """
+
+        for mol in self.members:
+            if written is None or not isinstance(mol, MacroMolecule):
+                yield {'location': location, 'member': mol.json()}
+                continue
+
+            for bb in mol.bb_counter:
+                key = canonical_key(bb.key)
+                if key not in written:
+                    written.add(key)
+                    yield {'building_block': key, 'json': bb.json()}
+            yield {'location': location,
+                   'member': mol.json(building_blocks=False)}
+
+        for i, pop in enumerate(self.populations):
+            sublocation = [*location, i]
+            yield {'population': sublocation}
+            yield from pop._jsonl_records(sublocation, written)
+
     @classmethod
     def from_list(cls, pop_list, member_init):
         """
@@ -621,6 +1331,221 @@ class Population:
 
         return cls.from_list(pop_list, member_init)
 
+    @staticmethod
+    def iter_jsonl(path, member_init):
+        """
+        Yields the members in a file written by :meth:`dump_jsonl`.
+
+        The file is read one line at a time, so the population is
+        never held in memory.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The full path of the file holding the dumped population.
+
+        member_init : :class:`function`
+            Converts the representation of a member in the file to a
+            :class:`.Molecule`, for example
+            :meth:`.Molecule.from_dict`.
+
+        Yields
+        ------
+        :class:`tuple`
+            The location of a member, a :class:`tuple` of
+            :class:`int`, and the member. See :meth:`dump_jsonl`.
+
+        """
+
+        for record in _read_jsonl(path, member_init, {}):
+            if 'member' in record:
+                mol = member_init(record['member'])
+                yield tuple(record['location']), mol
+
+    def dump_archive(self, path):
+        """
+        Dumps the population to a :class:`.PopulationArchive`.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the directory to which the archive is written.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with PopulationArchive(path, 'w') as archive:
+            self._archive(archive, ())
+
+    def _archive(self, archive, location):
+        """
+        Adds the population to an archive open for writing.
+
+        Parameters
+        ----------
+        archive : :class:`.PopulationArchive`
+            The archive.
+
+        location : :class:`tuple` of :class:`int`
+            The location of the population, within the population
+            being dumped.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        for mol in self.members:
+            archive.add_member(mol, location)
+
+        for i, pop in enumerate(self.populations):
+            sublocation = (*location, i)
+            archive.add_population(sublocation)
+            pop._archive(archive, sublocation)
+
+    @staticmethod
+    def iter_archive(path, member_init):
+        """
+        Yields the members in a :class:`.PopulationArchive`.
+
+        Each member is made only when it is reached, so the population
+        is never held in memory.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the directory holding the archive.
+
+        member_init : :class:`function`
+            Makes a member from its JSON representation, for example
+            :meth:`.Molecule.from_dict`.
+
+        Yields
+        ------
+        :class:`tuple`
+            The location of a member, a :class:`tuple` of
+            :class:`int`, and the member. See :meth:`dump_jsonl`.
+
+        """
+
+        with PopulationArchive(path, member_init=member_init) as archive:
+            for i in range(len(archive)):
+                yield archive.location(i), archive[i]
+
+    @classmethod
+    def load_jsonl(cls,
+                   path,
+                   member_init,
+                   processes=1,
+                   chunksize=100,
+                   pool=None):
+        """
+        Initializes a :class:`Population` from a JSON Lines dump.
+
+        The file is read one line at a time. If more than one process
+        is used, members are made in chunks, so that at most
+        `chunksize` * `processes` member representations are held in
+        memory at once. Building blocks stored once in the file are
+        made once and shared by the members made from them.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The full path of the file written by :meth:`dump_jsonl`.
+
+        member_init : :class:`function`
+            Converts the representation of a member in the file to a
+            :class:`.Molecule`, for example
+            :meth:`.Molecule.from_dict`. It must be picklable if more
+            than one process is used.
+
+        processes : :class:`int`, optional
+            The number of parallel processes used to make the members.
+
+        chunksize : :class:`int`, optional
+            The number of members sent to a process at a time.
+
+        pool : :class:`.WorkerPool`, optional
+            A running pool of processes used instead of making a new
+            one.
+
+        Returns
+        -------
+        :class:`Population`
+            The population stored in the file, with the same
+            subpopulations.
+
+        """
+
+        pop = cls()
+        pops = {(): pop}
+        # Maps the key of each building block in the file to the
+        # building block.
+        building_blocks = {}
+
+        def add_population(location):
+            subpop = cls()
+            pops[location[:-1]].populations.append(subpop)
+            pops[location] = subpop
+
+        records = _read_jsonl(path, member_init, building_blocks)
+        if pool is None and processes == 1:
+            for record in records:
+                if 'population' in record:
+                    add_population(tuple(record['population']))
+                else:
+                    location = tuple(record['location'])
+                    mol = member_init(record['member'])
+                    pops[location].members.append(mol)
+            return pop
+
+        # Members are made in parallel. The location of each member
+        # is kept until it comes back.
+        def add_members(pool):
+            batch_size = chunksize*(pool.processes or os.cpu_count())
+            locations, items = [], []
+
+            def flush():
+                chunks = [(member_init, items[i:i+chunksize]) for
+                          i in range(0, len(items), chunksize)]
+                results = pool.starmap(_init_members, chunks)
+                mols = [mol for r in results for mol in r]
+                # Building blocks were copied when they were sent to
+                # the other processes.
+                _share_building_blocks(mols, building_blocks)
+                mols = _use_cache(mols)
+                for location, mol in zip(locations, mols):
+                    pops[location].members.append(mol)
+                locations.clear()
+                items.clear()
+
+            for record in records:
+                # A subpopulation is written before its members, so
+                # it exists by the time they come back.
+                if 'population' in record:
+                    add_population(tuple(record['population']))
+                    continue
+
+                locations.append(tuple(record['location']))
+                items.append(record['member'])
+                if len(items) == batch_size:
+                    flush()
+
+            if items:
+                flush()
+
+        if pool is None:
+            with WorkerPool(processes) as pool:
+                add_members(pool)
+        else:
+            add_members(pool)
+
+        return pop
+
     def max(self, key):
         """
         Calculates the maximum in the population given a key.
@@ -711,7 +1636,17 @@ class Population:
 
         return np.min([key(member) for member in self], axis=0)
 
-    def optimize(self, func_data, processes=psutil.cpu_count()):
+    def optimize(self,
+                 func_data,
+                 processes=os.cpu_count(),
+                 executor=None,
+                 transfer='coords',
+                 deadline=None,
+                 chunksize=1,
+                 pool=None,
+                 checkpoint=None,
+                 resume=False,
+                 telemetry=None):
         """
         Optimizes the structures of molecules in the population.
 
@@ -722,6 +1657,13 @@ class Population:
         In this case creating a parallel process pool creates
         unncessary overhead.
 
+        If `executor` is provided, the molecules are optimized
+        concurrently from this process instead and `processes` is
+        ignored. This is useful when the optimization function runs
+        an external program, such as MacroModel or MOPAC, as
+        the :class:`.Executor` limits how many jobs and licenses are
+        used at the same time.
+
         Notes
         -----
         This function modifies the structures of molecules held by the
@@ -739,21 +1681,103 @@ class Population:
             The number of parallel processes to create. Optimization
             will run serially if ``1``.
 
+        executor : :class:`.Executor`, optional
+            The executor used to run external programs.
+
+        transfer : :class:`str`, optional
+            How molecules are sent between processes when running in
+            parallel. With ``'coords'``, only what is needed to
+            optimize a molecule is sent and only its new coordinates,
+            optimized flag and energies are sent back. With
+            ``'molecule'``, whole molecules are sent both ways.
+
+        deadline : :class:`float`, optional
+            The number of seconds the optimization of a single
+            molecule is allowed to take. Molecules which take longer
+            are treated as failed optimizations, so one slow molecule
+            cannot hold up the rest of the population. Not used with
+            an `executor`, which has its own timeouts. If ``None``,
+            there is no deadline.
+
+        chunksize : :class:`int`, optional
+            The number of molecules sent to a process at a time when
+            running in parallel.
+
+        pool : :class:`.WorkerPool`, optional
+            A running pool of processes to optimize the molecules
+            with. The pool is left running afterwards, so that it can
+            be reused by later calls. If provided, `processes` is
+            ignored.
+
+        checkpoint : :class:`str`, optional
+            The path to a journal file. Each molecule is written to
+            the journal as soon as its optimization finishes, which
+            means its coordinates, :attr:`~.Molecule.optimized` flag
+            and energies are kept if the run is stopped part way
+            through.
+
+        resume : :class:`bool`, optional
+            If ``True``, molecules already in the `checkpoint` journal
+            are restored from it, matched by their
+            :attr:`~.Molecule.key`, and are not optimized again. If
+            ``False``, the journal is started from scratch.
+
+        telemetry : :class:`str`, optional
+            The path to a JSON lines file. A :class:`.TelemetryRecord`
+            of each optimized molecule, holding the external programs
+            run for it, their timings, retries, timeouts and the
+            outcome, is appended to the file.
+
         Returns
         -------
-        None : :class:`NoneType`
+        :class:`dict`
+            A summary of the telemetry records made during the
+            optimization, given by :func:`.summarize_telemetry`.
 
         """
 
-        if processes == 1:
-            _optimize_all_serial(func_data, self)
-        else:
-            _optimize_all(func_data, self, processes)
+        # Keep the records made before this call apart from the ones
+        # made during it.
+        earlier = TELEMETRY.collect()
+        journal = None
+        if checkpoint is not None:
+            journal = _OptimizationJournal(checkpoint, resume)
+            journal.restore(self)
+
+        try:
+            if executor is not None:
+                _optimize_all_async(func_data, self, executor, journal)
+            elif processes == 1 and pool is None:
+                _optimize_all_serial(func_data, self, deadline, journal)
+            else:
+                _optimize_all(func_data,
+                              self,
+                              processes,
+                              transfer,
+                              deadline,
+                              chunksize,
+                              pool,
+                              journal)
+        finally:
+            if journal is not None:
+                journal.close()
+
+            records = TELEMETRY.collect() or []
+            TELEMETRY.merge(earlier)
+            TELEMETRY.merge(records)
+
+        if telemetry is not None:
+            dump_telemetry(records, telemetry)
+        summary = summarize_telemetry(records)
+        logger.info(f'Optimization telemetry: {json.dumps(summary)}')
+        return summary
 
     def remove_duplicates(self,
                           between_subpops=True,
                           key=id,
-                          top_seen=None):
+                          top_seen=None,
+                          processes=1,
+                          pool=None):
         """
         Removes duplicates from the population and preserves structure.
 
@@ -779,9 +1803,20 @@ class Population:
             given subpopulation. If ``True``, all duplicates are
             removed, regardless of which subpopulation they are in.
 
-        key : :class:`callable`, optional
+        key : :class:`callable` or :class:`str`, optional
             Two molecules are considered the same if the values
-            returned by ``key(molecule)`` are the same.
+            returned by ``key(molecule)`` are the same. If
+            ``'structure'``, molecules with the same structure, as
+            judged by :meth:`.Molecule.same`, are duplicates.
+
+        processes : :class:`int`, optional
+            The number of parallel processes used to find the
+            structures of the molecules, when `key` is
+            ``'structure'``.
+
+        pool : :class:`.WorkerPool`, optional
+            A running pool of processes used instead of making a new
+            one, when `key` is ``'structure'``.
 
         Returns
         -------
@@ -789,6 +1824,10 @@ class Population:
 
         """
 
+        if key == 'structure':
+            keys = _structure_keys(self, processes, pool)
+            key = partial(_get_key, keys)
+
         # Whether duplicates are being removed from within a single
         # subpopulation or from different subpopulations, the duplicate
         # must be removed from the `members` attribute of some
@@ -958,12 +1997,12 @@ class Population:
         # If ``int``, return the corresponding ``Molecule``
         # instance from the `all_members` generator.
         if isinstance(key, int):
-            return list(self.all_members())[key]
+            return self._flat_members()[key]
 
         # If ``slice`` return a ``Population`` of the corresponding
         # ``Molecule`` instances.
         if isinstance(key, slice):
-            mols = it.islice(self.all_members(),
+            mols = it.islice(self._flat_members(),
                              key.start, key.stop, key.step)
             pop = self.__class__(*mols)
             return pop
@@ -984,13 +2023,8 @@ class Population:
 
         """
 
-        size = len(self.members)
-        stack = list(self.populations)
-        while stack:
-            subpop = stack.pop()
-            stack.extend(subpop.populations)
-            size += len(subpop.members)
-        return size
+        self._index()
+        return self._size
 
     def __sub__(self, other):
         """
@@ -1048,7 +2082,7 @@ class Population:
         return self.__class__(self, other)
 
     def __contains__(self, item):
-        return any(item is mol for mol in self.all_members())
+        return id(item) in self._index()
 
     def __str__(self):
         output_string = (" Population " + str(id(self)) + "\n" +
@@ -1,2 +1,7 @@
 from .utilities import *
 from .mplogging import *
+from .workspace import *
+from .executor import *
+from .instrumentation import *
+from .telemetry import *
+from .pool import *
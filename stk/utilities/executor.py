@@ -0,0 +1,666 @@
+"""
+Defines tools for running external programs with :mod:`asyncio`.
+
+The external programs used by ``stk``, such as MacroModel and MOPAC,
+are run through an :class:`Executor`. The :class:`Executor` runs each
+program as an :mod:`asyncio` subprocess, which means that a single
+process can run many external jobs at the same time.
+
+The :class:`Executor` also takes care of the things which every
+external job needs:
+
+    1. The number of jobs of each engine which are allowed to run at
+       the same time can be limited.
+    2. Engines which need a license can share a limited number of
+       license tokens.
+    3. Jobs which fail because no license was found are resubmitted
+       with an exponential backoff.
+    4. Jobs which take too long are stopped and, if they do not stop
+       on their own, killed.
+    5. Output files can be waited for without blocking.
+    6. Every job gets its own directory in a :class:`.Workspace`.
+    7. Jobs run inside :func:`deadline` are killed once the deadline
+       passes, or if the task running them is cancelled, so that no
+       program is left running without a parent.
+
+For example, to run at most ``4`` ``bmin`` jobs at a time, while
+sharing ``2`` license tokens with ``structconvert``
+
+.. code-block:: python
+
+    executor = Executor()
+    executor.set_license('mmlibs', 2)
+    executor.set_engine('bmin', max_jobs=4, license='mmlibs')
+    executor.set_engine('structconvert', license='mmlibs')
+
+Functions which run external programs should use :data:`EXECUTOR`
+unless they are given a different :class:`Executor` to use.
+
+"""
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from .workspace import Workspace
+from .instrumentation import INSTRUMENTATION
+from .telemetry import TELEMETRY
+
+
+logger = logging.getLogger(__name__)
+
+
+class LicenseError(Exception):
+    """
+    Raised when a job runs out of attempts to find a license.
+
+    """
+
+    ...
+
+
+class DeadlineError(Exception):
+    """
+    Raised when a job is stopped because a deadline passed.
+
+    """
+
+    ...
+
+
+# The time, as given by :func:`time.time`, by which jobs run in the
+# current context must finish. Set by :func:`deadline`.
+_DEADLINE = contextvars.ContextVar('_DEADLINE', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Sets a deadline for the jobs run by an :class:`Executor`.
+
+    The deadline holds for jobs run in the context, including those
+    run by :func:`run_coroutine`. A job still running when the
+    deadline passes is stopped, as if it had timed out, and
+    :class:`DeadlineError` is raised. If a deadline is already set,
+    the earlier of the two is used.
+
+    Parameters
+    ----------
+    seconds : :class:`float`
+        The number of seconds the context is allowed to take. If
+        ``None``, no deadline is set.
+
+    Yields
+    ------
+    None : :class:`NoneType`
+
+    """
+
+    if seconds is None:
+        yield
+        return
+
+    end = time.time() + seconds
+    current = _DEADLINE.get()
+    if current is not None:
+        end = min(end, current)
+    token = _DEADLINE.set(end)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+class EngineJob:
+    """
+    Holds the outcome of running an external program.
+
+    Attributes
+    ----------
+    engine : :class:`str`
+        The name of the engine which ran the job, for example
+        ``'bmin'``.
+
+    cmd : :class:`list` of :class:`str`
+        The command which was run.
+
+    output : :class:`str`
+        The combined stdout and stderr of the last attempt to run
+        the job.
+
+    returncode : :class:`int`
+        The return code of the last attempt to run the job.
+
+    retries : :class:`int`
+        The number of times the job was resubmitted because a license
+        was not found.
+
+    timed_out : :class:`bool`
+        ``True`` if the job was stopped because it ran past its
+        timeout.
+
+    killed : :class:`bool`
+        ``True`` if the job had to be killed because it did not stop
+        after it timed out.
+
+    wall_time : :class:`float`
+        The total time in seconds taken by the job, including any
+        time spent waiting for a license.
+
+    wait_time : :class:`float`
+        The time in seconds spent waiting for a job slot or a license
+        token of the :class:`Executor`.
+
+    run_time : :class:`float`
+        The time in seconds spent running the command, summed over all
+        attempts.
+
+    backoff_time : :class:`float`
+        The time in seconds spent waiting before resubmitting the
+        command, because no license was found.
+
+    """
+
+    def __init__(self, engine, cmd):
+        self.engine = engine
+        self.cmd = cmd
+        self.output = ''
+        self.returncode = None
+        self.retries = 0
+        self.timed_out = False
+        self.killed = False
+        self.wall_time = 0
+        self.wait_time = 0
+        self.run_time = 0
+        self.backoff_time = 0
+
+    def __repr__(self):
+        return (f'EngineJob({self.engine!r}, '
+                f'returncode={self.returncode}, '
+                f'retries={self.retries}, '
+                f'timed_out={self.timed_out}, '
+                f'killed={self.killed}, '
+                f'wall_time={self.wall_time:.2f})')
+
+
+class Executor:
+    """
+    Runs external programs as :mod:`asyncio` subprocesses.
+
+    Attributes
+    ----------
+    engines : :class:`dict`
+        Maps the name of an engine to a :class:`tuple` of the form
+        ``(max_jobs, license)``. Here, ``max_jobs`` is the maximum
+        number of jobs of the engine allowed to run at the same time
+        and ``license`` is the name of the license the engine uses.
+        Either can be ``None``, which means there is no limit.
+
+    licenses : :class:`dict`
+        Maps the name of a license to the number of tokens available.
+
+    backoff : :class:`float`
+        The number of seconds waited before a job is resubmitted
+        after failing to find a license the first time. The wait is
+        doubled every time the license is not found again.
+
+    max_backoff : :class:`float`
+        The maximum number of seconds waited between two attempts
+        to find a license.
+
+    max_retries : :class:`int`
+        The maximum number of times a job is resubmitted because
+        a license was not found. If ``None`` the job is resubmitted
+        until a license is found.
+
+    kill_timeout : :class:`float`
+        When a job times out, the number of seconds it is given to
+        stop on its own before it is killed.
+
+    workspace : :class:`.Workspace`
+        Creates the directories in which the files of jobs are
+        written.
+
+    """
+
+    def __init__(self,
+                 backoff=1,
+                 max_backoff=300,
+                 max_retries=None,
+                 kill_timeout=600,
+                 workspace=None):
+        """
+        Initializes an :class:`Executor`.
+
+        Parameters
+        ----------
+        backoff : :class:`float`, optional
+            The number of seconds waited before a job is resubmitted
+            after failing to find a license the first time.
+
+        max_backoff : :class:`float`, optional
+            The maximum number of seconds waited between two attempts
+            to find a license.
+
+        max_retries : :class:`int`, optional
+            The maximum number of times a job is resubmitted because
+            a license was not found. If ``None`` the job is
+            resubmitted until a license is found.
+
+        kill_timeout : :class:`float`, optional
+            When a job times out, the number of seconds it is given to
+            stop on its own before it is killed.
+
+        workspace : :class:`.Workspace`, optional
+            Creates the directories in which the files of jobs are
+            written. If ``None``, a :class:`.Workspace` with the
+            default settings is used.
+
+        """
+
+        if workspace is None:
+            workspace = Workspace()
+
+        self.engines = {}
+        self.licenses = {}
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.kill_timeout = kill_timeout
+        self.workspace = workspace
+        # asyncio semaphores belong to a single event loop, so a
+        # separate set is made for every loop the executor is used in.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def set_engine(self, engine, max_jobs=None, license=None):
+        """
+        Sets the limits of an engine.
+
+        Parameters
+        ----------
+        engine : :class:`str`
+            The name of the engine, for example ``'bmin'``.
+
+        max_jobs : :class:`int`, optional
+            The maximum number of jobs of `engine` allowed to run at
+            the same time. If ``None`` there is no limit.
+
+        license : :class:`str`, optional
+            The name of the license `engine` needs to run. The number
+            of license tokens is set with :meth:`set_license`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.engines[engine] = (max_jobs, license)
+
+    def set_license(self, license, tokens):
+        """
+        Sets the number of tokens available for a license.
+
+        Parameters
+        ----------
+        license : :class:`str`
+            The name of the license.
+
+        tokens : :class:`int`
+            The number of jobs which can hold the license at the same
+            time.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.licenses[license] = tokens
+
+    async def run(self,
+                  engine,
+                  cmd,
+                  timeout=None,
+                  cwd=None,
+                  license_found=None,
+                  on_timeout=None):
+        """
+        Runs an external program.
+
+        Parameters
+        ----------
+        engine : :class:`str`
+            The name of the engine running the job. Used to look up
+            the limits set by :meth:`set_engine`.
+
+        cmd : :class:`list` of :class:`str`
+            The command to run. The first element is the program and
+            the rest are its arguments.
+
+        timeout : :class:`float`, optional
+            The number of seconds the job is allowed to run before it
+            is stopped. If ``None`` there is no timeout.
+
+        cwd : :class:`str`, optional
+            The directory in which the job is run.
+
+        license_found : :class:`callable`, optional
+            Takes the output of the job and returns ``False`` if the
+            job failed because no license was found. The job is then
+            resubmitted after a backoff.
+
+        on_timeout : :class:`callable`, optional
+            Called with no arguments when the job times out. It should
+            ask the program to stop and may be a coroutine function.
+            If ``None``, the program is killed straight away.
+
+        Returns
+        -------
+        :class:`EngineJob`
+            The outcome of the job.
+
+        Raises
+        ------
+        :class:`LicenseError`
+            If the job failed to find a license more than
+            :attr:`max_retries` times.
+
+        :class:`DeadlineError`
+            If the job was stopped because the :func:`deadline` it
+            runs under passed.
+
+        """
+
+        job = EngineJob(engine, cmd)
+        start = time.time()
+        try:
+            while True:
+                queued = time.time()
+                async with self._limits(engine):
+                    started = time.time()
+                    job.wait_time += started - queued
+                    await self._communicate(job, timeout, cwd, on_timeout)
+                    job.run_time += time.time() - started
+
+                if license_found is None or license_found(job.output):
+                    break
+
+                if (self.max_retries is not None and
+                   job.retries >= self.max_retries):
+                    raise LicenseError(
+                        f'No license found for "{engine}" after '
+                        f'{job.retries+1} attempts.')
+
+                delay = min(self.backoff * 2**job.retries,
+                            self.max_backoff)
+                job.retries += 1
+                logger.warning(f'No license found for "{engine}". '
+                               f'Retrying in {delay} s.')
+                await asyncio.sleep(delay)
+                job.backoff_time += delay
+
+        finally:
+            job.wall_time = time.time() - start
+            INSTRUMENTATION.record(f'engine.{engine}', job.wall_time)
+            TELEMETRY.add_job(job)
+
+        return job
+
+    async def wait_for_file(self, path, timeout=10, interval=0.05):
+        """
+        Waits until a file exists or `timeout` expires.
+
+        The event loop is free to run other jobs while waiting.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path of the file which is waited for.
+
+        timeout : :class:`float`, optional
+            The number of seconds after which waiting stops.
+
+        interval : :class:`float`, optional
+            The initial number of seconds between checks. The interval
+            is doubled after each check, up to a maximum of ``1``
+            second.
+
+        Returns
+        -------
+        :class:`bool`
+            ``True`` if the file exists.
+
+        """
+
+        start = time.time()
+        while not os.path.exists(path):
+            remaining = timeout - (time.time() - start)
+            if remaining <= 0:
+                return False
+            logger.debug(f'Waiting for "{path}".')
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(2*interval, 1)
+        return True
+
+    async def _communicate(self, job, timeout, cwd, on_timeout):
+        """
+        Runs the command of `job` once and updates `job`.
+
+        Parameters
+        ----------
+        job : :class:`EngineJob`
+            The job to run.
+
+        timeout : :class:`float`
+            The number of seconds the job is allowed to run for.
+
+        cwd : :class:`str`
+            The directory in which the job is run.
+
+        on_timeout : :class:`callable`
+            Called when the job times out.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        # If the deadline comes before the timeout, the job is
+        # killed straight away when it passes.
+        end = _DEADLINE.get()
+        at_deadline = False
+        if end is not None:
+            remaining = end - time.time()
+            if remaining <= 0:
+                raise DeadlineError(f'"{job.engine}" was not started '
+                                    'because the deadline passed.')
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+                at_deadline = True
+
+        proc = await asyncio.create_subprocess_exec(
+                                        *job.cmd,
+                                        stdout=asyncio.subprocess.PIPE,
+                                        stderr=asyncio.subprocess.STDOUT,
+                                        cwd=cwd)
+        try:
+            try:
+                out, _ = await asyncio.wait_for(proc.communicate(),
+                                                timeout)
+                job.output = out.decode(errors='replace')
+
+            except asyncio.TimeoutError:
+                logger.warning(f'"{job.engine}" took too long and was '
+                               'terminated by force.')
+                job.timed_out = True
+                job.output = ''
+                await self._stop(job,
+                                 proc,
+                                 None if at_deadline else on_timeout)
+
+        except BaseException:
+            # The task running the job was cancelled or interrupted,
+            # for example by a signal. Do not leave the program
+            # running without a parent.
+            if proc.returncode is None:
+                proc.kill()
+                job.killed = True
+                await proc.wait()
+            raise
+
+        job.returncode = proc.returncode
+        if job.timed_out and at_deadline:
+            raise DeadlineError(f'"{job.engine}" was stopped because '
+                                'the deadline passed.')
+
+    async def _stop(self, job, proc, on_timeout):
+        """
+        Stops a job which timed out.
+
+        Parameters
+        ----------
+        job : :class:`EngineJob`
+            The job being stopped.
+
+        proc : :class:`asyncio.subprocess.Process`
+            The process running the job.
+
+        on_timeout : :class:`callable`
+            Called to ask the program to stop. If ``None``, the
+            process is killed straight away.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if on_timeout is not None:
+            result = on_timeout()
+            if inspect.isawaitable(result):
+                await result
+            try:
+                await asyncio.wait_for(proc.wait(), self.kill_timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+        if proc.returncode is None:
+            proc.kill()
+            job.killed = True
+        await proc.wait()
+
+    @asynccontextmanager
+    async def _limits(self, engine):
+        """
+        Holds the job and license slots of `engine`.
+
+        Parameters
+        ----------
+        engine : :class:`str`
+            The name of the engine.
+
+        Yields
+        ------
+        None : :class:`NoneType`
+
+        """
+
+        max_jobs, license = self.engines.get(engine, (None, None))
+        semaphores = [
+            self._semaphore(('engine', engine), max_jobs),
+            self._semaphore(('license', license),
+                            self.licenses.get(license))
+        ]
+        semaphores = [s for s in semaphores if s is not None]
+
+        for semaphore in semaphores:
+            await semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+    def _semaphore(self, key, value):
+        """
+        Returns the semaphore of `key` in the running event loop.
+
+        Parameters
+        ----------
+        key : :class:`tuple`
+            Identifies the semaphore.
+
+        value : :class:`int`
+            The value of the semaphore. If ``None``, no semaphore is
+            used.
+
+        Returns
+        -------
+        :class:`asyncio.Semaphore`
+            The semaphore. ``None`` if `value` is ``None``.
+
+        """
+
+        if value is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        semaphores = self._semaphores.setdefault(loop, {})
+        if key not in semaphores:
+            semaphores[key] = asyncio.Semaphore(value)
+        return semaphores[key]
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        state['_semaphores'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._semaphores = weakref.WeakKeyDictionary()
+
+
+def run_coroutine(coro):
+    """
+    Runs a coroutine to completion and returns its result.
+
+    If an event loop is already running in the current thread, the
+    coroutine is run in a new thread, which has its own event loop.
+
+    Parameters
+    ----------
+    coro : :class:`coroutine`
+        The coroutine to run.
+
+    Returns
+    -------
+    :class:`object`
+        The result of the coroutine.
+
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # Run the coroutine with a copy of the context of this thread, so
+    # that context variables, such as the telemetry record of the
+    # current molecule, are seen by it.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(context.run, asyncio.run, coro).result()
+
+
+# The executor used to run external programs, unless a different one
+# is provided.
+EXECUTOR = Executor()
@@ -0,0 +1,300 @@
+"""
+Defines tools for finding out where time is spent.
+
+Instrumentation is off by default. While it is off, instrumented code
+only checks a single attribute, so leaving it in hot paths costs
+almost nothing. It is turned on and read with
+
+.. code-block:: python
+
+    INSTRUMENTATION.enable()
+    pop = Population.init_all(...)
+    pop.optimize(...)
+    print(INSTRUMENTATION.report())
+
+Each instrumented section of code has a name. For each name, the
+number of times the section was run and the total number of seconds
+spent in it are recorded. The following names are used by ``stk``
+
+    ``'build'`` - :meth:`.Topology.build`.
+    ``'build.place_mols'``, ``'build.prepare'``, ``'build.react'``,
+    ``'build.cleanup'`` - The stages of :meth:`.Topology.build`.
+    ``'StructUnit.__init__'`` - Creation of :class:`.StructUnit`
+    instances.
+    ``'StructUnit.tag_atoms'`` - :meth:`.StructUnit.tag_atoms`.
+    ``'cache.<class>.hit'``, ``'cache.<class>.miss'`` - Lookups of
+    molecules in the cache of ``<class>``. Only counts are recorded.
+    ``'Energy.<method>'`` - Calls of :class:`.Energy` methods.
+    ``'engine.<engine>'`` - External programs run by an
+    :class:`.Executor`.
+
+Work done by the processes of a :class:`.WorkerPool` is recorded in
+those processes and added to :data:`INSTRUMENTATION` of the main
+process as each task finishes.
+
+"""
+
+import json
+import time
+import threading
+from contextlib import nullcontext
+from functools import wraps
+
+
+class Instrumentation:
+    """
+    Records how often and for how long sections of code run.
+
+    Attributes
+    ----------
+    enabled : :class:`bool`
+        If ``False``, nothing is recorded.
+
+    stats : :class:`dict`
+        Maps the name of each section to a :class:`list` of the form
+        ``[count, seconds]``.
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """
+        Starts recording.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.enabled = False
+
+    def reset(self):
+        """
+        Removes everything recorded so far.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with self._lock:
+            self.stats = {}
+
+    def record(self, name, seconds=0.0, count=1):
+        """
+        Records a run of a section.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the section.
+
+        seconds : :class:`float`, optional
+            The time the section took.
+
+        count : :class:`int`, optional
+            The number of runs being recorded.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stat = self.stats.setdefault(name, [0, 0.0])
+            stat[0] += count
+            stat[1] += seconds
+
+    def timer(self, name):
+        """
+        Times the code run within the context.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the section.
+
+        Returns
+        -------
+        :class:`contextmanager`
+            A context manager which records the time spent inside it.
+
+        """
+
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """
+        A decorator which times every call of a function.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the section.
+
+        Returns
+        -------
+        :class:`function`
+            The decorator.
+
+        """
+
+        def decorator(func):
+
+            @wraps(func)
+            def inner(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+
+            return inner
+
+        return decorator
+
+    def collect(self):
+        """
+        Removes and returns everything recorded so far.
+
+        Returns
+        -------
+        :class:`dict`
+            The removed :attr:`stats`. ``None`` if nothing was
+            recorded.
+
+        """
+
+        if not self.stats:
+            return None
+
+        with self._lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def merge(self, stats):
+        """
+        Adds the stats recorded elsewhere, such as in another process.
+
+        Parameters
+        ----------
+        stats : :class:`dict`
+            Stats of the same form as :attr:`stats`. If ``None``,
+            nothing is added.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if not stats:
+            return
+
+        with self._lock:
+            for name, (count, seconds) in stats.items():
+                stat = self.stats.setdefault(name, [0, 0.0])
+                stat[0] += count
+                stat[1] += seconds
+
+    def report(self):
+        """
+        Returns a summary of everything recorded so far.
+
+        Returns
+        -------
+        :class:`dict`
+            Maps the name of each section to a :class:`dict` holding
+            its ``'count'``, its total time in ``'seconds'`` and its
+            ``'mean'`` time. Sections which took the longest come
+            first.
+
+        """
+
+        with self._lock:
+            stats = sorted(self.stats.items(),
+                           key=lambda item: item[1][1],
+                           reverse=True)
+
+        return {
+            name: {'count': count,
+                   'seconds': seconds,
+                   'mean': seconds/count if count else 0.0}
+            for name, (count, seconds) in stats
+        }
+
+    def dump(self, path):
+        """
+        Writes :meth:`report` to a JSON file.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path to the file.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+    def __repr__(self):
+        return (f'Instrumentation(enabled={self.enabled}, '
+                f'sections={len(self.stats)})')
+
+
+class _Timer:
+    """
+    Records the time spent inside a ``with`` block.
+
+    """
+
+    __slots__ = ['instrumentation', 'name', 'start']
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(self.name,
+                                    time.perf_counter() - self.start)
+
+
+_NULL_TIMER = nullcontext()
+
+# The instrumentation used throughout ``stk``.
+INSTRUMENTATION = Instrumentation()
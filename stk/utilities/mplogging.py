@@ -3,10 +3,20 @@ Defines tools to make ``logging`` comptaible with ``multiprocessing``.
 
 Based largely on: https://gist.github.com/schlamar/7003737
 
+Worker processes do not write log records themselves. Instead, records
+are collected into batches and sent to the main process through a
+:class:`LogQueue`, where :func:`daemon_logger` passes them to the
+usual handlers. Workers are given the effective levels of the loggers
+in the main process, so that records which would be discarded there
+are never created.
+
 """
 
 import logging
+import multiprocessing as mp
 import os
+import threading
+import time
 
 # Define the formatter for logging messages.
 try:
@@ -20,29 +30,233 @@ formatter = logging.Formatter(fmt=f+('%(asctime)s - %(levelname)s - '
                               datefmt='%H:%M:%S')
 
 
-# Define logging handlers.
-errorhandler = logging.FileHandler('output/scratch/errors.log',
-                                   delay=True)
-errorhandler.setLevel(logging.ERROR)
-
 streamhandler = logging.StreamHandler()
-
-errorhandler.setFormatter(formatter)
 streamhandler.setFormatter(formatter)
 
 
+def error_handler(path=os.path.join('output', 'scratch', 'errors.log')):
+    """
+    Creates a handler which writes errors to a file.
+
+    Neither the file nor its directory are created until the first
+    error is logged.
+
+    Parameters
+    ----------
+    path : :class:`str`, optional
+        The path to the file.
+
+    Returns
+    -------
+    :class:`logging.FileHandler`
+        The handler.
+
+    """
+
+    handler = _ErrorFileHandler(path, delay=True)
+    handler.setLevel(logging.ERROR)
+    handler.setFormatter(formatter)
+    return handler
+
+
+class _ErrorFileHandler(logging.FileHandler):
+    """
+    A :class:`logging.FileHandler` which creates its directory.
+
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def __getattr__(name):
+    # ``errorhandler`` used to be made when this module was imported.
+    # It is now made when it is first used.
+    if name == 'errorhandler':
+        global errorhandler
+        errorhandler = error_handler()
+        return errorhandler
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class LogQueue:
+    """
+    Sends batches of log records from worker processes.
+
+    Records are held by the worker until :attr:`batch_size` records
+    have been collected or :attr:`interval` seconds have passed since
+    the last batch was sent. They are then sent together, through a
+    :class:`multiprocessing.Queue`. A :class:`LogQueue` must be given
+    to a worker when it is started, for example through the
+    `initializer` of a :class:`multiprocessing.Pool`, and set with
+    :func:`set_log_queue`. This starts a thread in the worker which
+    sends the held records every :attr:`interval` seconds, so that
+    records are sent even while the worker waits on a long
+    calculation, such as a MacroModel or MOPAC run.
+
+    Attributes
+    ----------
+    batch_size : :class:`int`
+        The number of records sent together.
+
+    interval : :class:`float`
+        The maximum number of seconds a record is held by a worker
+        before it is sent. Records held when :func:`logged_call`
+        returns are always sent.
+
+    """
+
+    def __init__(self, context=None, batch_size=100, interval=0.5):
+        """
+        Initializes a :class:`LogQueue`.
+
+        Parameters
+        ----------
+        context : :class:`multiprocessing.context.BaseContext`, optional
+            The :mod:`multiprocessing` context of the workers. If
+            ``None``, the default context is used.
+
+        batch_size : :class:`int`, optional
+            The number of records sent together.
+
+        interval : :class:`float`, optional
+            The maximum number of seconds a record is held by a
+            worker before it is sent.
+
+        """
+
+        if context is None:
+            context = mp
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = context.Queue()
+        self._batch = []
+        self._last_flush = time.monotonic()
+        # Records are sent by both the logging thread and the flush
+        # thread, see :meth:`_start_flush_thread`.
+        self._lock = threading.Lock()
+        self._flush_thread = None
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        state['_lock'] = None
+        state['_flush_thread'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._lock = threading.Lock()
+
+    def put(self, record_data):
+        """
+        Adds a record to the batch, sending the batch if it is due.
+
+        Parameters
+        ----------
+        record_data : :class:`dict`
+            The attributes of a :class:`logging.LogRecord`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with self._lock:
+            self._batch.append(record_data)
+            if (len(self._batch) >= self.batch_size or
+                    time.monotonic() - self._last_flush > self.interval):
+                self._flush()
+
+    def flush(self):
+        """
+        Sends the records collected so far.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        self._last_flush = time.monotonic()
+
+    def _start_flush_thread(self):
+        """
+        Starts a thread which sends held records every :attr:`interval`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if self._flush_thread is not None:
+            return
+
+        def flush_periodically():
+            while True:
+                time.sleep(self.interval)
+                self.flush()
+
+        self._flush_thread = threading.Thread(target=flush_periodically,
+                                              daemon=True)
+        self._flush_thread.start()
+
+    def get(self):
+        """
+        Waits for the next batch of records.
+
+        Returns
+        -------
+        :class:`list` of :class:`dict`
+            The next batch of records. ``None`` if :meth:`close` was
+            called.
+
+        """
+
+        return self._queue.get()
+
+    def close(self):
+        """
+        Makes :func:`daemon_logger` stop, once earlier batches are done.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self._queue.put(None)
+
+
 class MPLogger(logging.Logger):
     """
+    A logger which sends records through :attr:`log_queue`.
 
     """
 
     log_queue = None
 
-    def isEnabledFor(self, level):
-        return True
-
     def handle(self, record):
         """
+        Adds `record` to :attr:`log_queue`.
+
+        Parameters
+        ----------
+        record : :class:`logging.LogRecord`
+            The record to send.
+
+        Returns
+        -------
+        None : :class:`NoneType`
 
         """
 
@@ -57,19 +271,87 @@ class MPLogger(logging.Logger):
         self.log_queue.put(d)
 
 
-def logged_call(log_queue, func, *args, **kwargs):
+def logging_levels():
     """
+    Returns the effective levels of all loggers.
+
+    Returns
+    -------
+    :class:`dict`
+        Maps the name of each logger to its effective level. The
+        root logger has the name ``''``.
+
+    """
+
+    levels = {'': logging.root.getEffectiveLevel()}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if not isinstance(logger, logging.PlaceHolder):
+            levels[name] = logger.getEffectiveLevel()
+    return levels
+
+
+def set_log_queue(log_queue):
+    """
+    Sets the :class:`LogQueue` used by a worker process.
+
+    A thread is started in the worker which sends held records every
+    :attr:`LogQueue.interval` seconds.
+
+    Parameters
+    ----------
+    log_queue : :class:`LogQueue`
+        The queue through which records are sent to the main process.
+
+    Returns
+    -------
+    None : :class:`NoneType`
 
     """
 
     MPLogger.log_queue = log_queue
+    log_queue._start_flush_thread()
+
+
+def logged_call(levels, func, *args, **kwargs):
+    """
+    Calls `func` in a worker process, sending its log records.
+
+    :func:`set_log_queue` must have been called in the worker first.
+
+    Parameters
+    ----------
+    levels : :class:`dict`
+        The effective levels of the loggers in the main process, made
+        by :func:`logging_levels`.
+
+    func : :class:`callable`
+        The function to call.
+
+    *args : :class:`object`
+        The arguments of `func`.
+
+    **kwargs : :class:`object`
+        The keyword arguments of `func`.
+
+    Returns
+    -------
+    :class:`object`
+        The return value of `func`.
+
+    """
+
     logging.setLoggerClass(MPLogger)
     # Monkey patch root logger and already defined loggers.
     logging.root.__class__ = MPLogger
-    for logger in logging.Logger.manager.loggerDict.values():
+    logging.root.setLevel(levels[''])
+    for name, logger in logging.Logger.manager.loggerDict.items():
         if not isinstance(logger, logging.PlaceHolder):
             logger.__class__ = MPLogger
-    return func(*args, **kwargs)
+            logger.setLevel(levels.get(name, logging.NOTSET))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        MPLogger.log_queue.flush()
 
 
 def daemon_logger(log_queue):
@@ -78,8 +360,9 @@ def daemon_logger(log_queue):
 
     Parameters
     ----------
-    log_queue : :class:`multiprocessing.Queue`
-        A queue into which log records are sent by subprocesses.
+    log_queue : :class:`LogQueue`
+        A queue into which batches of log records are sent by
+        subprocesses.
 
     Returns
     -------
@@ -89,14 +372,14 @@ def daemon_logger(log_queue):
 
     while True:
         try:
-            record_data = log_queue.get()
-            if record_data is None:
+            batch = log_queue.get()
+            if batch is None:
                 break
-            record = logging.makeLogRecord(record_data)
-
-            logger = logging.getLogger(record.name)
-            if logger.isEnabledFor(record.levelno):
-                logger.handle(record)
+            for record_data in batch:
+                record = logging.makeLogRecord(record_data)
+                logger = logging.getLogger(record.name)
+                if logger.isEnabledFor(record.levelno):
+                    logger.handle(record)
         except (KeyboardInterrupt, SystemExit):
             raise
         except EOFError:
@@ -0,0 +1,319 @@
+"""
+Defines a pool of worker processes which can be reused.
+
+Starting worker processes is expensive. With the ``spawn`` start
+method, each worker has to import ``rdkit``, ``numpy`` and the rest
+of ``stk`` again. A :class:`WorkerPool` starts its
+workers once, imports the modules they need straight away and keeps
+them running until it is closed. The same pool can then be given to
+every call which runs in parallel, for example
+
+.. code-block:: python
+
+    with WorkerPool(4) as pool:
+        for generation in range(50):
+            ...
+            pop.optimize(func_data, pool=pool)
+
+"""
+
+import logging
+import importlib
+import multiprocessing as mp
+from threading import Thread
+from functools import partial
+
+from .mplogging import LogQueue, daemon_logger, set_log_queue
+from .instrumentation import INSTRUMENTATION
+from .telemetry import TELEMETRY
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    A long-lived pool of worker processes.
+
+    The workers are started the first time the pool is used and run
+    until :meth:`close` is called.
+
+    Attributes
+    ----------
+    processes : :class:`int`
+        The number of worker processes. If ``None``, the number of
+        CPUs is used.
+
+    context : :class:`str`
+        The :mod:`multiprocessing` start method of the workers.
+
+    modules : :class:`tuple` of :class:`str`
+        The names of modules imported by each worker when it starts.
+
+    preload : :class:`list`
+        Objects sent to each worker once, when it starts. Objects
+        which have a ``key`` attribute and whose class has a ``cache``
+        attribute, such as :class:`.StructUnit` instances, are added to
+        the cache of their class in the worker.
+
+    log_queue : :class:`.LogQueue`
+        The queue through which workers send log records to this
+        process. ``None`` until the pool is started.
+
+    """
+
+    def __init__(self,
+                 processes=None,
+                 context='spawn',
+                 modules=('stk', ),
+                 preload=()):
+        """
+        Initializes a :class:`WorkerPool`.
+
+        Parameters
+        ----------
+        processes : :class:`int`, optional
+            The number of worker processes. If ``None``, the number of
+            CPUs is used.
+
+        context : :class:`str`, optional
+            The :mod:`multiprocessing` start method of the workers.
+
+        modules : :class:`tuple` of :class:`str`, optional
+            The names of modules imported by each worker when it
+            starts.
+
+        preload : :class:`list`, optional
+            Objects sent to each worker once, when it starts. See
+            :attr:`preload`.
+
+        """
+
+        self.processes = processes
+        self.context = context
+        self.modules = tuple(modules)
+        self.preload = list(preload)
+        self.log_queue = None
+        self._pool = None
+        self._log_thread = None
+
+    @property
+    def started(self):
+        """
+        ``True`` if the workers are running.
+
+        """
+
+        return self._pool is not None
+
+    def start(self):
+        """
+        Starts the workers, if they are not running.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if self.started:
+            return
+
+        ctx = mp.get_context(self.context)
+        self.log_queue = LogQueue(ctx)
+        self._log_thread = Thread(target=daemon_logger,
+                                  args=(self.log_queue, ),
+                                  daemon=True)
+        self._log_thread.start()
+        self._pool = ctx.Pool(self.processes,
+                              initializer=_init_worker,
+                              initargs=(self.modules,
+                                        self.preload,
+                                        self.log_queue))
+        logger.debug(f'Started {self!r}.')
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """
+        Applies `func` to each item of `iterable` in the workers.
+
+        Parameters
+        ----------
+        func : :class:`callable`
+            The function to apply. It must be picklable.
+
+        iterable : :class:`iterable`
+            The items passed to `func`.
+
+        chunksize : :class:`int`, optional
+            The number of items sent to a worker at a time.
+
+        Returns
+        -------
+        :class:`iterator`
+            Yields the results in the order they finish.
+
+        """
+
+        self.start()
+        func = partial(_instrumented_call, func, INSTRUMENTATION.enabled)
+        results = self._pool.imap_unordered(func, iterable, chunksize)
+        return _merge_stats(results)
+
+    def starmap(self, func, iterable, chunksize=None):
+        """
+        Applies `func` to each group of arguments in `iterable`.
+
+        Parameters
+        ----------
+        func : :class:`callable`
+            The function to apply. It must be picklable.
+
+        iterable : :class:`iterable`
+            Holds a :class:`tuple` of arguments for each call of
+            `func`.
+
+        chunksize : :class:`int`, optional
+            The number of items sent to a worker at a time.
+
+        Returns
+        -------
+        :class:`list`
+            The results, in the order of `iterable`.
+
+        """
+
+        self.start()
+        func = partial(_instrumented_call,
+                       partial(_star_call, func),
+                       INSTRUMENTATION.enabled)
+        results = self._pool.map(func, iterable, chunksize)
+        return list(_merge_stats(results))
+
+    def close(self):
+        """
+        Waits for all tasks to finish and shuts down the workers.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if not self.started:
+            return
+
+        self._pool.close()
+        self._pool.join()
+        self.log_queue.close()
+        self._log_thread.join()
+        self._pool = self._log_thread = None
+        self.log_queue = None
+        logger.debug(f'Closed {self!r}.')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return (f'WorkerPool(processes={self.processes}, '
+                f'context={self.context!r}, '
+                f'started={self.started})')
+
+
+def _init_worker(modules, preload, log_queue):
+    """
+    Prepares a worker process of a :class:`WorkerPool`.
+
+    Parameters
+    ----------
+    modules : :class:`tuple` of :class:`str`
+        The names of modules to import.
+
+    preload : :class:`list`
+        Objects to add to the caches of their classes.
+
+    log_queue : :class:`.LogQueue`
+        The queue through which log records are sent.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
+    set_log_queue(log_queue)
+    for module in modules:
+        importlib.import_module(module)
+
+    for obj in preload:
+        cache = getattr(obj.__class__, 'cache', None)
+        if cache is not None and hasattr(obj, 'key'):
+            cache.setdefault(obj.key, obj)
+
+
+def _instrumented_call(func, instrument, arg):
+    """
+    Calls `func` in a worker, returning what it recorded as well.
+
+    Parameters
+    ----------
+    func : :class:`callable`
+        The function to call.
+
+    instrument : :class:`bool`
+        If ``True``, :data:`.INSTRUMENTATION` is enabled in the
+        worker. If ``False``, it is disabled.
+
+    arg : :class:`object`
+        The argument of `func`.
+
+    Returns
+    -------
+    :class:`tuple`
+        The return value of `func`, the stats recorded while it ran,
+        given by :meth:`.Instrumentation.collect`, and the telemetry
+        records made while it ran, given by
+        :meth:`.Telemetry.collect`.
+
+    """
+
+    INSTRUMENTATION.enabled = instrument
+    result = func(arg)
+    return result, INSTRUMENTATION.collect(), TELEMETRY.collect()
+
+
+def _star_call(func, args):
+    """
+    Calls `func` with the arguments in `args`.
+
+    """
+
+    return func(*args)
+
+
+def _merge_stats(results):
+    """
+    Adds what workers recorded to the main process.
+
+    Stats are added to :data:`.INSTRUMENTATION` and telemetry records
+    to :data:`.TELEMETRY`.
+
+    Parameters
+    ----------
+    results : :class:`iterable` of :class:`tuple`
+        The results of :func:`_instrumented_call`.
+
+    Yields
+    ------
+    :class:`object`
+        The return value of each call.
+
+    """
+
+    for result, stats, records in results:
+        INSTRUMENTATION.merge(stats)
+        TELEMETRY.merge(records)
+        yield result
@@ -0,0 +1,401 @@
+"""
+Defines tools for recording what happens to each molecule in a run.
+
+Every optimization of a molecule, and every :class:`.Energy`
+calculation which runs an external program, makes a
+:class:`TelemetryRecord`. The record holds the key of the molecule,
+each external program run on its behalf, with the time spent waiting
+for a license and running, retries, timeouts and kills, notable
+events, such as a fallback to a different force field, and the
+outcome.
+
+Records are collected by :data:`TELEMETRY`. Records made in the
+processes of a :class:`.WorkerPool` are sent back to the main process
+with the results of each task. :meth:`.Population.optimize` writes
+the records of its molecules to a JSON lines file, if asked to, and
+logs a summary made by :func:`summarize_telemetry` when it
+finishes.
+
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .utilities import canonical_key
+
+
+# The record of the optimization or energy calculation currently
+# being run. Each thread and each asyncio task has its own value.
+_CURRENT = ContextVar('telemetry_record', default=None)
+
+
+class TelemetryRecord:
+    """
+    Records what happened during the optimization of a molecule.
+
+    Attributes
+    ----------
+    key : :class:`str`
+        The canonical key of the molecule, given by
+        :func:`.canonical_key`.
+
+    name : :class:`str`
+        The name of the molecule.
+
+    kind : :class:`str`
+        Either ``'optimization'`` or ``'energy'``.
+
+    func : :class:`str`
+        The name of the optimization function or :class:`.Energy`
+        method.
+
+    jobs : :class:`list` of :class:`dict`
+        A :class:`dict` for each external program run. See
+        :meth:`TelemetryRecord.add_job`.
+
+    events : :class:`list` of :class:`str`
+        Notable events, in the order they happened.
+
+    outcome : :class:`str`
+        One of ``'success'``, ``'failed'`` or ``'deadline'``.
+
+    error : :class:`str`
+        The error raised, if any.
+
+    wall_time : :class:`float`
+        The total number of seconds taken.
+
+    """
+
+    def __init__(self, mol, kind, func):
+        key = getattr(mol, 'key', None)
+        self.key = None if key is None else canonical_key(key)
+        self.name = getattr(mol, 'name', '')
+        self.kind = kind
+        self.func = func
+        self.jobs = []
+        self.events = []
+        self.outcome = 'success'
+        self.error = None
+        self.wall_time = 0.0
+
+    def add_job(self, job):
+        """
+        Records an external program run.
+
+        Parameters
+        ----------
+        job : :class:`.EngineJob`
+            The finished job.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        self.jobs.append({
+            'engine': job.engine,
+            'wall_time': job.wall_time,
+            'wait_time': job.wait_time,
+            'run_time': job.run_time,
+            'backoff_time': job.backoff_time,
+            'retries': job.retries,
+            'timed_out': job.timed_out,
+            'killed': job.killed,
+            'returncode': job.returncode
+        })
+
+    def json(self):
+        """
+        Returns a JSON representation of the record.
+
+        Returns
+        -------
+        :class:`dict`
+            A :class:`dict` which represents the record.
+
+        """
+
+        return dict(vars(self))
+
+    def __repr__(self):
+        return (f'TelemetryRecord({self.name!r}, '
+                f'func={self.func!r}, '
+                f'outcome={self.outcome!r}, '
+                f'jobs={len(self.jobs)})')
+
+
+class Telemetry:
+    """
+    Collects :class:`TelemetryRecord` instances.
+
+    Attributes
+    ----------
+    records : :class:`collections.deque`
+        The JSON representations of the records which have not been
+        collected yet. Only the most recent :attr:`max_records` are
+        kept.
+
+    max_records : :class:`int`
+        The maximum number of records held.
+
+    """
+
+    def __init__(self, max_records=100000):
+        self.max_records = max_records
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, mol, kind, func):
+        """
+        Records what happens within the context.
+
+        Any external program run within the context, including in
+        threads started with a copy of its :mod:`contextvars`
+        context, is added to the record.
+
+        Parameters
+        ----------
+        mol : :class:`.Molecule`
+            The molecule being worked on.
+
+        kind : :class:`str`
+            Either ``'optimization'`` or ``'energy'``. Records of
+            energy calculations which ran no external programs and
+            raised no errors are not kept.
+
+        func : :class:`str`
+            The name of the optimization function or :class:`.Energy`
+            method.
+
+        Yields
+        ------
+        :class:`TelemetryRecord`
+            The record.
+
+        """
+
+        record = TelemetryRecord(mol, kind, func)
+        token = _CURRENT.set(record)
+        start = time.time()
+        try:
+            yield record
+        except BaseException as ex:
+            # The outcome may have been set to something more specific
+            # already.
+            if record.outcome == 'success':
+                record.outcome = 'failed'
+            record.error = f'{type(ex).__name__}: {ex}'
+            raise
+        finally:
+            record.wall_time = time.time() - start
+            _CURRENT.reset(token)
+            if (kind != 'energy' or record.jobs or
+                    record.outcome != 'success'):
+                self.add(record.json())
+
+    def add(self, record):
+        """
+        Adds a record.
+
+        Parameters
+        ----------
+        record : :class:`dict`
+            The JSON representation of a :class:`TelemetryRecord`.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        with self._lock:
+            self.records.append(record)
+
+    def merge(self, records):
+        """
+        Adds records made elsewhere, such as in another process.
+
+        Parameters
+        ----------
+        records : :class:`list` of :class:`dict`
+            The records. If ``None``, nothing is added.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        if not records:
+            return
+        with self._lock:
+            self.records.extend(records)
+
+    def collect(self):
+        """
+        Removes and returns the records held.
+
+        Returns
+        -------
+        :class:`list` of :class:`dict`
+            The records. ``None`` if there are none.
+
+        """
+
+        if not self.records:
+            return None
+        with self._lock:
+            records = list(self.records)
+            self.records.clear()
+        return records
+
+    def add_job(self, job):
+        """
+        Adds `job` to the record of the current molecule, if any.
+
+        Parameters
+        ----------
+        job : :class:`.EngineJob`
+            The finished job.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        record = _CURRENT.get()
+        if record is not None:
+            record.add_job(job)
+
+    def add_event(self, event):
+        """
+        Adds `event` to the record of the current molecule, if any.
+
+        Parameters
+        ----------
+        event : :class:`str`
+            A description of the event.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        record = _CURRENT.get()
+        if record is not None:
+            record.events.append(event)
+
+
+def summarize_telemetry(records):
+    """
+    Summarizes telemetry records.
+
+    Parameters
+    ----------
+    records : :class:`list` of :class:`dict`
+        JSON representations of :class:`TelemetryRecord` instances.
+
+    Returns
+    -------
+    :class:`dict`
+        A :class:`dict` of the form
+
+        .. code-block:: python
+
+            {
+                'records': 10,
+                'wall_time': 120.5,
+                'outcomes': {'success': 9, 'failed': 1},
+                'events': {'OPLS_2005 fallback': 1},
+                'engines': {
+                    'bmin': {
+                        'jobs': 10,
+                        'wall_time': 100.2,
+                        'wait_time': 5.1,
+                        'run_time': 90.0,
+                        'backoff_time': 5.1,
+                        'retries': 2,
+                        'timeouts': 1,
+                        'kills': 0,
+                        'failures': 1
+                    }
+                }
+            }
+
+        where ``'failures'`` counts jobs with a non-zero return code.
+
+    """
+
+    summary = {
+        'records': len(records),
+        'wall_time': 0.0,
+        'outcomes': {},
+        'events': {},
+        'engines': {}
+    }
+    for record in records:
+        summary['wall_time'] += record['wall_time']
+        outcomes = summary['outcomes']
+        outcomes[record['outcome']] = outcomes.get(record['outcome'],
+                                                   0) + 1
+        for event in record['events']:
+            summary['events'][event] = summary['events'].get(event,
+                                                             0) + 1
+
+        for job in record['jobs']:
+            engine = summary['engines'].setdefault(job['engine'], {
+                'jobs': 0,
+                'wall_time': 0.0,
+                'wait_time': 0.0,
+                'run_time': 0.0,
+                'backoff_time': 0.0,
+                'retries': 0,
+                'timeouts': 0,
+                'kills': 0,
+                'failures': 0
+            })
+            engine['jobs'] += 1
+            for name in ('wall_time', 'wait_time', 'run_time',
+                         'backoff_time', 'retries'):
+                engine[name] += job[name]
+            engine['timeouts'] += job['timed_out']
+            engine['kills'] += job['killed']
+            engine['failures'] += job['returncode'] not in (0, None)
+
+    return summary
+
+
+def dump_telemetry(records, path):
+    """
+    Appends records to a JSON lines file.
+
+    Parameters
+    ----------
+    records : :class:`list` of :class:`dict`
+        JSON representations of :class:`TelemetryRecord` instances.
+
+    path : :class:`str`
+        The path to the file.
+
+    Returns
+    -------
+    None : :class:`NoneType`
+
+    """
+
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+# The telemetry used throughout ``stk``.
+TELEMETRY = Telemetry()
@@ -15,6 +15,8 @@ import os
 import subprocess as sp
 import gzip
 import re
+import heapq
+import json
 from collections import deque
 import tarfile
 
@@ -572,6 +574,36 @@ def centroid(*coords):
     return np.divide(total, len(coords))
 
 
+def canonical_key(key):
+    """
+    Turns the key of a molecule into a string.
+
+    Keys hold :class:`frozenset` instances, whose order changes
+    between Python sessions. Their elements are sorted, so that the
+    same molecule has the same string in every session.
+
+    Parameters
+    ----------
+    key : :class:`object`
+        The key of a molecule, for example :attr:`.MacroMolecule.key`.
+
+    Returns
+    -------
+    :class:`str`
+        The canonical string of `key`.
+
+    """
+
+    def canonical(item):
+        if isinstance(item, (set, frozenset)):
+            return sorted((canonical(x) for x in item), key=json.dumps)
+        if isinstance(item, (tuple, list)):
+            return [canonical(x) for x in item]
+        return item
+
+    return json.dumps(canonical(key))
+
+
 def dedupe(iterable, seen=None, key=None):
     """
     Yields items from `iterable` barring duplicates.
@@ -726,6 +758,153 @@ def kill_macromodel():
                stdout=sp.PIPE, stderr=sp.PIPE)
 
 
+def lowest_energy_conformers(path, n=1):
+    """
+    Returns the lowest energy conformers in a ``.mae`` file.
+
+    The file is streamed and only the `n` lowest energy conformers
+    found so far are held in memory.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to a ``.mae`` or ``.maegz`` file, such as the
+        ``-out.maegz`` file produced by a MacroModel conformer search.
+
+    n : :class:`int`, optional
+        The number of lowest energy conformers to return.
+
+    Returns
+    -------
+    :class:`list` of :class:`tuple`
+        Holds a :class:`tuple` of the form ``(energy, coords)`` for
+        each of the `n` lowest energy conformers, sorted from lowest
+        to highest energy. ``coords`` is a :class:`numpy.ndarray` of
+        shape ``[n_atoms, 3]``. Structures without an energy are
+        ignored.
+
+    """
+
+    # The index of each conformer breaks ties between energies, so
+    # that the coordinate arrays are never compared.
+    conformers = ((energy, i, coords) for
+                  i, (energy, coords) in enumerate(mae_conformers(path))
+                  if energy is not None)
+    return [(energy, coords) for energy, _, coords in
+            heapq.nsmallest(n, conformers, key=lambda x: x[:2])]
+
+
+def mae_conformers(path):
+    """
+    Yields the energy and coordinates of structures in a ``.mae`` file.
+
+    The file is read line by line, so that only a single structure is
+    held in memory at any time. Files ending in ``gz`` are decompressed
+    on the fly.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to a ``.mae`` or ``.maegz`` file.
+
+    Yields
+    ------
+    :class:`tuple`
+        A :class:`tuple` of the form ``(energy, coords)`` for each
+        structure (``f_m_ct`` block) in the file. ``energy`` is the
+        MacroModel potential energy of the structure or ``None`` if
+        the structure does not have one. ``coords`` is a
+        :class:`numpy.ndarray` of shape ``[n_atoms, 3]`` holding the
+        atomic coordinates.
+
+    """
+
+    opener = gzip.open if path.endswith('gz') else open
+
+    # Holds a list for every block which is open. Each list holds the
+    # name of the block, its labels and its values.
+    blocks = []
+    with opener(path, 'rt') as mae:
+        for line in mae:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            if line.endswith('{'):
+                name = line[:-1].strip()
+                blocks.append([name, [], [], False])
+                if name == 'f_m_ct':
+                    energy = None
+                    coords = []
+                continue
+
+            name, labels, values, in_values = blocks[-1]
+
+            if line == ':::':
+                if name == 'f_m_ct' and in_values:
+                    continue
+                blocks[-1][3] = not in_values
+                # The values of the structure block come after the
+                # labels, so look for the energy here.
+                if name == 'f_m_ct' and not in_values:
+                    energy_col = next(
+                        (i for i, label in enumerate(labels) if
+                         label.startswith('r_mmod_Potential_Energy')),
+                        None)
+                # Each row of the atom block starts with the atom index.
+                if name.startswith('m_atom[') and not in_values:
+                    xyz = [labels.index(f'r_m_{axis}_coord')+1 for
+                           axis in 'xyz']
+                continue
+
+            if line == '}':
+                name, *_ = blocks.pop()
+                if name == 'f_m_ct':
+                    yield energy, np.array(coords, dtype=float)
+                continue
+
+            if not in_values:
+                labels.append(line)
+
+            elif name == 'f_m_ct':
+                values.extend(_mae_tokens(line))
+                if (energy_col is not None and
+                   energy is None and
+                   len(values) > energy_col):
+                    energy = float(values[energy_col])
+
+            elif name.startswith('m_atom['):
+                row = _mae_tokens(line)
+                coords.append([row[i] for i in xyz])
+
+
+def _mae_tokens(line):
+    """
+    Splits a line of ``.mae`` values into its values.
+
+    Parameters
+    ----------
+    line : :class:`str`
+        A line holding values from a ``.mae`` file. String values may
+        be quoted and hold spaces.
+
+    Returns
+    -------
+    :class:`list` of :class:`str`
+        The values in `line`.
+
+    """
+
+    if '"' not in line:
+        return line.split()
+    return _mae_token.findall(line)
+
+
+# Matches a single value in a ``.mae`` file. Values are either quoted
+# strings or free of whitespace.
+_mae_token = re.compile(r'"(?:[^"\\]|\\.)*"|\S+')
+
+
 def matrix_centroid(matrix):
     """
     Returns the centroid of the coordinates held in `matrix`.
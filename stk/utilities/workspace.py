@@ -0,0 +1,278 @@
+"""
+Defines tools for managing the files written by external programs.
+
+External programs, such as MacroModel and MOPAC, communicate with
+``stk`` through files. Each run of an external program is given its
+own job directory inside a :class:`Workspace`. When the job is
+finished, its directory is deleted, kept or archived, depending on the
+policy of the :class:`Workspace`.
+
+The root of the workspace can be placed on a fast file system, such as
+a ``tmpfs``, by setting the ``STK_SCRATCH`` environment variable or by
+giving it explicitly
+
+.. code-block:: python
+
+    workspace = Workspace('/dev/shm/stk', policy='archive')
+    with workspace.job('mopac') as job_dir:
+        ...
+
+The :class:`Workspace` used by external programs is held by
+:attr:`.Executor.workspace`.
+
+"""
+
+import getpass
+import os
+import shutil
+import tempfile
+import logging
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Workspace:
+    """
+    Creates and cleans up the job directories of external programs.
+
+    Attributes
+    ----------
+    root : :class:`str`
+        The directory in which job directories are created.
+
+    policy : :class:`str`
+        What happens to the directory of a job once it is finished.
+        Can be one of
+
+            ``'delete'`` - The directory is deleted.
+            ``'keep'`` - The directory is kept.
+            ``'archive'`` - The directory is compressed into a
+            ``.tar.gz`` file in :attr:`archive_dir` and then
+            deleted.
+
+    archive_dir : :class:`str`
+        The directory in which archived jobs are placed.
+
+    keep_failed : :class:`bool`
+        If ``True``, the directories of jobs which raised an error are
+        kept, regardless of :attr:`policy`.
+
+    jobs : :class:`int`
+        The number of jobs which have finished.
+
+    failed : :class:`int`
+        The number of jobs which raised an error.
+
+    total_size : :class:`int`
+        The total number of bytes held by the directories of all
+        finished jobs, measured when each job finished.
+
+    max_size : :class:`int`
+        The number of bytes held by the directory of the largest
+        finished job.
+
+    """
+
+    policies = {'delete', 'keep', 'archive'}
+
+    def __init__(self,
+                 root=None,
+                 policy='delete',
+                 archive_dir=None,
+                 keep_failed=False):
+        """
+        Initializes a :class:`Workspace`.
+
+        Parameters
+        ----------
+        root : :class:`str`, optional
+            The directory in which job directories are created. If
+            ``None``, the ``STK_SCRATCH`` environment variable is
+            used. If that is not set either, a directory belonging to
+            the current user is made in the default temporary
+            directory of the system, see :func:`_default_root`.
+
+        policy : :class:`str`, optional
+            What happens to the directory of a job once it is
+            finished. See :attr:`policy`.
+
+        archive_dir : :class:`str`, optional
+            The directory in which archived jobs are placed. If
+            ``None``, an ``archive`` directory in `root` is used.
+
+        keep_failed : :class:`bool`, optional
+            If ``True``, the directories of jobs which raised an error
+            are kept, regardless of `policy`.
+
+        Raises
+        ------
+        :class:`ValueError`
+            If `policy` is not valid.
+
+        """
+
+        if policy not in self.policies:
+            raise ValueError(f'"{policy}" is not a valid policy.')
+
+        if root is None:
+            root = os.environ.get('STK_SCRATCH')
+        if root is None:
+            root = _default_root()
+        if archive_dir is None:
+            archive_dir = os.path.join(root, 'archive')
+
+        self.root = os.path.abspath(root)
+        self.policy = policy
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.keep_failed = keep_failed
+        self.jobs = 0
+        self.failed = 0
+        self.total_size = 0
+        self.max_size = 0
+
+    @contextmanager
+    def job(self, name='job'):
+        """
+        Creates a directory for a job.
+
+        The directory is cleaned up according to :attr:`policy` when
+        the context is exited.
+
+        Parameters
+        ----------
+        name : :class:`str`, optional
+            The prefix of the directory name. Usually the name of the
+            program being run.
+
+        Yields
+        ------
+        :class:`str`
+            The full path of the job directory.
+
+        """
+
+        os.makedirs(self.root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f'{name}_', dir=self.root)
+        failed = True
+        try:
+            yield path
+            failed = False
+        finally:
+            self._finish(path, failed)
+
+    def usage(self):
+        """
+        Returns the number of bytes currently held by :attr:`root`.
+
+        Returns
+        -------
+        :class:`int`
+            The number of bytes held by all files in :attr:`root`,
+            including kept and archived jobs.
+
+        """
+
+        return _dir_size(self.root)
+
+    def _finish(self, path, failed):
+        """
+        Records the size of a job directory and cleans it up.
+
+        Parameters
+        ----------
+        path : :class:`str`
+            The path to the job directory.
+
+        failed : :class:`bool`
+            ``True`` if the job raised an error.
+
+        Returns
+        -------
+        None : :class:`NoneType`
+
+        """
+
+        size = _dir_size(path)
+        self.jobs += 1
+        self.failed += failed
+        self.total_size += size
+        self.max_size = max(self.max_size, size)
+        logger.debug(f'Job directory "{path}" holds {size} bytes.')
+
+        if failed and self.keep_failed:
+            logger.warning(f'Keeping directory of failed job "{path}".')
+            return
+
+        if self.policy == 'archive':
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archive = os.path.join(self.archive_dir,
+                                   os.path.basename(path))
+            shutil.make_archive(archive, 'gztar', path)
+
+        if self.policy != 'keep':
+            shutil.rmtree(path, ignore_errors=True)
+
+    def __repr__(self):
+        return (f'Workspace({self.root!r}, '
+                f'policy={self.policy!r}, '
+                f'jobs={self.jobs}, '
+                f'total_size={self.total_size})')
+
+
+def _dir_size(path):
+    """
+    Returns the number of bytes held by the files in a directory.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path to the directory.
+
+    Returns
+    -------
+    :class:`int`
+        The number of bytes held by the files in `path` and all of its
+        subdirectories.
+
+    """
+
+    size = 0
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return 0
+
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                size += _dir_size(entry.path)
+            else:
+                size += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    return size
+
+
+def _default_root():
+    """
+    Returns the default root of a :class:`Workspace`.
+
+    The root is a directory in the default temporary directory of the
+    system, named after the current user, so that users of a shared
+    machine do not write into each other's workspaces. If the user
+    cannot be found, a new directory is made instead.
+
+    Returns
+    -------
+    :class:`str`
+        The path of the root.
+
+    """
+
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError, ImportError):
+        return tempfile.mkdtemp(prefix='stk-')
+    return os.path.join(tempfile.gettempdir(), f'stk-{user}')
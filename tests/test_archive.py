@@ -0,0 +1,85 @@
+import copy
+import os
+import numpy as np
+from os.path import join
+import stk
+
+odir = 'archive_tests_output'
+if not os.path.exists(odir):
+    os.mkdir(odir)
+
+
+def test_archive(amine2, aldehyde2):
+    cache = stk.OPTIONS['cache']
+    stk.OPTIONS['cache'] = False
+    try:
+        polymers = [
+            stk.Polymer([amine2, aldehyde2], stk.Linear('AB', [0, 0], n))
+            for n in range(1, 4)
+        ]
+        pop = stk.Population(amine2,
+                             polymers[0],
+                             stk.Population(),
+                             stk.Population(*polymers[1:],
+                                            copy.copy(amine2)))
+        path = join(odir, 'archive')
+        pop.dump_archive(path)
+
+        archive = stk.PopulationArchive(path)
+        assert len(archive) == 5
+        assert archive.populations == [(0, ), (1, )]
+        # The two copies of amine2 have the same connectivity.
+        assert len(set(archive.index[:, 2])) == 4
+
+        coords = archive.coordinates(1)
+        assert isinstance(coords.base, np.memmap)
+        assert coords.dtype == np.float32
+        assert np.allclose(coords,
+                           polymers[0].mol.GetConformer().GetPositions(),
+                           atol=1e-4)
+
+        mols = list(archive)
+        assert [mol.inchi for mol in mols] == [mol.inchi for mol in pop]
+        assert mols[1] is not polymers[0]
+        for mol in mols[2:4]:
+            assert all(a is b for a, b in
+                       zip(mol.building_blocks, mols[1].building_blocks))
+        assert archive.metadata(0)['func_grp'] == 'amine'
+        archive.close()
+
+        locations = [location for location, _ in
+                     stk.Population.iter_archive(path,
+                                                 stk.Molecule.from_dict)]
+        assert locations == [(), (), (1, ), (1, ), (1, )]
+    finally:
+        stk.OPTIONS['cache'] = cache
+
+
+def test_archive_conformers(tmp_amine2):
+    stk.rdkit_conformers(tmp_amine2,
+                         num_conformers=3,
+                         keep=3,
+                         random_seed=1)
+    conf = tmp_amine2.mol.GetConformer(2)
+    conf.SetId(7)
+    ids = [conf.GetId() for conf in tmp_amine2.mol.GetConformers()]
+    assert ids == [0, 1, 7]
+
+    path = join(odir, 'conformers')
+    with stk.PopulationArchive(path, 'w') as archive:
+        archive.add_member(tmp_amine2)
+
+    archive = stk.PopulationArchive(path)
+    assert archive.conformer_ids(0) == ids
+    assert np.allclose(archive.coordinates(0, 2),
+                       tmp_amine2.mol.GetConformer(7).GetPositions(),
+                       atol=1e-4)
+
+    mol = archive[0]
+    assert [conf.GetId() for conf in mol.mol.GetConformers()] == ids
+    for conf_id in ids:
+        assert np.allclose(mol.mol.GetConformer(conf_id).GetPositions(),
+                           tmp_amine2.mol.GetConformer(
+                                            conf_id).GetPositions(),
+                           atol=1e-4)
+    archive.close()
@@ -1,3 +1,4 @@
+import numpy as np
 import stk
 
 
@@ -11,3 +12,48 @@ def test_window_difference():
 
 def test_window_variance():
     ...
+
+
+def test_rigid_relaxation(amine2, aldehyde3):
+    cage = stk.Cage([amine2, aldehyde3], stk.FourPlusSix())
+    labels = np.array([(props['bb_index'], props['mol_index']) for
+                       _, props in sorted(cage.atom_props.items())])
+    new_bonds = [
+        (bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()) for
+        bond in cage.mol.GetBonds() if
+        tuple(labels[bond.GetBeginAtomIdx()]) !=
+        tuple(labels[bond.GetEndAtomIdx()])
+    ]
+
+    def fragment_distances():
+        coords = cage.mol.GetConformer().GetPositions()
+        d = np.linalg.norm(coords[:, None] - coords[None], axis=2)
+        same = np.all(labels[:, None] == labels[None], axis=2)
+        return d[same]
+
+    def bond_lengths():
+        return [cage.atom_distance(i, j) for i, j in new_bonds]
+
+    before = fragment_distances()
+    stk.rigid_relaxation(cage, bond_length=1.3)
+
+    assert np.allclose(fragment_distances(), before)
+    assert np.allclose(bond_lengths(), 1.3, atol=0.05)
+
+
+def test_rigid_relaxation_parallel(amine2, amine2_alt1, aldehyde3):
+    cages = [stk.Cage([amine, aldehyde3], stk.FourPlusSix()) for
+             amine in (amine2, amine2_alt1)]
+    before = [cage.mol.GetConformer().GetPositions() for cage in cages]
+    pop = stk.Population(*cages)
+    for cage in pop:
+        cage.optimized = False
+
+    # Atom properties must be sent to the other processes.
+    pop.optimize(stk.FunctionData('rigid_relaxation', bond_length=1.3),
+                 processes=2)
+
+    for cage, coords in zip(pop, before):
+        assert cage.optimized
+        assert not np.allclose(cage.mol.GetConformer().GetPositions(),
+                               coords)
@@ -0,0 +1,98 @@
+import copy
+import pytest
+import numpy as np
+import stk
+
+
+def num_atoms(mol):
+    return mol.mol.GetNumAtoms()
+
+
+def test_descriptor_table(amine2, aldehyde2):
+    calls = []
+
+    def size(mol):
+        calls.append(mol)
+        return mol.mol.GetNumAtoms() + mol.structure_version
+
+    mols = [copy.copy(amine2) for _ in range(3)]
+    sub = stk.Population(copy.copy(aldehyde2))
+    pop = stk.Population(*mols, sub)
+    # Building molecules moves the building blocks, which changes
+    # their structure version.
+    for mol in pop:
+        mol.structure_version = 0
+
+    table = stk.DescriptorTable(pop)
+    table.add('size', size)
+    table.add('missing', lambda mol: None)
+    n, m = amine2.mol.GetNumAtoms(), aldehyde2.mol.GetNumAtoms()
+
+    assert list(table.column('size')) == [n, n, n, m]
+    assert table.max('size') == max(n, m)
+    assert table.min('size') == min(n, m)
+    assert np.isclose(table.mean('size'), (3*n+m)/4)
+    assert np.isclose(table.quantile('size', 0.5), np.median([n]*3+[m]))
+    assert len(calls) == 4
+    assert np.all(np.isnan(table.column('missing')))
+
+    # Values are only calculated for new or re-optimized members.
+    for mol in pop:
+        mol.optimized = mol is not mols[1]
+    pop.optimize(stk.FunctionData('do_not_optimize'), processes=1)
+    new = copy.copy(aldehyde2)
+    new.structure_version = 0
+    sub.members.append(new)
+    del pop.members[0]
+    calls.clear()
+    assert list(table.column('size')) == [n+1, n, m, m]
+    assert calls == [mols[1], new]
+
+    assert table.sort('size') == [sub.members[0], new, mols[2], mols[1]]
+    assert table.sort('size', reverse=True)[0] is mols[1]
+
+
+def test_descriptor_table_parallel(amine2, aldehyde2):
+    pop = stk.Population(copy.copy(amine2), copy.copy(aldehyde2))
+    table = stk.DescriptorTable(pop, processes=2)
+    table.add('num_atoms', num_atoms)
+    assert list(table.column('num_atoms')) == [
+        amine2.mol.GetNumAtoms(), aldehyde2.mol.GetNumAtoms()
+    ]
+
+
+def test_descriptor_table_shapes(amine2, aldehyde2):
+    mols = [copy.copy(amine2), copy.copy(aldehyde2), copy.copy(amine2)]
+    pop = stk.Population(*mols)
+    table = stk.DescriptorTable(pop)
+
+    # The shape is taken from the first value which is not missing.
+    table.add('centroid', lambda mol: (None if mol is mols[0] else
+                                       list(mol.centroid())))
+    column = table.column('centroid')
+    assert column.shape == (3, 3)
+    assert np.all(np.isnan(column[0]))
+    assert np.allclose(column[1], mols[1].centroid())
+
+    table.add('ragged', lambda mol: [1, [2, 3]])
+    with pytest.raises(ValueError, match='regular array'):
+        table.column('ragged')
+
+    table.add('mixed', lambda mol: (1 if mol is mols[1] else [1, 2]))
+    with pytest.raises(ValueError, match='shape'):
+        table.column('mixed')
+
+
+def test_descriptor_table_moved(tmp_amine2, tmp_aldehyde3):
+    mols = [tmp_amine2, tmp_aldehyde3]
+    table = stk.DescriptorTable(stk.Population(*mols))
+    table.add('x', lambda mol: mol.centroid()[0])
+    x = table.column('x').copy()
+
+    # Moving a molecule by one of its methods makes its value stale.
+    pos_mat = mols[1].mol.GetConformer().GetPositions().T
+    mols[1].set_position_from_matrix(pos_mat + [[10], [0], [0]])
+    assert np.allclose(table.column('x'), [x[0], x[1]+10])
+
+    mols[0].set_position([5, 0, 0])
+    assert np.allclose(table.column('x'), [5, x[1]+10])
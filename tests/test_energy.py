@@ -1,3 +1,6 @@
+import os
+from os.path import join
+import sys
 import stk
 
 
@@ -42,3 +45,40 @@ def test_logging(amine2):
     amine2.energy.rdkit('uff')
     fd = stk.FunctionData(name='rdkit', forcefield='uff', conformer=-1)
     assert fd in amine2.energy.values
+
+
+def test_mopac_properties(tmp_amine2, monkeypatch):
+    odir = os.path.abspath('energy_tests_output')
+    if not os.path.exists(odir):
+        os.mkdir(odir)
+    monkeypatch.chdir(odir)
+
+    # Stands in for MOPAC. Writes an .arc file and counts its runs.
+    mopac_path = join(odir, 'mopac')
+    with open(mopac_path, 'w') as f:
+        f.write(
+            f'#!{sys.executable}\n'
+            'import sys\n'
+            f'with open({join(odir, "runs")!r}, "a") as f:\n'
+            '    f.write("run\\n")\n'
+            'with open(sys.argv[1] + ".arc", "w") as f:\n'
+            '    f.write(" PM7 NOOPT EPS=80.1 CHARGE=0\\n"\n'
+            '            " HEAT OF FORMATION = -10.5 KCAL/MOL\\n"\n'
+            '            " TOTAL ENERGY = -654.25 EV\\n"\n'
+            '            " DIPOLE = 2.75 DEBYE\\n"\n'
+            '            " IONIZATION POTENTIAL = 9.5 EV\\n"\n'
+            '            " HOMO LUMO ENERGIES (EV) = -9.5 1.25\\n")\n'
+        )
+    os.chmod(mopac_path, 0o755)
+    if os.path.exists('runs'):
+        os.remove('runs')
+
+    properties = tmp_amine2.energy.mopac_properties(mopac_path)
+    assert properties['heat_of_formation'] == -10.5
+    assert properties['homo'] == -9.5
+    assert properties['lumo'] == 1.25
+    assert tmp_amine2.energy.mopac(mopac_path) == -654.25
+    assert tmp_amine2.energy.mopac_dipole(mopac_path) == 2.75
+
+    with open('runs', 'r') as f:
+        assert len(f.readlines()) == 1
@@ -0,0 +1,353 @@
+import os
+from os.path import join
+import stat
+import sys
+import time
+from functools import partial
+import asyncio
+import json
+import numpy as np
+import pytest
+import stk
+from stk.optimization.optimization import _OptimizationFunc
+
+odir = 'executor_tests_output'
+if not os.path.exists(odir):
+    os.mkdir(odir)
+
+
+def stand_in(name, body):
+    """
+    Writes an executable python script which stands in for an engine.
+
+    """
+
+    path = os.path.abspath(join(odir, name))
+    with open(path, 'w') as f:
+        f.write(f'#!{sys.executable}\n')
+        f.write('import sys, os, time\n')
+        f.write(body)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def test_concurrency_limit():
+    """
+    Tests that no more than `max_jobs` jobs run at the same time.
+
+    """
+
+    log = os.path.abspath(join(odir, 'concurrency.log'))
+    if os.path.exists(log):
+        os.remove(log)
+    engine = stand_in('concurrent_engine', (
+        f'with open({log!r}, "a") as f: f.write(f"s {{time.time()}}\\n")\n'
+        'time.sleep(0.3)\n'
+        f'with open({log!r}, "a") as f: f.write(f"e {{time.time()}}\\n")\n'
+    ))
+
+    executor = stk.Executor()
+    executor.set_engine('engine', max_jobs=2)
+
+    async def run():
+        return await asyncio.gather(*(executor.run('engine', [engine])
+                                      for _ in range(5)))
+
+    jobs = stk.run_coroutine(run())
+    assert all(job.returncode == 0 for job in jobs)
+
+    with open(log, 'r') as f:
+        events = sorted((float(t), kind) for kind, t in
+                        (line.split() for line in f))
+    running = max_running = 0
+    for _, kind in events:
+        running += 1 if kind == 's' else -1
+        max_running = max(running, max_running)
+    assert max_running == 2
+
+
+def test_license_backoff():
+    """
+    Tests that jobs are resubmitted when a license is not found.
+
+    """
+
+    counter = os.path.abspath(join(odir, 'license_counter'))
+    if os.path.exists(counter):
+        os.remove(counter)
+    engine = stand_in('licensed_engine', (
+        f'n = int(open({counter!r}).read()) if '
+        f'os.path.exists({counter!r}) else 0\n'
+        f'open({counter!r}, "w").write(str(n+1))\n'
+        'print("NO LICENSE" if n < 2 else "DONE")\n'
+    ))
+
+    executor = stk.Executor(backoff=0.01)
+    job = stk.run_coroutine(executor.run(
+                        'engine',
+                        [engine],
+                        license_found=lambda out: 'NO LICENSE' not in out))
+    assert job.retries == 2
+    assert 'DONE' in job.output
+
+    os.remove(counter)
+    executor = stk.Executor(backoff=0.01, max_retries=1)
+    with pytest.raises(stk.LicenseError):
+        stk.run_coroutine(executor.run(
+                        'engine',
+                        [engine],
+                        license_found=lambda out: 'NO LICENSE' not in out))
+
+
+def test_license_tokens():
+    """
+    Tests that engines sharing a license share its tokens.
+
+    """
+
+    log = os.path.abspath(join(odir, 'tokens.log'))
+    if os.path.exists(log):
+        os.remove(log)
+    engine = stand_in('token_engine', (
+        f'with open({log!r}, "a") as f: f.write(f"s {{time.time()}}\\n")\n'
+        'time.sleep(0.2)\n'
+        f'with open({log!r}, "a") as f: f.write(f"e {{time.time()}}\\n")\n'
+    ))
+
+    executor = stk.Executor()
+    executor.set_license('license', 1)
+    executor.set_engine('engine1', license='license')
+    executor.set_engine('engine2', max_jobs=3, license='license')
+
+    async def run():
+        await asyncio.gather(executor.run('engine1', [engine]),
+                             executor.run('engine2', [engine]),
+                             executor.run('engine2', [engine]))
+
+    stk.run_coroutine(run())
+    with open(log, 'r') as f:
+        events = sorted((float(t), kind) for kind, t in
+                        (line.split() for line in f))
+    assert [kind for _, kind in events] == ['s', 'e']*3
+
+
+def test_timeout():
+    """
+    Tests that jobs which run past their timeout are stopped.
+
+    """
+
+    end_file = os.path.abspath(join(odir, 'timeout.end'))
+    if os.path.exists(end_file):
+        os.remove(end_file)
+    # The engine stops on its own once the ``.end`` file exists.
+    polite = stand_in('polite_engine', (
+        f'while not os.path.exists({end_file!r}):\n'
+        '    time.sleep(0.05)\n'
+    ))
+    stubborn = stand_in('stubborn_engine', 'time.sleep(60)\n')
+
+    def stop():
+        with open(end_file, 'w') as f:
+            f.write('SHUT')
+
+    executor = stk.Executor(kill_timeout=5)
+    job = stk.run_coroutine(executor.run('engine',
+                                         [polite],
+                                         timeout=0.2,
+                                         on_timeout=stop))
+    assert job.timed_out
+    assert not job.killed
+    assert job.returncode == 0
+
+    executor = stk.Executor(kill_timeout=0.2)
+    start = time.time()
+    job = stk.run_coroutine(executor.run('engine',
+                                         [stubborn],
+                                         timeout=0.2,
+                                         on_timeout=stop))
+    assert job.timed_out
+    assert job.killed
+    assert time.time() - start < 30
+
+
+def pid_engine(name):
+    """
+    Writes a stand in engine which saves its pid and then hangs.
+
+    """
+
+    pid_file = os.path.abspath(join(odir, f'{name}.pid'))
+    if os.path.exists(pid_file):
+        os.remove(pid_file)
+    engine = stand_in(name, (
+        f'with open({pid_file!r}, "w") as f:\n'
+        '    f.write(str(os.getpid()))\n'
+        'time.sleep(60)\n'
+    ))
+    return engine, pid_file
+
+
+def is_running(pid_file):
+    with open(pid_file, 'r') as f:
+        pid = int(f.read())
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_deadline():
+    """
+    Tests that jobs are killed when a deadline passes.
+
+    """
+
+    engine, pid_file = pid_engine('deadline_engine')
+    executor = stk.Executor(kill_timeout=30)
+    start = time.time()
+    with pytest.raises(stk.DeadlineError):
+        with stk.deadline(0.5):
+            stk.run_coroutine(executor.run('engine',
+                                           [engine],
+                                           on_timeout=lambda: None))
+    assert time.time() - start < 10
+    assert not is_running(pid_file)
+
+    # Jobs which finish in time are not affected.
+    quick = stand_in('quick_engine', 'print("done")\n')
+    with stk.deadline(30):
+        job = stk.run_coroutine(executor.run('engine', [quick]))
+    assert not job.timed_out
+    assert job.output.strip() == 'done'
+
+
+def test_optimization_deadline(tmp_amine2):
+    """
+    Tests that optimization deadlines kill external programs.
+
+    """
+
+    engine, pid_file = pid_engine('optimization_deadline_engine')
+    executor = stk.Executor(kill_timeout=30)
+
+    def optimize(mol, executor):
+        stk.run_coroutine(executor.run('engine', [engine]))
+
+    tmp_amine2.optimized = False
+    start = time.time()
+    func = partial(optimize, executor=executor)
+    _OptimizationFunc(func, 0.5)(tmp_amine2)
+    assert time.time() - start < 10
+    assert tmp_amine2.optimized
+    assert not is_running(pid_file)
+
+
+def test_cancel():
+    """
+    Tests that cancelling a job kills its program.
+
+    """
+
+    engine, pid_file = pid_engine('cancel_engine')
+    executor = stk.Executor()
+
+    async def run():
+        task = asyncio.ensure_future(executor.run('engine', [engine]))
+        while not os.path.exists(pid_file):
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    stk.run_coroutine(run())
+    assert not is_running(pid_file)
+
+
+def test_wait_for_file():
+    """
+    Tests that files can be waited for.
+
+    """
+
+    path = os.path.abspath(join(odir, 'waited_for'))
+    if os.path.exists(path):
+        os.remove(path)
+
+    async def write_later():
+        await asyncio.sleep(0.2)
+        with open(path, 'w') as f:
+            f.write('done')
+
+    async def run():
+        _, found = await asyncio.gather(
+                                write_later(),
+                                stk.EXECUTOR.wait_for_file(path, 5))
+        return found
+
+    assert stk.run_coroutine(run())
+    missing = join(odir, 'never_written')
+    assert not stk.run_coroutine(
+                            stk.EXECUTOR.wait_for_file(missing, 0.1))
+
+
+def test_optimize_async(tmp_amine2, tmp_aldehyde3):
+    """
+    Tests that a population can be optimized through an executor.
+
+    """
+
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3, tmp_amine2)
+    for mol in pop:
+        mol.optimized = False
+    before = [mol.mol.GetConformer().GetPositions() for mol in pop]
+
+    pop.optimize(stk.FunctionData('rdkit_optimization'),
+                 executor=stk.Executor())
+
+    assert all(mol.optimized for mol in pop)
+    for mol, coords in zip(pop, before):
+        assert not np.allclose(mol.mol.GetConformer().GetPositions(), coords)
+
+
+def test_telemetry(monkeypatch, tmp_amine2, tmp_aldehyde3):
+    """
+    Tests that external jobs are recorded for each molecule.
+
+    """
+
+    engine = stand_in('telemetry_engine', 'print("DONE")\n')
+
+    def engine_opt(mol):
+        stk.run_coroutine(stk.EXECUTOR.run('telemetry', [engine]))
+        if mol is tmp_aldehyde3:
+            raise RuntimeError('Engine failed.')
+
+    monkeypatch.setattr(sys.modules['stk.optimization.optimization'],
+                        'engine_opt',
+                        engine_opt,
+                        raising=False)
+
+    path = os.path.abspath(join(odir, 'telemetry.jsonl'))
+    if os.path.exists(path):
+        os.remove(path)
+
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3)
+    for mol in pop:
+        mol.optimized = False
+    summary = pop.optimize(stk.FunctionData('engine_opt'),
+                           processes=1,
+                           telemetry=path)
+
+    assert summary['records'] == 2
+    assert summary['outcomes'] == {'success': 1, 'failed': 1}
+    assert summary['engines']['telemetry']['jobs'] == 2
+    assert summary['engines']['telemetry']['failures'] == 0
+
+    with open(path, 'r') as f:
+        records = [json.loads(line) for line in f]
+    assert ([record['key'] for record in records] ==
+            [stk.canonical_key(mol.key) for mol in pop])
+    assert records[1]['error'] == 'RuntimeError: Engine failed.'
+    assert records[0]['jobs'][0]['run_time'] > 0
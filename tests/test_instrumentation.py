@@ -0,0 +1,43 @@
+import json
+import os
+import stk
+
+odir = 'instrumentation_tests_output'
+if not os.path.exists(odir):
+    os.mkdir(odir)
+
+
+def test_disabled(amine2):
+    stk.INSTRUMENTATION.reset()
+    amine2.tag_atoms()
+    amine2.energy.rdkit('uff')
+    assert stk.INSTRUMENTATION.report() == {}
+
+
+def test_instrumentation(amine2, aldehyde3):
+    stk.INSTRUMENTATION.reset()
+    stk.INSTRUMENTATION.enable()
+    try:
+        with stk.WorkerPool(2) as pool:
+            pop = stk.Population.init_all(stk.Cage,
+                                          [[amine2], [aldehyde3]],
+                                          [stk.FourPlusSix()],
+                                          pool=pool)
+        amine2.energy.rdkit('uff')
+    finally:
+        stk.INSTRUMENTATION.disable()
+
+    report = stk.INSTRUMENTATION.report()
+    # Recorded in a worker process.
+    assert report['build']['count'] == 1
+    assert report['build.react']['count'] == 12
+    assert report['cache.Cage.miss']['count'] == 1
+    # Recorded in this process.
+    assert report['Energy.rdkit']['count'] == 1
+    assert report['Energy.rdkit']['seconds'] > 0
+
+    path = os.path.join(odir, 'report.json')
+    stk.INSTRUMENTATION.dump(path)
+    with open(path, 'r') as f:
+        assert json.load(f) == report
+    stk.INSTRUMENTATION.reset()
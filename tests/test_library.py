@@ -0,0 +1,52 @@
+import os
+from os.path import join
+import rdkit.Chem.AllChem as rdkit
+import stk
+
+odir = 'library_tests_output'
+if not os.path.exists(odir):
+    os.mkdir(odir)
+
+
+def test_library(amine2, amine2_alt1, amine3):
+    folder = join(odir, 'amines')
+    if not os.path.exists(folder):
+        os.mkdir(folder)
+    bbs = [amine2, amine2_alt1, amine3]
+    for i, bb in enumerate(bbs):
+        bb.write(join(folder, f'amine_{i}.mol'))
+
+    for processes in (1, 2):
+        library = stk.BuildingBlockLibrary(folder,
+                                           processes=processes,
+                                           chunksize=1)
+        assert len(library) == 3
+        assert [entry['key'] for entry in library.entries] == [
+            bb.key for bb in bbs
+        ]
+        assert [entry['fg_count'] for entry in library.entries] == [
+            2, 2, 3
+        ]
+
+    assert library.select(fg_count=2) == [0, 1]
+    assert library.select(functional_group='aldehyde') == []
+    assert library.random(fg_count=3).key == amine3.key
+    assert {bb.key for bb in library.diverse(5, fg_count=2)} == {
+        amine2.key, amine2_alt1.key
+    }
+
+    path = join(odir, 'index.json')
+    library.dump(path)
+    loaded = stk.BuildingBlockLibrary.load(path, stk.StructUnit3)
+    assert loaded.entries[2]['fingerprint'] == amine3.fingerprint()
+    assert isinstance(loaded[2], stk.StructUnit3)
+
+    # A multi-record .sdf file.
+    sdf = join(odir, 'amines.sdf')
+    writer = rdkit.SDWriter(sdf)
+    for bb in bbs:
+        writer.write(bb.mol)
+    writer.close()
+    library = stk.BuildingBlockLibrary(sdf, functional_group='amine')
+    assert [entry['record'] for entry in library.entries] == [0, 1, 2]
+    assert library[1].key == amine2_alt1.key
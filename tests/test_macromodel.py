@@ -11,7 +11,10 @@ import sys
 import os
 from os.path import join
 import numpy as np
+import rdkit.Chem.AllChem as rdkit
 import stk
+from stk.optimization.macromodel import (_fix_params_in_com_file,
+                                        _fix_block)
 
 macromodel = pytest.mark.skipif(
     all('macromodel' not in x for x in sys.argv),
@@ -63,3 +66,37 @@ def test_macromodel_eng():
         os.chdir(outdir)
     assert np.allclose(
         c2.energy.macromodel(16, mm_path), 23.48, atol=1e-2)
+
+
+def test_fix_params_in_com_file():
+    filler = '!!!BLOCK_OF_FIXED_PARAMETERS_COMES_HERE!!!\n'
+    body = _fix_params_in_com_file(c1, filler, True)
+    hits = _fix_block.cache_info().hits
+    assert body == _fix_params_in_com_file(c1, filler, True)
+    assert _fix_block.cache_info().hits == hits + 1
+    assert _fix_params_in_com_file(c1, filler, False) == ''
+
+    lines = [line.split() for line in body.splitlines()]
+
+    def fixed(command, n):
+        ids = (tuple(int(x)-1 for x in line[1:n+1]) for
+               line in lines if line[0] == command)
+        return {min(x, x[::-1]) for x in ids}
+
+    def matches(smarts):
+        query = rdkit.MolFromSmarts(smarts)
+        ids = c1.mol.GetSubstructMatches(query,
+                                         uniquify=False,
+                                         maxMatches=10**7)
+        return {min(x, x[::-1]) for x in ids}
+
+    bonder_ids = set(stk.flatten(c1.bonder_ids))
+    bonds = {
+        min(x, x[::-1]) for x in
+        ((b.GetBeginAtomIdx(), b.GetEndAtomIdx()) for
+         b in c1.mol.GetBonds())
+        if not (x[0] in bonder_ids and x[1] in bonder_ids)
+    }
+    assert fixed('FXDI', 2) == bonds
+    assert fixed('FXBA', 3) == matches('[*]~[*]~[*]')
+    assert fixed('FXTA', 4) == matches('[*]~[*]~[*]~[*]')
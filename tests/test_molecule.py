@@ -1,6 +1,11 @@
+import os
+import gzip
+import subprocess
+import sys
 from os.path import join
 import itertools as it
 import numpy as np
+import pytest
 from scipy.spatial.distance import euclidean
 import stk
 
@@ -173,3 +178,65 @@ def test_update_from_mae(tmp_amine2):
     tmp_amine2.update_from_mae(filename, 1)
     assert abs(tmp_amine2.max_diameter(0)[0] -
                tmp_amine2.max_diameter(1)[0]) > 1
+
+    expected = stk.mol_from_mae_file(filename).GetConformer()
+    assert np.allclose(tmp_amine2.mol.GetConformer(1).GetPositions(),
+                       expected.GetPositions())
+
+    # A file without structures, such as the output of a failed
+    # MacroModel run.
+    with open(filename, 'r') as f:
+        header = f.read().split('f_m_ct', 1)[0]
+    empty = join('molecule_tests_output', 'empty.mae')
+    os.makedirs('molecule_tests_output', exist_ok=True)
+    with open(empty, 'w') as f:
+        f.write(header)
+    with pytest.raises(ValueError, match='no structures'):
+        tmp_amine2.update_from_mae(empty)
+
+
+def test_lowest_energy_conformers():
+    with open(join('data', 'molecule.mae'), 'r') as f:
+        header, structure = f.read().split('f_m_ct', 1)
+
+    # Make a conformer search output with a structure for each energy.
+    # The structures are shifted so that they can be told apart.
+    energies = [5.5, -1.25, 3, -7.75, 0]
+    structures = []
+    for i, energy in enumerate(energies):
+        shifted = structure.replace(
+            ' i_m_ct_format\n :::\n',
+            (' i_m_ct_format\n r_mmod_Potential_Energy-OPLS-2005\n'
+             ' :::\n'), 1)
+        shifted = shifted.replace('  2\n m_atom', f'  2\n {energy}\n m_atom')
+        shifted = shifted.replace(' -3.729156 ', f' {i} ', 1)
+        structures.append(shifted)
+
+    path = join('molecule_tests_output', 'conformers-out.maegz')
+    os.makedirs('molecule_tests_output', exist_ok=True)
+    with gzip.open(path, 'wt') as f:
+        f.write(header + ''.join(f'f_m_ct{s}' for s in structures))
+
+    conformers = stk.lowest_energy_conformers(path, 2)
+    assert [energy for energy, _ in conformers] == [-7.75, -1.25]
+    assert [coords[0, 0] for _, coords in conformers] == [3, 1]
+    assert conformers[0][1].shape == (15, 3)
+    assert len(list(stk.mae_conformers(path))) == len(energies)
+
+
+def test_lazy_imports():
+    # Importing stk must not import libraries which are only needed
+    # by a few methods, as it would slow down every script and every
+    # spawned worker process.
+    code = ('import sys, stk; '
+            'print(*[m for m in sys.modules if m.split(".")[0] in '
+            '("sklearn", "networkx", "pywindow", "psutil") or '
+            'm in ("scipy.optimize", "scipy.spatial")])')
+    root = os.path.dirname(os.path.dirname(stk.__file__))
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.run([sys.executable, '-c', code],
+                         env=env,
+                         stdout=subprocess.PIPE,
+                         universal_newlines=True,
+                         check=True).stdout
+    assert out.split() == []
@@ -0,0 +1,85 @@
+import logging
+import time
+from functools import partial
+import stk
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_messages(n):
+    logger = logging.getLogger('stk.test_mplogging')
+    for i in range(n):
+        logger.debug(f'debug {i}')
+        logger.warning(f'warning {i}')
+    return n
+
+
+def log_and_wait(duration):
+    logger = logging.getLogger('stk.test_mplogging')
+    logger.warning('Running a long job.')
+    time.sleep(duration)
+    return duration
+
+
+def test_log_queue():
+    log_queue = stk.LogQueue(batch_size=3, interval=60)
+    for i in range(4):
+        log_queue.put({'msg': i})
+    log_queue.flush()
+    log_queue.close()
+    assert log_queue.get() == [{'msg': i} for i in range(3)]
+    assert log_queue.get() == [{'msg': 3}]
+    assert log_queue.get() is None
+
+
+def test_worker_levels():
+    logger = logging.getLogger('stk.test_mplogging')
+    logger.setLevel(logging.WARNING)
+    handler = Records()
+    logger.addHandler(handler)
+    try:
+        with stk.WorkerPool(2) as pool:
+            func = partial(stk.logged_call,
+                           stk.logging_levels(),
+                           log_messages)
+            results = pool.imap_unordered(func, [5, 5])
+            assert sorted(results) == [5, 5]
+    finally:
+        logger.removeHandler(handler)
+
+    messages = sorted(record.getMessage() for record in handler.records)
+    assert messages == sorted([f'warning {i}' for i in range(5)]*2)
+
+
+def test_flush_while_waiting():
+    logger = logging.getLogger('stk.test_mplogging')
+    logger.setLevel(logging.WARNING)
+    handler = Records()
+    logger.addHandler(handler)
+    try:
+        with stk.WorkerPool(1) as pool:
+            func = partial(stk.logged_call,
+                           stk.logging_levels(),
+                           log_and_wait)
+            results = pool.imap_unordered(func, [5])
+            start = time.time()
+            while not handler.records and time.time() - start < 30:
+                time.sleep(0.05)
+            received = time.time()
+            assert list(results) == [5]
+            returned = time.time()
+    finally:
+        logger.removeHandler(handler)
+
+    # The record is sent while the worker is still waiting.
+    assert [r.getMessage() for r in handler.records] == [
+        'Running a long job.'
+    ]
+    assert returned - received > 1
@@ -1,9 +1,17 @@
 import pytest
+import copy
+import json
 from collections import Counter
 import numpy as np
 import os
+import rdkit.Chem.AllChem as rdkit
+import pickle
+import time
+from functools import partial
 from os.path import join
 import stk
+from stk.optimization.optimization import (_OptimizationFunc,
+                                           _OptimizationResult)
 
 odir = 'population_tests_output'
 if not os.path.exists(odir):
@@ -168,6 +176,135 @@ def test_load(generate_population):
         stk.OPTIONS['cache'] = False
 
 
+def test_dump_jsonl(generate_population, amine2, aldehyde2):
+    pop = generate_population()
+    pop.populations[0].populations.append(stk.Population())
+    path = join(odir, 'pop.jsonl')
+    pop.dump_jsonl(path)
+
+    def structure(pop):
+        return ([mol.inchi for mol in pop.members],
+                [structure(subpop) for subpop in pop.populations])
+
+    loaded = stk.Population.load_jsonl(path, stk.Molecule.from_dict)
+    assert structure(loaded) == structure(pop)
+    locations = [location for location, _ in
+                 stk.Population.iter_jsonl(path, stk.Molecule.from_dict)]
+    assert locations == [(), (), (0, ), (0, ), (0, 0), (0, 0),
+                         (1, ), (1, ), (1, 0), (1, 0)]
+
+    # Members made in other processes must have classes defined in
+    # stk.
+    polymers = [
+        stk.Polymer([amine2, aldehyde2], stk.Linear('AB', [0, 0], n))
+        for n in range(1, 4)
+    ]
+    pop = stk.Population(polymers[0],
+                         stk.Population(),
+                         stk.Population(*polymers[1:]))
+    pop.dump_jsonl(path)
+    loaded = stk.Population.load_jsonl(path,
+                                       stk.Molecule.from_dict,
+                                       processes=2,
+                                       chunksize=1)
+    assert structure(loaded) == structure(pop)
+
+
+def test_dump_jsonl_building_blocks(amine2, aldehyde2):
+    cache = stk.OPTIONS['cache']
+    stk.OPTIONS['cache'] = False
+    try:
+        polymers = [
+            stk.Polymer([amine2, aldehyde2], stk.Linear('AB', [0, 0], n))
+            for n in range(1, 4)
+        ]
+        pop = stk.Population(polymers[0], stk.Population(*polymers[1:]))
+        path = join(odir, 'shared_bbs.jsonl')
+        pop.dump_jsonl(path)
+
+        # Mol blocks are escaped in the file.
+        with open(path, 'r') as f:
+            contents = f.read()
+        for bb in (amine2, aldehyde2):
+            assert contents.count(json.dumps(bb.mdl_mol_block())) == 1
+
+        for processes in (1, 2):
+            loaded = stk.Population.load_jsonl(path,
+                                               stk.Molecule.from_dict,
+                                               processes=processes,
+                                               chunksize=1)
+            members = list(loaded)
+            assert [mol.inchi for mol in members] == [
+                mol.inchi for mol in pop
+            ]
+            for mol in members[1:]:
+                assert all(a is b for a, b in
+                           zip(mol.building_blocks,
+                               members[0].building_blocks))
+                assert set(mol.bb_counter) == set(mol.building_blocks)
+
+        pop.dump_jsonl(path, share_building_blocks=False)
+        with open(path, 'r') as f:
+            contents = f.read()
+        assert contents.count(json.dumps(amine2.mdl_mol_block())) > 1
+    finally:
+        stk.OPTIONS['cache'] = cache
+
+
+def test_iter_all(amine2, aldehyde2):
+    cache = stk.OPTIONS['cache']
+    stk.OPTIONS['cache'] = False
+    try:
+        bbs = [[amine2, aldehyde2], [aldehyde2, amine2]]
+        topologies = [stk.Linear('AB', [0, 0], 1)]
+        cached = dict(stk.Polymer.cache)
+
+        # amine2 + aldehyde2 and aldehyde2 + amine2 have the same key.
+        mols = list(stk.Population.iter_all(stk.Polymer,
+                                            bbs,
+                                            topologies,
+                                            processes=1,
+                                            chunksize=1))
+        assert len(mols) == 3
+        assert len({mol.key for mol in mols}) == 3
+        assert stk.Polymer.cache == cached
+
+        mols = list(stk.Population.iter_all(stk.Polymer,
+                                            bbs,
+                                            topologies,
+                                            processes=1,
+                                            duplicates=True))
+        assert len(mols) == 4
+        assert mols[0] is mols[3]
+
+        with stk.WorkerPool(2) as pool:
+            parallel = stk.Population.init_all(stk.Polymer,
+                                               bbs,
+                                               topologies,
+                                               pool=pool)
+        assert [mol.key for mol in parallel] == [
+            mol.key for mol in dict.fromkeys(mols)
+        ]
+    finally:
+        stk.OPTIONS['cache'] = cache
+
+
+def test_init_diverse(amine2, amine2_alt1, amine2_alt2, aldehyde2):
+    # Duplicates are found through the cache.
+    cache = stk.OPTIONS['cache']
+    stk.OPTIONS['cache'] = True
+    try:
+        pop = stk.Population.init_diverse(
+                        stk.Polymer,
+                        [[amine2, amine2_alt1, amine2_alt2], [aldehyde2]],
+                        [stk.Linear('AB', [0, 0], 1)],
+                        3)
+    finally:
+        stk.OPTIONS['cache'] = cache
+    assert len(pop) == 3
+    assert len({mol.key for mol in pop}) == 3
+
+
 def test_all_members(generate_population):
     """
     Check that all members, direct and in subpopulations, are returned.
@@ -327,6 +464,29 @@ def remove_members(generate_population):
     assert len(pop) == og_length - 5
 
 
+def test_remove_duplicates_structure(amine2, aldehyde2):
+    """
+    Remove molecules with the same structure.
+
+    """
+
+    # A molecule without a key must have its InChI compared.
+    no_key = copy.copy(amine2)
+    no_key.key = None
+
+    for processes in (1, 2):
+        aldehyde_copy = copy.copy(aldehyde2)
+        pop = stk.Population(amine2,
+                             copy.copy(amine2),
+                             aldehyde_copy,
+                             stk.Population(copy.copy(aldehyde2),
+                                            no_key))
+        pop.remove_duplicates(key='structure', processes=processes)
+        assert pop.members == [amine2, aldehyde_copy]
+        assert len(pop) == 2
+        assert pop.has_structure(no_key)
+
+
 def test_getitem(generate_population):
     """
     Test that the '[]' operator is working.
@@ -425,3 +585,252 @@ def test_contains(generate_population):
     subpop_cages = generate_population(cache=True, offset=True)
     pop.add_subpopulation(subpop_cages)
     assert subpop_cages[2] in pop
+
+
+def test_index():
+    """
+    Ensure the index stays correct when populations are changed.
+
+    """
+
+    def NewMol(): return stk.MacroMolecule.__new__(stk.MacroMolecule)
+
+    def check(pop):
+        mols = list(pop.all_members())
+        assert len(pop) == len(mols)
+        assert [pop[i] for i in range(len(mols))] == mols
+        assert all(mol in pop for mol in mols)
+
+    a, b, c, d = (NewMol() for _ in range(4))
+
+    # Indexing before the id index is built must not leave a stale
+    # flattened member list, in the population or in its parents.
+    pop = stk.Population(a, b)
+    pop[-1]
+    pop.members.append(c)
+    assert pop[-1] is c
+    parent = stk.Population(pop)
+    parent[-1]
+    pop.members.append(d)
+    assert parent[-1] is d
+    check(parent)
+
+    sub = stk.Population(a)
+    subsub = stk.Population()
+    sub.populations.append(subsub)
+    pop = stk.Population(b, sub)
+    shared = stk.Population(pop, pop)
+    check(pop)
+    check(shared)
+
+    # Changes to nested subpopulations must reach every parent.
+    subsub.members.append(c)
+    assert c in pop and c in shared
+    assert len(shared) == 6
+    check(pop)
+    check(shared)
+
+    sub.members.extend([d, d])
+    pop.members.insert(0, d)
+    check(pop)
+    check(shared)
+
+    subsub.members.remove(c)
+    assert c not in pop and c not in shared
+    check(shared)
+
+    sub.populations.clear()
+    subsub.members.append(c)
+    assert c not in pop
+    check(pop)
+
+    pop.members = [a]
+    pop.populations[0].members[0] = c
+    assert b not in pop and c in shared
+    check(shared)
+
+    pop.remove_members(lambda mol: mol is d)
+    assert d not in shared
+    check(shared)
+
+    copied = pickle.loads(pickle.dumps(pop))
+    check(copied)
+    copied.populations[0].members.append(NewMol())
+    assert len(copied) == len(pop) + 1
+
+
+def test_optimize(tmp_amine2, tmp_aldehyde3):
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3, tmp_amine2)
+    for mol in pop:
+        mol.optimized = False
+    before = [mol.mol.GetConformer().GetPositions() for mol in pop]
+
+    summary = pop.optimize(stk.FunctionData('rdkit_optimization'),
+                           processes=2)
+
+    # Telemetry records are sent back from the worker processes.
+    assert summary['outcomes'] == {'success': 2}
+    assert pop[0] is tmp_amine2
+    assert all(mol.optimized for mol in pop)
+    for mol, coords in zip(pop, before):
+        assert not np.allclose(mol.mol.GetConformer().GetPositions(),
+                               coords)
+
+
+def test_optimize_deadline(tmp_amine2):
+    def sleeper(mol, duration):
+        time.sleep(duration)
+
+    tmp_amine2.optimized = False
+    p_func = _OptimizationFunc(partial(sleeper, duration=30), 0.2)
+    start = time.time()
+    p_func(tmp_amine2)
+    assert time.time() - start < 10
+    assert tmp_amine2.optimized
+
+
+def test_optimize_pool(tmp_amine2, tmp_aldehyde3):
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3)
+    with stk.WorkerPool(2, preload=[tmp_amine2]) as pool:
+        for mol in pop:
+            mol.optimized = False
+        pop.optimize(stk.FunctionData('rdkit_optimization'), pool=pool)
+        assert pool.started
+        assert all(mol.optimized for mol in pop)
+
+        for mol in pop:
+            mol.optimized = False
+        pop.optimize(stk.FunctionData('rdkit_optimization'), pool=pool)
+        assert all(mol.optimized for mol in pop)
+    assert not pool.started
+
+
+def test_optimize_checkpoint(tmp_amine2, tmp_aldehyde3):
+    journal = join(odir, 'optimize_checkpoint.jsonl')
+    energy_key = stk.FunctionData('rdkit', forcefield='mmff')
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3)
+    for mol in pop:
+        mol.optimized = False
+        mol.energy.values[energy_key] = 1.5
+    first = stk.Population(tmp_amine2)
+    first.optimize(stk.FunctionData('rdkit_optimization'),
+                   processes=1,
+                   checkpoint=journal)
+
+    # Simulate a run which was killed part way through writing.
+    with open(journal, 'a') as f:
+        f.write('{"key": ')
+
+    # Resuming must journal the new member on a line of its own.
+    pop.optimize(stk.FunctionData('rdkit_optimization'),
+                 processes=1,
+                 checkpoint=journal,
+                 resume=True)
+    optimized = [mol.mol.GetConformer().GetPositions() for mol in pop]
+    with open(journal, 'r') as f:
+        assert [json.loads(line)['key'] for line in f] == [
+            stk.canonical_key(mol.key) for mol in pop
+        ]
+
+    for mol in pop:
+        mol.optimized = False
+        mol.energy.values.clear()
+        mol.set_position([0, 0, 0])
+    pop.optimize(stk.FunctionData('raiser', param1=1),
+                 processes=1,
+                 checkpoint=journal,
+                 resume=True)
+
+    for mol, coords in zip(pop, optimized):
+        assert mol.optimized
+        assert mol.energy.values[energy_key] == 1.5
+        assert np.allclose(mol.mol.GetConformer().GetPositions(), coords)
+
+
+def test_optimization_result_json(tmp_amine2, monkeypatch):
+    energy_key = stk.FunctionData('rdkit',
+                                  forcefield='mmff',
+                                  settings={'maxIters': 10})
+    tmp_amine2.energy.values[energy_key] = np.float64(1.5)
+    tmp_amine2.optimized = True
+    result = _OptimizationResult(tmp_amine2, False)
+
+    text = json.dumps(result.json())
+    assert 'FunctionData' not in text
+
+    def no_eval(*args, **kwargs):
+        raise AssertionError('eval must not be used.')
+
+    monkeypatch.setattr('builtins.eval', no_eval)
+    loaded = _OptimizationResult.from_json(json.loads(text))
+    assert loaded.energies == {energy_key: 1.5}
+    assert loaded.optimized
+    for (id1, coords1), (id2, coords2) in zip(loaded.conformers,
+                                              result.conformers):
+        assert id1 == id2
+        assert np.allclose(coords1, coords2)
+
+
+def test_optimize_conformers(tmp_amine2, tmp_aldehyde3):
+    pop = stk.Population(tmp_amine2, tmp_aldehyde3)
+    for mol in pop:
+        mol.optimized = False
+    pop.optimize(stk.FunctionData('rdkit_conformers',
+                                  num_conformers=5,
+                                  keep=2,
+                                  random_seed=4),
+                 processes=2)
+
+    for mol in pop:
+        assert mol.optimized
+        assert mol.mol.GetNumConformers() == 2
+        energies = [
+            mol.energy.values[stk.FunctionData('rdkit',
+                                               forcefield='mmff',
+                                               conformer=conf_id)]
+            for conf_id in range(2)
+        ]
+        assert energies[0] <= energies[1]
+        assert np.isclose(energies[0], mol.energy.rdkit('mmff', 0))
+
+
+def test_optimize_conformers_failure(tmp_amine2, monkeypatch):
+    coords = tmp_amine2.mol.GetConformer().GetPositions()
+
+    def check_unchanged():
+        assert tmp_amine2.mol.GetNumConformers() == 1
+        assert np.allclose(tmp_amine2.mol.GetConformer().GetPositions(),
+                           coords)
+
+    def failed_embed(mol, num_conformers, params):
+        mol.RemoveAllConformers()
+        return []
+
+    with monkeypatch.context() as m:
+        m.setattr(rdkit, 'EmbedMultipleConfs', failed_embed)
+        with pytest.raises(RuntimeError, match='embedded'):
+            stk.rdkit_conformers(tmp_amine2, num_conformers=3)
+    check_unchanged()
+
+    # Conformers whose forcefield could not be set up are removed.
+    def partly_failed_mmff(mol, **kwargs):
+        return [(-1, -1.0), (0, 5.0), (-1, -1.0)]
+
+    with monkeypatch.context() as m:
+        m.setattr(rdkit, 'MMFFOptimizeMoleculeConfs', partly_failed_mmff)
+        stk.rdkit_conformers(tmp_amine2, num_conformers=3, keep=3)
+    assert tmp_amine2.mol.GetNumConformers() == 1
+    assert tmp_amine2.energy.values[
+        stk.FunctionData('rdkit', forcefield='mmff', conformer=0)
+    ] == 5.0
+
+    tmp_amine2.set_position_from_matrix(coords.T)
+
+    def failed_mmff(mol, **kwargs):
+        return [(-1, -1.0)]*mol.GetNumConformers()
+
+    with monkeypatch.context() as m:
+        m.setattr(rdkit, 'MMFFOptimizeMoleculeConfs', failed_mmff)
+        with pytest.raises(RuntimeError, match='forcefield'):
+            stk.rdkit_conformers(tmp_amine2, num_conformers=3)
+    check_unchanged()
@@ -137,3 +137,23 @@ def test_untag_atoms(tmp_amine2):
     assert any(a.HasProp('fg') for a in tmp_amine2.mol.GetAtoms())
     tmp_amine2.untag_atoms()
     assert all(not a.HasProp('fg') for a in tmp_amine2.mol.GetAtoms())
+
+
+def test_fingerprint(amine2, aldehyde2, aldehyde3):
+    assert amine2.fingerprint() is amine2.fingerprint()
+
+    mols = [aldehyde3.mol, amine2.mol, aldehyde2.mol]
+    similar = amine2.similar_molecules(mols)
+    assert similar[0] == (1.0, amine2.mol)
+    assert [mol for _, mol in similar[1:]] == [aldehyde2.mol,
+                                               aldehyde3.mol]
+
+    fps = [bb.fingerprint() for bb in (amine2, aldehyde2, aldehyde3)]
+    matrix = stk.similarity_matrix(fps)
+    assert np.allclose(matrix, matrix.T)
+    assert np.allclose(np.diag(matrix), 1)
+    assert np.allclose(matrix[0], stk.bulk_similarity(fps[0], fps))
+
+    # aldehyde3 is less similar to amine2 than aldehyde2 is.
+    picker = stk.MaxMinPicker(fps)
+    assert [picker.pick() for _ in range(3)] == [0, 2, 1]
@@ -0,0 +1,86 @@
+import os
+from os.path import join
+import shutil
+import getpass
+import tempfile
+import pytest
+import stk
+
+odir = os.path.abspath('workspace_tests_output')
+if not os.path.exists(odir):
+    os.mkdir(odir)
+
+
+def clean_dir(name):
+    """
+    Returns an empty directory in `odir`, removing any old output.
+
+    """
+
+    path = join(odir, name)
+    shutil.rmtree(path, ignore_errors=True)
+    return path
+
+
+def write_job(workspace, name, size, fail=False):
+    with workspace.job(name) as job_dir:
+        with open(join(job_dir, 'output'), 'w') as f:
+            f.write('x'*size)
+        if fail:
+            raise RuntimeError('Job failed.')
+    return job_dir
+
+
+def test_delete():
+    workspace = stk.Workspace(clean_dir('delete'))
+    job_dir = write_job(workspace, 'engine', 100)
+    assert os.path.basename(job_dir).startswith('engine_')
+    assert not os.path.exists(job_dir)
+    assert workspace.jobs == 1
+    assert workspace.total_size == 100
+    assert workspace.usage() == 0
+
+
+def test_keep():
+    workspace = stk.Workspace(clean_dir('keep'), policy='keep')
+    job_dir = write_job(workspace, 'engine', 100)
+    assert os.path.exists(join(job_dir, 'output'))
+    assert os.listdir(workspace.root) == [os.path.basename(job_dir)]
+    assert workspace.usage() == 100
+
+
+def test_archive():
+    workspace = stk.Workspace(clean_dir('archive'), policy='archive')
+    job_dir = write_job(workspace, 'engine', 100)
+    assert not os.path.exists(job_dir)
+    archive = join(workspace.archive_dir,
+                   os.path.basename(job_dir)+'.tar.gz')
+    assert os.path.exists(archive)
+
+
+def test_failed():
+    workspace = stk.Workspace(clean_dir('failed'), keep_failed=True)
+    with pytest.raises(RuntimeError):
+        write_job(workspace, 'engine', 10, True)
+    write_job(workspace, 'engine', 20)
+
+    assert workspace.jobs == 2
+    assert workspace.failed == 1
+    assert workspace.total_size == 30
+    assert workspace.max_size == 20
+    assert len(os.listdir(workspace.root)) == 1
+
+
+def test_default_root(monkeypatch):
+    monkeypatch.delenv('STK_SCRATCH', raising=False)
+    workspace = stk.Workspace()
+    assert os.path.dirname(workspace.root) == tempfile.gettempdir()
+    assert os.path.basename(workspace.root) == f'stk-{getpass.getuser()}'
+
+    monkeypatch.setenv('STK_SCRATCH', join(odir, 'scratch'))
+    assert stk.Workspace().root == join(odir, 'scratch')
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        stk.Workspace(odir, policy='shred')